@@ -0,0 +1,124 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Simulated 30-node ESP-NOW broadcast domain, frames and HMACs per advertise round with one frame
+#          per message against frame aggregation. Run: python -m benchmarks.bench_aggregation
+
+import heapq
+import random
+
+from src.utils.messages import Advertise, EspAggregator, ESP_FRAME_SIZE, iter_espmessages, pack_espmessage
+
+NODES = 30
+DURATION_MS = 120000
+ADVERTISE_MS = 5000
+ADVERTISE_OTHERS_MS = 13000
+CHECK_MS = 1000
+FLUSH_MS = 20
+AIRTIME_MS = 1
+DIGEST_SIZE = 32
+
+
+class SimNode:
+    """Advertise logic of EspNowCore (advertise, on_advertise, check_neighbours) over a simulated air."""
+
+    def __init__(self, sim, idx, aggregate):
+        self.sim = sim
+        self.id = bytes([0x3c, 0x71, 0xbf, 0xe4, 0x8b, idx])
+        self.aggregate = aggregate
+        self.aggregator = EspAggregator(ESP_FRAME_SIZE - DIGEST_SIZE)
+        self.flush_at = None
+        self.neighbours = {}  # {mac: [adv, last_rx, last_tx]}
+
+    def send(self, adv):
+        if not self.aggregate:
+            self.sim.transmit(self, pack_espmessage(adv))
+            return
+        if self.aggregator.add(adv) is None:
+            self.flush()
+            self.aggregator.add(adv)
+        if self.flush_at is None:
+            self.flush_at = self.sim.now + FLUSH_MS
+            self.sim.schedule(self.flush_at, self.flush)
+
+    def flush(self):
+        if self.aggregator.end:
+            self.sim.transmit(self, bytes(self.aggregator.view[:self.aggregator.end]))
+            self.aggregator.clear()
+        self.flush_at = None
+
+    def advertise(self):
+        self.send(Advertise(self.id, 0.0, 0.0, False, 0))
+        self.sim.schedule(self.sim.now + ADVERTISE_MS, self.advertise)
+
+    def on_frame(self, body):
+        for adv in iter_espmessages(body):
+            if adv.id == self.id:
+                continue
+            record = self.neighbours.get(adv.id)
+            if record:
+                adv.ttl = min(record[0].ttl, adv.ttl)
+                record[0], record[1] = adv, self.sim.now
+            else:
+                self.send(Advertise(adv.id, adv.mesh_cntr, adv.rssi, adv.tree_root_elected, adv.ttl + 1))
+                self.neighbours[adv.id] = [adv, self.sim.now, self.sim.now]
+
+    def check_neighbours(self):
+        for record in self.neighbours.values():
+            adv, last_rx, last_tx = record
+            if last_rx - last_tx > ADVERTISE_OTHERS_MS:
+                self.send(Advertise(adv.id, adv.mesh_cntr, adv.rssi, adv.tree_root_elected, adv.ttl + 1))
+                record[2] = self.sim.now
+        self.sim.schedule(self.sim.now + CHECK_MS, self.check_neighbours)
+
+
+class Sim:
+    def __init__(self, aggregate, seed=1):
+        self.now = 0
+        self.events = []
+        self.seq = 0
+        self.frames = []  # (time, messages in frame)
+        rnd = random.Random(seed)
+        self.nodes = [SimNode(self, i, aggregate) for i in range(NODES)]
+        for node in self.nodes:
+            self.schedule(rnd.randrange(ADVERTISE_MS), node.advertise)
+            self.schedule(rnd.randrange(CHECK_MS), node.check_neighbours)
+
+    def schedule(self, at, func, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, func, args))
+
+    def transmit(self, sender, body):
+        self.frames.append((self.now, len(body) // 20))
+        for node in self.nodes:
+            if node is not sender:
+                self.schedule(self.now + AIRTIME_MS, node.on_frame, body)
+
+    def run(self):
+        while self.events and self.events[0][0] < DURATION_MS:
+            self.now, _, func, args = heapq.heappop(self.events)
+            func(*args)
+        return self
+
+
+def per_round(frames, start, end):
+    """Frames and messages per advertise round in time window [start, end)."""
+    window = [m for t, m in frames if start <= t < end]
+    rounds = (end - start) / ADVERTISE_MS
+    return len(window) / rounds, sum(window) / rounds
+
+
+def main():
+    print(f"{NODES} nodes, {DURATION_MS // 1000}s simulated, advertise round {ADVERTISE_MS // 1000}s")
+    # Every frame is signed once by sender and verified by each of the other nodes.
+    print(f"{'mode':<12}{'phase':<12}{'frames/rnd':>12}{'msgs/rnd':>10}{'HMAC sign/rnd':>15}{'verify/rnd':>12}")
+    for name, aggregate in (("per-msg", False), ("aggregated", True)):
+        sim = Sim(aggregate).run()
+        for phase, start, end in (("discovery", 0, ADVERTISE_MS), ("steady", ADVERTISE_MS, DURATION_MS)):
+            frames, msgs = per_round(sim.frames, start, end)
+            print(f"{name:<12}{phase:<12}{frames:>12.1f}{msgs:>10.1f}{frames:>15.1f}{frames * (NODES - 1):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Simulated 50-node multi-hop ESP-NOW mesh, traffic for keeping neighbour databases consistent and
+#          convergence after join and leave with full re-flooding of records against digests.
+#          Run: python -m benchmarks.bench_antientropy
+
+import math
+import random
+
+from benchmarks.bench_trickle import SimNode, FixedNode, Sim, NODES, JOIN_AT_MS, IMIN_MS, DOUBLINGS, K, \
+    TIMEOUT_MS, AIRTIME_MS
+from src.utils.messages import Advertise, NeighbourDigest
+from src.utils.neighbours import NeighbourTable, gen_newer, GEN_MASK
+from src.utils.trickle import Trickle
+
+END_MS = 500000
+STEADY = (90000, JOIN_AT_MS)
+PERIOD_MS = IMIN_MS << DOUBLINGS
+AREA = 100.0
+RANGE = 28.0
+# Digests, as in EspNowCore.
+GEN_MS = 30000
+FAR_TIMEOUT_MS = 90000
+
+
+class DigestNode(SimNode):
+    """advertise, on_advertise and on_digest of EspNowCore."""
+
+    def __init__(self, sim, idx):
+        super().__init__(sim, idx)
+        self.neighbours = NeighbourTable(timeout_ms=TIMEOUT_MS, own=self.id, clock=sim.clock, diff=sim.diff,
+                                         far_timeout_ms=FAR_TIMEOUT_MS)
+        self.trickle = Trickle(IMIN_MS, DOUBLINGS, diff=sim.diff)
+        self.epoch = 0
+        self.gen = sim.rnd.getrandbits(16)
+        self.gen_changed = 0
+
+    def own(self):
+        return Advertise(self.id, 0.0, 0.0, False, 0, self.gen)
+
+    def start(self):
+        self.gen_changed = self.sim.now
+        self.neighbours.update(self.own(), 0, 0)
+        self.trickle.start(self.sim.now)
+        self.wake(self.epoch)
+        self.check()
+
+    def wake(self, epoch):
+        if not self.alive or epoch != self.epoch:
+            return
+        now = self.sim.now
+        if self.trickle.poll(now):
+            if now - self.gen_changed >= GEN_MS:
+                self.gen_changed = now
+                self.gen = (self.gen + 1) & GEN_MASK
+            adv = self.own()
+            self.neighbours.update(adv, 0, 0)
+            self.send(adv)
+            self.send(NeighbourDigest(self.id, self.neighbours.digest()))
+            for slot in self.neighbours.to_forward(K):
+                adv = self.neighbours.fill_advertise(slot, Advertise(b'', 0.0, 0.0, False, 0))
+                adv.ttl += 1
+                self.send(adv)
+        self.sim.schedule(now + self.trickle.wait_ms(now), self.wake, epoch)
+
+    def reset(self):
+        if self.trickle.inconsistent(self.sim.now):
+            self.epoch += 1
+            self.wake(self.epoch)
+
+    def on_expired(self):
+        self.reset()
+
+    def on_message(self, msg):
+        if isinstance(msg, NeighbourDigest):
+            self.on_digest(msg)
+        else:
+            self.on_advertise(msg)
+
+    def on_advertise(self, adv):
+        neighbours = self.neighbours
+        slot = neighbours.slot(adv.id)
+        now = self.sim.now
+        if slot is None:
+            if adv.ttl and neighbours.is_stale(adv.id, adv.gen):
+                return
+            neighbours.update(adv, now, 0)
+            self.reset()
+            return
+        ttl = neighbours.ttl(slot)
+        gen = neighbours.gen(slot)
+        if adv.ttl == 0 or gen_newer(adv.gen, gen) or (adv.gen == gen and adv.ttl < ttl):
+            # Shorter path of the same generation is no sign of life, old record must still expire.
+            rx = now if adv.ttl == 0 or adv.gen != gen else neighbours.last_rx(slot)
+            changed = adv.tree_root_elected != neighbours.root(slot)
+            neighbours.update(adv, rx, neighbours.last_tx(slot))
+            if changed:
+                self.reset()
+        elif adv.gen == gen and adv.ttl == ttl + 1:
+            neighbours.heard_forward(slot)
+        elif gen_newer(gen, adv.gen):  # Neighbour is behind, give it the newer one.
+            neighbours.mark_asked(slot)
+
+    def on_digest(self, digest):
+        neighbours = self.neighbours
+        if digest.id not in neighbours:
+            return
+        for bucket in neighbours.differing_buckets(digest.buckets):
+            neighbours.mark_bucket(bucket)
+
+
+class MeshSim(Sim):
+    """Nodes on random positions in square, frame reaches only nodes within RANGE."""
+
+    def __init__(self, node_class, seed=13, nodes=NODES, area=AREA, churn=True):
+        self.position = self.place(random.Random(seed), nodes, area)
+        super().__init__(node_class, seed, nodes, churn)
+        self.end = END_MS
+        self.lost = 0  # Records of alive nodes expired in steady state.
+        for node in self.nodes:
+            node.neighbours.expire = self.counting(node.neighbours.expire)
+
+    @staticmethod
+    def place(rnd, nodes, area):
+        """Positions of nodes + 1 nodes, mesh stays connected without the first one and with the last one."""
+        while True:
+            position = [(rnd.uniform(0, area), rnd.uniform(0, area)) for _ in range(nodes + 1)]
+            if MeshSim.connected(position, range(nodes)) and MeshSim.connected(position, range(1, nodes + 1)):
+                return position
+
+    @staticmethod
+    def connected(position, members):
+        members = list(members)
+        seen = {members[0]}
+        todo = [members[0]]
+        while todo:
+            a = todo.pop()
+            for b in members:
+                if b not in seen and math.dist(position[a], position[b]) <= RANGE:
+                    seen.add(b)
+                    todo.append(b)
+        return len(seen) == len(members)
+
+    def counting(self, expire):
+        def wrapper():
+            expired = expire()
+            if STEADY[0] <= self.now < STEADY[1]:
+                self.lost += len(expired)
+            return expired
+        return wrapper
+
+    def hops(self):
+        """Longest shortest path in mesh before join."""
+        longest = 0
+        for start in range(self.count):
+            depth = {start: 0}
+            todo = [start]
+            for a in todo:
+                for b in range(self.count):
+                    if b not in depth and math.dist(self.position[a], self.position[b]) <= RANGE:
+                        depth[b] = depth[a] + 1
+                        todo.append(b)
+            longest = max(longest, max(depth.values()))
+        return longest
+
+    def transmit(self, sender, body):
+        self.frames.append((self.now, len(body)))
+        here = self.position[self.nodes.index(sender)]
+        for i, node in enumerate(self.nodes):
+            if node is not sender and node.alive and math.dist(here, self.position[i]) <= RANGE:
+                self.schedule(self.now + AIRTIME_MS, self.deliver, node, body)
+
+
+def main():
+    print(f"{NODES} nodes in {AREA:.0f}x{AREA:.0f} area with range {RANGE:.0f}, "
+          f"steady state {STEADY[0] // 1000}-{STEADY[1] // 1000}s, period {PERIOD_MS // 1000}s")
+    print(f"{'scheme':<9}{'frames/node/period':>20}{'bytes/node/period':>19}{'lost':>6}"
+          f"{'start ms':>10}{'join ms':>10}{'leave ms':>10}")
+    for name, node_class in (("reflood", FixedNode), ("digest", DigestNode)):
+        sim = MeshSim(node_class)
+        converged, joined, left = sim.run()
+        steady = [size for t, size in sim.frames if STEADY[0] <= t < STEADY[1]]
+        periods = NODES * (STEADY[1] - STEADY[0]) / PERIOD_MS
+        print(f"{name:<9}{len(steady) / periods:>20.2f}{sum(steady) / periods:>19.0f}{sim.lost:>6}"
+              f"{str(converged):>10}{str(joined):>10}{str(left if left is not None else 'never'):>10}")
+    print(f"longest path {MeshSim(FixedNode).hops()} hops")
+
+
+if __name__ == "__main__":
+    main()
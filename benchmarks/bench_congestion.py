@@ -0,0 +1,239 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Tree of 3 levels (root, 2 nodes, 4 leaves) where every leaf sends application messages to root at full
+#          rate of its link. Root spends CPU on each received frame before its application gets it, so frames it
+#          has to drop still cost. No control, token buckets of children with AIMD of uplink at each parent only,
+#          and with shares told down the tree (RateControl and UplinkRate), on asyncio loop with simulated clock.
+#          Run: python -m benchmarks.bench_congestion
+
+import asyncio
+import struct
+
+from benchmarks.bench_join import SimLoop
+from benchmarks.bench_sendq import frame, FRAME
+from src.utils.messages import TC_APP
+from src.utils.ratelimit import RateControl
+from src.utils.sendq import SendQueue, QUEUE_LEN, DROP
+
+DURATION_S = 30
+WARMUP_S = 5  # Goodput is measured after this.
+LINK_BPS = 50000  # 250 frames per second on each link.
+RX_MS = 1  # CPU of root per received frame (lwIP, socket, parsing), also for frames dropped afterwards.
+APP_MS = 5  # CPU of root application per message.
+RX_LEN = 16  # Frames received by root waiting for CPU, more are dropped by the stack.
+APP_QUEUE = 32  # Capacity of app_executor.
+SIGNAL_MS = 2  # UplinkRate on downlink to child.
+# As in WifiCore.
+RATE_MS = 200
+RATE_HOLD_MS = 1000
+UPLINK_FPS = 200
+MIN_FPS = 4
+INCREASE_FPS = 5
+MODES = ("no control", "buckets at parents", "buckets + rate down")
+
+
+class SimLink:
+    """StreamWriter stand-in of link with given rate, frames are handed to receiver when they are on air."""
+
+    def __init__(self, loop, bps, receive):
+        self.loop = loop
+        self.bps = bps
+        self.receive = receive
+        self.busy_until = 0.0
+
+    def write(self, data):
+        start = max(self.loop.time(), self.busy_until)
+        for offset in range(0, len(data), FRAME):
+            start += FRAME / self.bps
+            self.loop.call_at(start, self.receive, data[offset:offset + FRAME])
+        self.busy_until = start
+
+    async def drain(self):
+        await asyncio.sleep(max(0.0, self.busy_until - self.loop.time()))
+
+
+class Node:
+    def __init__(self, sim, name, parent=None):
+        self.sim = sim
+        self.name = name
+        self.parent = parent
+        self.children = []
+        loop = sim.loop
+        self.rate = RateControl(name, UPLINK_FPS, MIN_FPS, UPLINK_FPS, INCREASE_FPS, RATE_HOLD_MS,
+                                clock=lambda: int(1000 * loop.time()), diff=lambda a, b: a - b)
+        self.queue = None
+        if parent:
+            parent.children.append(self)
+            self.queue = SendQueue(SimLink(loop, LINK_BPS, parent.receive), QUEUE_LEN, DROP)
+            sim.tasks.append(loop.create_task(self.queue.run()))
+        if sim.mode != MODES[0]:
+            sim.tasks.append(loop.create_task(self.control_rate()))
+
+    def size(self):
+        return 1 + sum(child.size() for child in self.children)
+
+    def police(self, data):
+        """WifiCore.police, key is the child the frame came from."""
+        sim = self.sim
+        child = sim.origins[struct.unpack_from("!I", data)[0]][self.name]
+        return sim.mode == MODES[0] or self.rate.admit(child)
+
+    def receive(self, data):
+        if self.police(data):
+            self.queue.put_nowait(data, TC_APP, self.sim.origins[struct.unpack_from("!I", data)[0]]["leaf"])
+
+    def congested(self):
+        queue = self.queue
+        return len(queue) - len(queue.control) >= queue.capacity // 2
+
+    async def control_rate(self):
+        """WifiCore.control_rate, children are told their share only in the last mode."""
+        rate = self.rate
+        while True:
+            await asyncio.sleep(RATE_MS / 1000)
+            weights = {child.name: child.size() for child in self.children}
+            weights[self.name] = 1
+            rate.set_weights(weights)
+            rate.tick(self.congested())
+            if self.sim.mode == MODES[2]:
+                self.advertise()
+
+    def advertise(self):
+        """WifiCore.advertise_rate."""
+        for child in self.children:
+            limit = self.rate.advertise(child.name)
+            if limit is not None:
+                self.sim.loop.call_later(SIGNAL_MS / 1000, child.on_uplink_rate, limit)
+
+    def on_uplink_rate(self, limit):
+        self.rate.set_limit(limit)
+        self.advertise()
+
+
+class Root(Node):
+    """Received frames wait for CPU, which takes them before messages for application (as lwIP does)."""
+
+    def __init__(self, sim, name):
+        super().__init__(sim, name)
+        self.rx = []
+        self.app = []
+        self.ready = asyncio.Event()
+        self.rx_dropped = self.app_dropped = 0
+        sim.tasks.append(sim.loop.create_task(self.cpu()))
+
+    def receive(self, data):
+        if len(self.rx) >= RX_LEN:
+            self.rx_dropped += 1
+            return
+        self.rx.append(data)
+        self.ready.set()
+
+    def congested(self):
+        return len(self.app) >= APP_QUEUE // 2
+
+    async def cpu(self):
+        sim = self.sim
+        while True:
+            if self.rx:
+                data = self.rx.pop(0)
+                await asyncio.sleep(RX_MS / 1000)
+                if not self.police(data):
+                    continue
+                if len(self.app) >= APP_QUEUE:
+                    self.app_dropped += 1
+                    continue
+                self.app.append(data)
+            elif self.app:
+                data = self.app.pop(0)
+                await asyncio.sleep(APP_MS / 1000)
+                sim.processed(data)
+            else:
+                self.ready.clear()
+                await self.ready.wait()
+
+
+class Leaf(Node):
+    async def source(self):
+        """Send at full rate of the link, with control only what own bucket lets through."""
+        sim = self.sim
+        path = {}
+        node = self
+        while node.parent:
+            path[node.parent.name] = node.name
+            node = node.parent
+        path["leaf"] = self.name
+        while True:
+            await asyncio.sleep(FRAME / LINK_BPS)
+            sim.offered[self.name] += 1
+            if sim.mode == MODES[0] or self.rate.admit(self.name):
+                number = len(sim.origins)
+                sim.origins.append(path)
+                sim.sent[number] = sim.loop.time()
+                self.queue.put_nowait(frame(number), TC_APP, self.name)
+
+    def receive(self, data):
+        pass
+
+
+class Sim:
+    def __init__(self, mode):
+        self.mode = mode
+        self.loop = SimLoop()
+        self.tasks = []
+        self.origins = []  # [{parent: child towards the leaf, "leaf": leaf}] by frame number.
+        self.sent = {}
+        self.offered = {}
+        self.goodput = {}
+        self.latency = []
+        self.root = Root(self, "root")
+        self.leaves = []
+        for i in range(2):
+            node = Node(self, f"node {i}", self.root)
+            for j in range(2):
+                leaf = Leaf(self, f"leaf {2 * i + j}", node)
+                self.leaves.append(leaf)
+                self.offered[leaf.name] = self.goodput[leaf.name] = 0
+
+    def processed(self, data):
+        number = struct.unpack_from("!I", data)[0]
+        now = self.loop.time()
+        if now >= WARMUP_S:
+            self.goodput[self.origins[number]["leaf"]] += 1
+            self.latency.append(1000 * (now - self.sent[number]))
+
+    def run(self):
+        loop = self.loop
+        self.tasks.extend(loop.create_task(leaf.source()) for leaf in self.leaves)
+        loop.run_until_complete(asyncio.sleep(DURATION_S))
+        for task in self.tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*self.tasks, return_exceptions=True))
+        loop.close()
+        return self
+
+
+def main():
+    capacity = 1000 / (RX_MS + APP_MS)
+    print(f"Root, 2 nodes, 4 leaves each sending {LINK_BPS // FRAME} frames/s on links of {LINK_BPS} B/s, root "
+          f"CPU {RX_MS} ms per received frame and {APP_MS} ms per message, so at most {capacity:.0f} messages/s. "
+          f"Goodput at root application after {WARMUP_S} s of {DURATION_S} s.")
+    print(f"{'control':<22}{'goodput/s':>10}{'of max':>8}{'fairness':>10}{'p50 ms':>8}{'p99 ms':>8}"
+          f"{'node drops':>11}{'root drops':>11}")
+    measured = DURATION_S - WARMUP_S
+    for mode in MODES:
+        sim = Sim(mode).run()
+        rates = [sim.goodput[leaf.name] / measured for leaf in sim.leaves]
+        goodput = sum(rates)
+        fairness = goodput ** 2 / (len(rates) * sum(r * r for r in rates)) if goodput else 0  # Jain's index.
+        latency = sorted(sim.latency)
+        node_drops = sum(node.queue.dropped for node in sim.root.children)
+        root_drops = sim.root.rx_dropped + sim.root.app_dropped + sim.root.rate.dropped
+        print(f"{mode:<22}{goodput:>10.0f}{goodput / capacity:>8.0%}{fairness:>10.2f}"
+              f"{latency[len(latency) // 2]:>8.0f}{latency[int(0.99 * (len(latency) - 1))]:>8.0f}"
+              f"{node_drops:>11}{root_drops:>11}")
+
+
+if __name__ == "__main__":
+    main()
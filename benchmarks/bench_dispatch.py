@@ -0,0 +1,112 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Processing of 1k msg/s on one connection, task per message (former on_message) against Dispatcher of the
+#          connection with Executor for application messages. Latency from arrival until processed and peak
+#          number of tasks, for application which is fast and which is slower than the load, on asyncio loop with
+#          simulated clock.
+#          Run: python -m benchmarks.bench_dispatch
+
+import asyncio
+import random
+import statistics
+
+from benchmarks.bench_join import SimLoop
+from src.utils.dispatch import Dispatcher, Executor
+
+RATE = 1000  # Messages per second, Poisson arrivals.
+DURATION_S = 3
+CONTROL = 0.1  # Share of topology messages, the rest is AppMessage.
+CONTROL_CPU_MS = 0.3  # Decode and apply change of topology.
+FORWARD_MS = (0.0, 2.0)  # Control message sent on (send_msg) before the next one is applied.
+APP_CPU_MS = 0.2
+APP_IO_MS = {"fast app": (0.5, 3.0), "slow app": (5.0, 50.0)}  # Application waits for its peripherals.
+SEED = 1
+
+
+class Load:
+    def __init__(self, dispatched, app_io_ms):
+        self.dispatched = dispatched
+        self.app_io_ms = app_io_ms
+        self.rnd = random.Random(SEED)
+        self.loop = SimLoop()
+        self.latency = {True: [], False: []}
+        self.peak = 0
+        self.dropped = 0
+        self.tasks = []
+
+    def cpu(self, ms):
+        """Processing without await holds the loop, simulated clock moves on."""
+        self.loop.clock[0] += ms / 1000
+
+    def done(self, control, arrived):
+        self.latency[control].append(1000 * (self.loop.time() - arrived))
+
+    async def app(self, arrived):
+        await asyncio.sleep(self.rnd.uniform(*self.app_io_ms) / 1000)
+        self.cpu(APP_CPU_MS)
+        self.done(False, arrived)
+
+    async def process_message(self, number, control, arrived):
+        if control:
+            self.cpu(CONTROL_CPU_MS)
+            await asyncio.sleep(self.rnd.uniform(*FORWARD_MS) / 1000)
+            self.done(True, arrived)
+        elif self.dispatched:
+            if not self.executor.submit(self.app, arrived):
+                self.dropped += 1
+        else:
+            self.task(self.app(arrived))  # AppMessage.process created task.
+
+    def task(self, coro):
+        self.tasks.append(self.loop.create_task(coro))
+
+    async def receive(self):
+        """on_message of one connection."""
+        loop = self.loop
+        if self.dispatched:
+            self.executor = Executor()
+            self.executor.start(loop)
+            dispatcher = Dispatcher(self.process_message).start(loop)
+        arrival = 0.0
+        for number in range(RATE * DURATION_S):
+            arrival += self.rnd.expovariate(RATE)
+            await asyncio.sleep(max(0.0, arrival - loop.time()))
+            control = self.rnd.random() < CONTROL
+            if self.dispatched:
+                await dispatcher.put(number, control, arrival)
+            else:
+                self.task(self.process_message(number, control, arrival))
+            self.peak = max(self.peak, len(asyncio.all_tasks(loop)))
+        await asyncio.sleep(1)
+
+    def run(self):
+        self.loop.run_until_complete(self.receive())
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        return self.latency, self.peak, self.dropped
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[int(p * (len(samples) - 1))]
+
+
+def main():
+    print(f"{RATE} msg/s for {DURATION_S} s on one connection, {CONTROL:.0%} control, latency from arrival until "
+          f"processed in ms")
+    print(f"{'app':<10}{'processing':<24}{'ctrl p50':>10}{'ctrl p99':>10}{'app p50':>10}{'app p99':>10}"
+          f"{'peak tasks':>12}{'app dropped':>13}")
+    for app, app_io_ms in APP_IO_MS.items():
+        for dispatched, name in ((False, "task per message"), (True, "Dispatcher + Executor")):
+            latency, peak, dropped = Load(dispatched, app_io_ms).run()
+            print(f"{app:<10}{name:<24}{statistics.median(latency[True]):>10.2f}"
+                  f"{percentile(latency[True], 0.99):>10.2f}{statistics.median(latency[False]):>10.2f}"
+                  f"{percentile(latency[False], 0.99):>10.2f}{peak:>12}{dropped:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Simulated multi-hop ESP-NOW mesh of 5 to 100 nodes, time until all nodes agree on root with election
+#          and with the former 29 s of quiet neighbour database, and time to elect again after root dies.
+#          Run: python -m benchmarks.bench_election
+
+import heapq
+import math
+
+from benchmarks.bench_antientropy import DigestNode, MeshSim, AREA, RANGE
+from benchmarks.bench_trickle import NODES
+from src.utils.election import Election
+from src.utils.messages import Advertise, RootElected
+
+SIZES = (5, 10, 25, 50, 100)
+KILL_AT_MS = 150000
+END_MS = 220000
+CHECK_MS = 50
+# As in EspNowCore.
+HOLD_MS = 8000
+POLL_MS = 1000
+QUIET_MS = 29000  # NEIGHBOURS_NOT_CHANGED_FOR_MS of the former election.
+
+
+def link_rssi(distance):
+    """Log-distance path loss, about -80 dBm at the edge of range."""
+    return -40 - 27 * math.log10(max(distance, 1.0))
+
+
+class ElectionNode(DigestNode):
+    """check_neighbours, check_root_election and on_root_elected of EspNowCore."""
+
+    def __init__(self, sim, idx):
+        super().__init__(sim, idx)
+        self.election = Election(self.id, HOLD_MS, diff=sim.diff)
+        self.cntr = 0.0
+        self.declared = 0
+
+    def own(self):
+        return Advertise(self.id, self.cntr, 0.0, False, 0, self.gen)
+
+    def start(self):
+        super().start()
+        self.poll()
+
+    def poll(self):
+        if not self.alive:
+            return
+        if self.election.poll(self.neighbours, self.sim.now):
+            self.declare()
+        self.sim.schedule(self.sim.now + POLL_MS, self.poll)
+
+    def declare(self):
+        self.declared += 1
+        term = self.election.declare(self.cntr, 0.0)
+        self.send(RootElected(self.id, self.cntr, 0.0, True, 0, term))
+
+    def check(self):
+        if not self.alive:
+            return
+        expired = self.neighbours.expire()
+        if expired:
+            self.reset()
+            root = self.election.root
+            term = self.election.term
+            if root in expired and self.election.withdraw(root, term):
+                self.send(RootElected(root, 0.0, 0.0, False, 0, term))
+        self.sim.schedule(self.sim.now + 1000, self.check)
+
+    def on_message(self, msg):
+        if isinstance(msg, RootElected):
+            self.on_root_elected(msg)
+        else:
+            super().on_message(msg)
+
+    def on_root_elected(self, msg):
+        election = self.election
+        if msg.tree_root_elected:
+            if not election.adopt(msg.id, msg.mesh_cntr, msg.rssi, msg.gen):
+                return
+        elif msg.id == self.id:
+            if election.root == self.id and msg.gen == election.term:
+                self.declare()
+            return
+        elif not election.withdraw(msg.id, msg.gen):
+            return
+        msg.ttl += 1
+        self.send(msg)
+
+
+def agreed(nodes):
+    """Root all alive nodes agree on, None when they don't."""
+    roots = {node.election.root for node in nodes if node.alive}
+    if len(roots) == 1:
+        return roots.pop()
+    return None
+
+
+def run(count):
+    area = AREA * math.sqrt(count / NODES)  # Density as in 50 nodes on 100x100.
+    sim = MeshSim(ElectionNode, seed=16, nodes=count, area=area, churn=False)
+    sim.end = END_MS
+    for i, node in enumerate(sim.nodes):
+        node.cntr = sum(1 / math.sqrt(abs(link_rssi(math.dist(sim.position[i], sim.position[j]))))
+                        for j in range(count) if j != i and math.dist(sim.position[i], sim.position[j]) <= RANGE)
+    elected = reelected = root = None
+    last_change = [0] * count
+    sizes = [0] * count
+    checked = 0
+    while sim.events and sim.events[0][0] < sim.end:
+        sim.now, _, func, args = heapq.heappop(sim.events)
+        func(*args)
+        if sim.now < checked + CHECK_MS:
+            continue
+        checked = sim.now
+        if sim.now < KILL_AT_MS:
+            for i, node in enumerate(sim.nodes):
+                if len(node.neighbours) != sizes[i]:
+                    sizes[i] = len(node.neighbours)
+                    last_change[i] = sim.now
+            if elected is None and agreed(sim.nodes) is not None:
+                elected = sim.now
+                root = agreed(sim.nodes)
+        elif root is not None and sim.nodes[root[5]].alive:
+            sim.nodes[root[5]].alive = False  # Root dies.
+        elif reelected is None and agreed(sim.nodes) not in (None, root):
+            reelected = sim.now - KILL_AT_MS
+    declared = sum(node.declared for node in sim.nodes)
+    return sim.hops(), elected, max(last_change) + QUIET_MS, declared, reelected
+
+
+def main():
+    print(f"Nodes boot within 5s in range {RANGE:.0f}, root dies at {KILL_AT_MS // 1000}s, times in ms")
+    print(f"{'nodes':>6}{'hops':>6}{'quiet 29s':>11}{'election':>10}{'declared':>10}{'re-elect':>10}")
+    for count in SIZES:
+        hops, elected, quiet, declared, reelected = run(count)
+        print(f"{count:>6}{hops:>6}{quiet:>11}{str(elected):>10}{declared:>10}"
+              f"{str(reelected if reelected is not None else 'never'):>10}")
+
+
+if __name__ == "__main__":
+    main()
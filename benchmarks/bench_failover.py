@@ -0,0 +1,289 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Outage of subtree when mid-tree node of 20-node mesh dies, reset of orphans (with fast rejoin) against
+#          re-parenting without reboot (WifiCore.reparent), asking around or switching to hot-standby backup parent
+#          (Standby), on asyncio loop with simulated clock. It is a model of WifiCore and EspNowCore timing, not
+#          the code itself, its constants are read from src/wificore.py and src/espnowcore.py.
+#          Run: python -m benchmarks.bench_failover
+
+import asyncio
+import random
+import statistics
+
+from benchmarks.bench_join import SimLoop, wait_until, source_consts, CHILDREN_COUNT, ESPNOW_MS, ASSOC_MS, TCP_MS, \
+    HOP_MS, CLAIM_S, WIFICORE
+from benchmarks.bench_rejoin import REBOOT_MS, AP_LOST_MS, ADVERT_MS, PROPAGATE_S, REJOIN_S
+
+RUNS = 50
+LEVELS = (1, 2, 4, 8, 5)  # 20 nodes.
+RANGE_X = 0.3  # Nodes of neighbouring levels closer than this (of level width) hear each other.
+KILL_AT_S = 1
+END_S = 180
+# Parent of dead node deletes it from topology when its record expires.
+NEIGHBOUR_TIMEOUT_S = source_consts("src/espnowcore.py")["NEIGHBOUR_TIMEOUT_MS"] / 1000
+ASK_S = WIFICORE["ASK_S"]
+REPARENT_S = WIFICORE["REPARENT_S"]
+RESET, REPARENT, BACKUP = "reset", "reparent", "backup"
+
+
+class FailoverNode:
+    """close_connection, reparent and claim_children of WifiCore reduced to their timing."""
+
+    def __init__(self, sim, depth, x, parent):
+        self.sim = sim
+        self.depth = depth
+        self.x = x
+        self.parent = self.saved = parent
+        self.children = []
+        self.neighbours = []
+        self.alive = self.linked = self.listed = self.listening = self.heard = True
+        self.claimed = asyncio.Event()
+        self.claimed_by = None
+        self.claiming = False
+        self.tree_changed = asyncio.Event()
+        self.tasks = []
+        self.restored = None
+
+    def task(self, coro):
+        self.tasks.append(self.sim.loop.create_task(coro))
+
+    def attached(self):
+        node = self
+        while node.parent is not None:
+            if not (node.alive and node.linked and node.parent.alive):
+                return False
+            node = node.parent
+        return node.alive
+
+    def subtree(self):
+        return [self] + [n for child in self.children for n in child.subtree()]
+
+    def free_slots(self):
+        return CHILDREN_COUNT - len(self.children)
+
+    def die(self):
+        self.alive = self.listening = self.claiming = False
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        for child in self.children:
+            self.sim.loop.call_later(self.sim.rnd.uniform(*AP_LOST_MS) / 1000, child.parent_lost, self)
+
+    def parent_lost(self, parent):
+        if not self.alive or self.parent is not parent or not self.linked:
+            return
+        self.linked = False
+        if self.sim.mode != RESET:
+            self.task(self.reparent(parent))
+        else:
+            self.reset()
+
+    # Reset of orphans: machine.reset(), fast rejoin to saved parent, then full join.
+    def reset(self):
+        self.die()
+        if self in self.parent.children:
+            self.parent.children.remove(self)
+        self.children = []
+        self.heard = False
+        self.task(self.boot())
+
+    async def boot(self):
+        loop = self.sim.loop
+        await asyncio.sleep(REBOOT_MS / 1000)
+        self.alive = True
+        loop.call_later(self.sim.rnd.uniform(*ADVERT_MS) / 1000, self.on_heard)
+        saved = self.saved
+        try:
+            await asyncio.wait_for(wait_until(lambda: saved.listening, True), REJOIN_S)
+            await asyncio.wait_for(self.associate(), REJOIN_S)
+            await self.link(saved)
+            return
+        except asyncio.TimeoutError:
+            pass
+        while not self.claimed.is_set():
+            await self.claimed.wait()
+        await self.associate()
+        await self.link(self.claimed_by)
+
+    def on_heard(self):
+        self.heard = self.alive
+
+    def on_send_wifi_creds(self, parent):
+        if self.alive and not self.claimed.is_set():
+            self.claimed_by = parent
+            self.claimed.set()
+
+    async def claim_children(self):
+        while True:
+            if self.listening and self.free_slots() > 0:
+                possible = [node for node in self.neighbours if node.alive and node.heard and not node.listed
+                            and not node.claimed.is_set()]
+                if possible:
+                    child = self.sim.rnd.choice(possible)
+                    self.sim.loop.call_later(ESPNOW_MS / 1000, child.on_send_wifi_creds, self)
+            self.tree_changed.clear()
+            try:
+                await asyncio.wait_for(self.tree_changed.wait(), CLAIM_S)
+            except asyncio.TimeoutError:
+                pass
+
+    # Re-parenting: children, AP and topology are kept, only STA connects to new parent.
+    def candidates(self, dead, tried):
+        lost = dead.subtree()
+        possible = [node for node in self.neighbours if node.alive and node.listening and node not in lost
+                    and node not in tried and node.attached()]
+        return sorted(possible, key=lambda node: (node.depth, -self.sim.rssi(self, node)))
+
+    def backup(self, dead):
+        """Standby kept healthy before the loss, credentials are there and it has a free slot."""
+        for node in self.candidates(dead, []):
+            if node.free_slots() > 0:
+                return node
+        return None
+
+    async def reparent(self, dead):
+        start = self.sim.loop.time()
+        self.parent.children.remove(self)
+        backup = self.backup(dead) if self.sim.mode == BACKUP else None
+        if backup is not None:
+            backup.children.append(self)
+            await self.associate()
+            self.parent = backup
+            await self.link(backup, move=True)
+            return
+        tried = []
+        while self.sim.loop.time() - start < REPARENT_S:
+            candidates = self.candidates(dead, tried)
+            if not candidates:
+                tried = []
+                await asyncio.sleep(ASK_S)
+                continue
+            parent = candidates[0]
+            tried.append(parent)
+            await asyncio.sleep(2 * ESPNOW_MS / 1000)  # AskWifiCreds and SendWifiCreds back.
+            if parent.free_slots() <= 0 or not parent.attached():
+                await asyncio.sleep(ASK_S - 2 * ESPNOW_MS / 1000)  # No claim comes.
+                continue
+            parent.children.append(self)  # Slot is taken by the claim.
+            await self.associate()
+            self.parent = parent
+            await self.link(parent, move=True)
+            return
+        self.parent = dead  # Nobody took it, resets itself.
+        self.reset()
+
+    # Common steps.
+    async def associate(self):
+        loop = self.sim.loop
+        done = loop.time() + self.sim.rnd.uniform(*ASSOC_MS) / 1000
+        await wait_until(lambda: loop.time() >= done, True)
+
+    async def link(self, parent, move=False):
+        await asyncio.sleep(TCP_MS / 1000)
+        if not move:
+            parent.children.append(self)
+        self.parent = self.saved = parent
+        self.linked = True
+        self.depth = parent.depth + 1
+        self.sim.loop.call_later(HOP_MS * 2 * self.depth / 1000, self.topology_with_me)
+
+    def topology_with_me(self):
+        if not self.attached():
+            return
+        self.listed = self.listening = True
+        now = self.sim.loop.time()
+        for node in self.subtree():
+            if node.restored is None and node.attached():
+                node.restored = now
+        if not self.claiming:
+            self.claiming = True
+            self.task(self.claim_children())
+        self.sim.changed()
+
+
+class FailoverSim:
+    def __init__(self, mode, level, seed):
+        self.mode = mode
+        self.rnd = random.Random(seed)
+        self.loop = SimLoop()
+        self.levels = []
+        for depth, count in enumerate(LEVELS):
+            above = self.levels[-1] if self.levels else [None]
+            self.levels.append([FailoverNode(self, depth, (i + 0.5) / count, above[i * len(above) // count])
+                                for i in range(count)])
+        nodes = self.nodes()
+        for node in nodes:
+            if node.parent:
+                node.parent.children.append(node)
+        self._rssi = {}
+        for a in nodes:
+            for b in nodes:
+                close = abs(a.depth - b.depth) <= 1 and abs(a.x - b.x) <= RANGE_X
+                if a is not b and (close or a.parent is b or b.parent is a):
+                    a.neighbours.append(b)
+        self.victim = self.rnd.choice(self.levels[level])
+
+    def nodes(self):
+        return [node for level in self.levels for node in level]
+
+    def rssi(self, a, b):
+        key = (min(id(a), id(b)), max(id(a), id(b)))
+        if key not in self._rssi:
+            self._rssi[key] = self.rnd.uniform(-85, -50)
+        return self._rssi[key]
+
+    def changed(self):
+        for node in self.nodes():
+            if node.listed and node.alive:
+                node.tree_changed.set()
+
+    def delete_victim(self):
+        """Parent of dead node deletes it with its subtree (TOPOLOGY_DEL), nodes in it which are not attached
+        to the new topology by move can be claimed."""
+        for node in self.victim_subtree:
+            if not node.attached():
+                node.listed = False
+        self.changed()
+
+    def run(self):
+        """Outage of each node of subtree of dead node (ms), None for node not back until END_S."""
+        for node in self.nodes():
+            node.claiming = True
+            node.task(node.claim_children())
+        self.victim_subtree = self.victim.subtree()[1:]
+        self.loop.call_later(KILL_AT_S, self.victim.die)
+        self.loop.call_later(KILL_AT_S + NEIGHBOUR_TIMEOUT_S + self.rnd.uniform(0, PROPAGATE_S), self.delete_victim)
+        self.loop.run_until_complete(asyncio.sleep(END_S))
+        tasks = [task for node in self.nodes() for task in node.tasks]
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        return [None if node.restored is None else 1000 * (node.restored - KILL_AT_S) for node in self.victim_subtree]
+
+
+def main():
+    print(f"20-node tree {LEVELS}, one node dies, {RUNS} runs, outage of nodes below it from death until they are "
+          f"in tree again, mean / p95 / max in ms")
+    print(f"{'dies':<9}{'below':>6}{'reset + rejoin':>26}{'reparent':>26}{'backup':>26}{'lost':>6}")
+    for level in (1, 2):
+        row = f"{'level ' + str(level):<9}"
+        lost = 0
+        for mode in (RESET, REPARENT, BACKUP):
+            outages = []
+            for seed in range(RUNS):
+                run = FailoverSim(mode, level, seed).run()
+                lost += run.count(None)
+                outages.extend(outage for outage in run if outage is not None)
+            outages.sort()
+            if mode == RESET:
+                row += f"{len(outages) / RUNS:>6.1f}"
+            row += f"{statistics.mean(outages):>10.0f} /{outages[int(0.95 * (len(outages) - 1))]:>6.0f} /" \
+                   f"{outages[-1]:>6.0f}"
+        print(row + f"{lost:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: CPython benchmark of relayed AppMessage, CPU time of one hop with in-memory reader and writer and
+#          multi-hop latency over a chain of relays on localhost sockets. JSON relay (parse twice), binary relay
+#          decoding whole frame and cut-through relay routing on the header, which is WifiCore.on_message with its
+#          send path taken from source. Run: python -m benchmarks.bench_forwarding
+
+import asyncio
+import json
+import statistics
+import time
+
+from src.utils.messages import AppMessage, WIFI_PACKETS, WIFI_BUF_SIZE, pack_wifimessage, pack_wififrame, \
+    decode_wifimessage, read_wifimessage, decrement_ttl
+from tests.source import Relay
+
+MESSAGES = 500
+ROUNDS = 20000  # Frames for CPU time of one hop.
+SRC = "3c71bfe48b89"
+DST = "3c71bfe48ba1"
+PAYLOAD = {"blink": [10, 20, 30], "text": "x" * 120, "values": list(range(20))}
+
+
+async def relay_json(reader, writer, spawn):
+    """Node as it was with JSON lines: read line, parse for dst, spawn task, parse again, resend."""
+    async def process(res):
+        js = json.loads(res)
+        d = json.loads(res)
+        WIFI_PACKETS[d["flag"]](d["src"], d["dst"], d["msg"])
+        if js["dst"] != SRC:
+            writer.write(res)
+            await writer.drain()
+
+    while True:
+        res = await reader.readline()
+        if not res:
+            return
+        spawn(process(res))
+
+
+async def relay_decode(reader, writer, spawn):
+    """Binary frames, but whole frame is decoded in spawned task before routing."""
+    async def process(res):
+        obj = decode_wifimessage(res)
+        if obj.packet["dst"] != SRC and decrement_ttl(res):
+            writer.write(res)
+            await writer.drain()
+
+    buf = bytearray(WIFI_BUF_SIZE)
+    while True:
+        res = await read_wifimessage(reader, buf)
+        if not res:
+            return
+        spawn(process(bytearray(res)))
+
+
+async def relay_cut_through(reader, writer, spawn):
+    """Binary frames routed on header only and queued straight from the receive buffer."""
+    relay = Relay(writer)
+    await relay.on_message(reader, SRC, relay)
+
+
+async def relay_copy(reader, writer, spawn):
+    """Floor of the in-memory measurement: frame is read and written, no routing at all."""
+    buf = bytearray(WIFI_BUF_SIZE)
+    while True:
+        res = await read_wifimessage(reader, buf)
+        if not res:
+            return
+        writer.write(res)
+        await writer.drain()
+
+
+class MemoryWriter:
+    """StreamWriter stand-in which only tells that frame was written."""
+
+    def __init__(self):
+        self.written = asyncio.Event()
+
+    def write(self, data):
+        self.written.set()
+
+    async def drain(self):
+        pass
+
+
+async def run_in_memory(relay, encode):
+    """Feed ROUNDS frames one by one to relay from memory, return microseconds per relayed frame."""
+    reader = asyncio.StreamReader()
+    writer = MemoryWriter()
+    task = asyncio.ensure_future(relay(reader, writer, asyncio.ensure_future))
+    frame = encode(AppMessage(SRC, DST, PAYLOAD))
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        writer.written.clear()
+        reader.feed_data(frame)
+        await writer.written.wait()
+    elapsed = time.perf_counter() - start
+    reader.feed_eof()
+    await task
+    return elapsed / ROUNDS * 1e6
+
+
+async def run(relay, encode, read, hops):
+    """Send MESSAGES one by one through chain of hops relays, return list of latencies in microseconds."""
+    arrived = asyncio.Event()
+    tasks = set()
+    servers = []
+    closed = []
+    all_closed = asyncio.Event()
+
+    def spawn(coro):
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def sink(reader, writer):
+        buf = bytearray(WIFI_BUF_SIZE)
+        while await read(reader, buf):
+            arrived.set()
+        closed.append(0)
+        if len(closed) == hops + 1:
+            all_closed.set()
+
+    async def listen(handler):
+        server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def relay_to(port):
+        async def node(reader, writer):
+            _, out = await asyncio.open_connection("127.0.0.1", port)
+            await relay(reader, out, spawn)
+            out.close()
+            closed.append(port)
+            if len(closed) == hops + 1:
+                all_closed.set()
+        return node
+
+    port = await listen(sink)
+    for _ in range(hops):
+        port = await listen(relay_to(port))
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    frame = encode(AppMessage(SRC, DST, PAYLOAD))
+    latencies = []
+    for _ in range(MESSAGES):
+        arrived.clear()
+        start = time.perf_counter()
+        writer.write(frame)
+        await writer.drain()
+        await arrived.wait()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    writer.close()
+    await all_closed.wait()  # EOF went through the chain, relays and sink ended.
+    for server in servers:
+        server.close()
+    return latencies
+
+
+def main():
+    variants = [
+        ("JSON", relay_json, lambda obj: '{}\n'.format(pack_wifimessage(obj)).encode(), lambda r, b: r.readline()),
+        ("decode", relay_decode, lambda obj: bytes(pack_wififrame(obj)), read_wifimessage),
+        ("cut-through", relay_cut_through, lambda obj: bytes(pack_wififrame(obj)), read_wifimessage),
+    ]
+    binary = variants[1][2]
+    floor = asyncio.run(run_in_memory(relay_copy, binary))
+    print(f"One hop in memory, {ROUNDS} frames, read and write only {floor:.1f} us per frame")
+    print(f"{'relay':<14}{'us':>8}{'routing us':>12}")
+    for name, relay, encode, _ in variants:
+        cpu = asyncio.run(run_in_memory(relay, encode))
+        print(f"{name:<14}{cpu:>8.1f}{cpu - floor:>12.1f}")
+    print()
+    print(f"{'hops':<6}{'relay':<14}{'p50 us':>10}{'p99 us':>10}{'per hop us':>12}")
+    for hops in (1, 4, 8):
+        for name, relay, encode, read in variants:
+            latencies = sorted(asyncio.run(run(relay, encode, read, hops)))
+            p50 = statistics.median(latencies)
+            p99 = latencies[int(len(latencies) * 0.99)]
+            print(f"{hops:<6}{name:<14}{p50:>10.0f}{p99:>10.0f}{p50 / hops:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
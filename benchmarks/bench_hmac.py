@@ -0,0 +1,54 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: CPython benchmark of frame signing, HMAC per frame against long-lived HMACSigner.
+# Run: python -m benchmarks.bench_hmac
+
+import hashlib
+
+from benchmarks.bench_messages import measure
+from src.utils.hmac import HMACSigner
+
+KEY = b'hellotheregeneralkenobinobodyex\x00\x00'
+FRAME = bytes(range(19))  # Size of packed Advertise.
+
+trans_5C = bytes((x ^ 0x5C) for x in range(256))
+trans_36 = bytes((x ^ 0x36) for x in range(256))
+
+
+def legacy_sign(key, msg):
+    """HMAC(key, msg).digest() as it was done for every frame before, pads rebuilt byte by byte."""
+    outer = hashlib.sha256()
+    inner = hashlib.sha256()
+    key = key + bytes(64 - len(key))
+    outer.update(b''.join([bytes([trans_5C[x]]) for x in key]))
+    inner.update(b''.join([bytes([trans_36[x]]) for x in key]))
+    inner.update(msg)
+    outer.update(inner.digest())
+    return outer.digest()
+
+
+def main():
+    signer = HMACSigner(KEY)
+    no_copy = HMACSigner(KEY)
+    no_copy._inner = no_copy._outer = None  # Path used on MicroPython where hashes can't be copied.
+    buf = bytearray(250)
+    buf[:len(FRAME)] = FRAME
+    signer.sign_into(FRAME, buf, len(FRAME))
+    assert legacy_sign(KEY, FRAME) == signer.digest(FRAME)
+
+    old_us, old_b = measure(lambda: legacy_sign(KEY, FRAME))
+    rows = [
+        ("sign", measure(lambda: signer.sign_into(FRAME, buf, len(FRAME)))),
+        ("sign (no copy)", measure(lambda: no_copy.sign_into(FRAME, buf, len(FRAME)))),
+        ("verify", measure(lambda: signer.verify(FRAME, buf, len(FRAME)))),
+    ]
+    print(f"{'op':<16}{'us/frame':>10}{'B/frame':>10}{'speedup':>10}")
+    print(f"{'legacy HMAC':<16}{old_us:>10.3f}{old_b:>10}{1:>9.2f}x")
+    for name, (us, b) in rows:
+        print(f"{name:<16}{us:>10.3f}{b:>10}{old_us / us:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
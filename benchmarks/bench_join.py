@@ -0,0 +1,209 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Time from boot to being in tree for each level of 4-level tree (root, 2, 4, 8 nodes), join steps of
+#          WifiCore and EspNowCore with polling sleeps against events, on asyncio loop with simulated clock.
+#          It is a model of their timing, not the code itself (it needs MicroPython), its constants are read from
+#          src/wificore.py and src/utils/net.py. Run: python -m benchmarks.bench_join
+
+import ast
+import asyncio
+import random
+import selectors
+import statistics
+from pathlib import Path
+
+from src.utils.net import POLL_FIRST_MS, POLL_MAX_MS
+
+
+def source_consts(path):
+    """{NAME: value} of NAME = const(value) in module, which cannot be imported outside MicroPython."""
+    tree = ast.parse(Path(__file__).parent.parent.joinpath(path).read_text())
+    return {node.targets[0].id: node.value.args[0].value for node in tree.body
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)
+            and getattr(node.value.func, "id", None) == "const"}
+
+
+WIFICORE = source_consts("src/wificore.py")
+RUNS = 50
+LEVELS = (1, 2, 4, 8)
+CHILDREN_COUNT = WIFICORE["CHILDREN_COUNT"]
+BOOT_MS = 1000
+ELECTED_MS = 9000  # Root is elected, see bench_election.
+ESPNOW_MS = 5  # SendWifiCreds on air.
+ASSOC_MS = (1000, 2500)  # Association to AP of parent or router with DHCP.
+TCP_MS = 30  # Socket to parent opened and MAC registered.
+HOP_MS = 10  # TopologyChanged to root and new version back, per hop.
+CLAIM_S = WIFICORE["DEFAULT_S"] + 3  # claim_children.
+# Polling which events replaced, as it was.
+CONNECT_POLL_S = WIFICORE["DEFAULT_S"]  # WifiCore.connect.
+TREE_POLL_S = 1  # in_tree_topology.
+STA_POLL_MS = 100  # Net.sta_wifi.
+
+
+class _Selector(selectors.SelectSelector):
+    """Nothing to select, waiting for timeout moves simulated clock instead."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("simulation has nothing to do")
+        self.clock[0] += timeout
+        return []
+
+
+class SimLoop(asyncio.SelectorEventLoop):
+    """asyncio loop whose time() is simulated, sleeps take no real time."""
+
+    def __init__(self):
+        self.clock = [0.0]
+        super().__init__(_Selector(self.clock))
+
+    def time(self):
+        return self.clock[0]
+
+
+async def wait_until(condition, events):
+    if events:  # Net.wait_until
+        wait = POLL_FIRST_MS
+        while not condition():
+            await asyncio.sleep(wait / 1000)
+            wait = min(2 * wait, POLL_MAX_MS)
+    else:  # Former loop of Net.sta_wifi.
+        while not condition():
+            await asyncio.sleep(STA_POLL_MS / 1000)
+
+
+class JoinNode:
+    """connect, start_parenting_server, in_tree_topology and claim_children of WifiCore, claimed of EspNowCore."""
+
+    def __init__(self, sim, level):
+        self.sim = sim
+        self.level = level
+        self.events = sim.events
+        self.root = False
+        self.sta_ssid = None  # Parent which claimed this node.
+        self.in_topology = False
+        self.in_tree = False
+        self.children = []
+        self.claimed = asyncio.Event()
+        self.topology_ready = asyncio.Event()
+        self.tree_changed = asyncio.Event()
+        self.joined_at = None
+
+    async def run(self):
+        await asyncio.sleep(self.sim.rnd.uniform(0, BOOT_MS) / 1000)
+        await self.connect()
+        await self.start_parenting_server()
+
+    def on_send_wifi_creds(self, parent):
+        if self.in_topology:
+            return
+        self.sta_ssid = parent
+        self.in_topology = True
+        self.claimed.set()
+
+    def became_root(self):
+        self.root = True
+        self.claimed.set()
+
+    def topology_with_me(self):
+        self.in_tree = True
+        self.joined_at = self.sim.loop.time()
+        self.topology_ready.set()
+        for level in self.sim.levels:  # New version of topology reaches everyone in tree.
+            for node in level:
+                if node.in_tree:
+                    node.tree_changed.set()
+
+    async def connect(self):
+        while not (self.sta_ssid or self.root):
+            if self.events:
+                self.claimed.clear()
+                await self.claimed.wait()
+            else:
+                await asyncio.sleep(CONNECT_POLL_S)
+        await self.associate()
+        if self.root:
+            self.topology_with_me()
+        else:
+            await asyncio.sleep(TCP_MS / 1000)
+            self.sta_ssid.children.append(self)
+            loop = self.sim.loop
+            loop.call_later(HOP_MS * 2 * self.level / 1000, self.topology_with_me)
+
+    async def associate(self):
+        loop = self.sim.loop
+        done = loop.time() + self.sim.rnd.uniform(*ASSOC_MS) / 1000
+        await wait_until(lambda: loop.time() >= done, self.events)
+
+    async def start_parenting_server(self):
+        while not self.in_tree:
+            if self.events:
+                self.topology_ready.clear()
+                await self.topology_ready.wait()
+            else:
+                await asyncio.sleep(TREE_POLL_S)
+        await self.claim_children()
+
+    async def claim_children(self):
+        while True:
+            possible = [node for node in self.sim.below(self) if not node.in_tree]
+            if possible and len(self.children) < CHILDREN_COUNT:
+                for _ in range(CHILDREN_COUNT - len(self.children)):
+                    child = self.sim.rnd.choice(possible)
+                    self.sim.loop.call_later(ESPNOW_MS / 1000, child.on_send_wifi_creds, self)
+            if all(node.in_tree for node in self.sim.below(self)):
+                return
+            if self.events:
+                self.tree_changed.clear()
+                try:
+                    await asyncio.wait_for(self.tree_changed.wait(), CLAIM_S)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(CLAIM_S)
+
+
+class JoinSim:
+    def __init__(self, events, seed):
+        self.events = events
+        self.rnd = random.Random(seed)
+        self.loop = SimLoop()
+        self.levels = [[JoinNode(self, level) for _ in range(count)] for level, count in enumerate(LEVELS)]
+
+    def below(self, node):
+        """Nodes of the next level, every one of them hears every node of this level."""
+        if node.level + 1 < len(self.levels):
+            return self.levels[node.level + 1]
+        return []
+
+    def run(self):
+        """Return time when the last node of each level was in tree."""
+        nodes = [node for level in self.levels for node in level]
+        self.loop.call_later(ELECTED_MS / 1000, self.levels[0][0].became_root)
+        tasks = [self.loop.create_task(node.run()) for node in nodes]
+        self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.close()
+        return [max(node.joined_at for node in level) for level in self.levels]
+
+
+def main():
+    print(f"4-level tree {LEVELS}, root elected at {ELECTED_MS // 1000}s, association {ASSOC_MS} ms, "
+          f"{RUNS} runs, mean (p95) in ms")
+    print(f"{'scheme':<9}" + "".join(f"{'level ' + str(level):>16}" for level in range(len(LEVELS))))
+    for name, events in (("polling", False), ("events", True)):
+        times = [JoinSim(events, seed).run() for seed in range(RUNS)]
+        row = f"{name:<9}"
+        for level in range(len(LEVELS)):
+            samples = sorted(1000 * run[level] for run in times)
+            row += f"{statistics.mean(samples):>9.0f} ({samples[int(0.95 * (RUNS - 1))]:>5.0f})"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
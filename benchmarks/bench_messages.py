@@ -0,0 +1,77 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: CPython micro-benchmark of ESP-NOW message packing. Run: python -m benchmarks.bench_messages
+
+import struct
+import time
+import tracemalloc
+
+from src.utils.messages import Advertise, ESP_CODECS, ESP_FRAME_SIZE, Esp_Type, pack_espmessage_into
+
+ROUNDS = 100000
+PATTERN = "!6sffBi"
+LEGACY_FIELDS = ["id", "mesh_cntr", "rssi", "tree_root_elected", "ttl"]  # Sorted __dict__ of the old Advertise.
+
+
+class LegacyAdvertise:
+    """Advertise as it was before with gen added, fields are taken from __dict__ by name."""
+    type = Esp_Type.ADVERTISE
+
+    def __init__(self, iid, cntr, rssi, tree_root_elected, ttl, gen=0):
+        self.id = iid
+        self.mesh_cntr = cntr
+        self.rssi = rssi
+        self.tree_root_elected = tree_root_elected
+        self.ttl = ttl
+        self.gen = gen
+
+
+def legacy_pack(obj):
+    fields = obj.__dict__
+    return struct.pack('B', obj.type) + struct.pack(PATTERN, *[fields[f] for f in LEGACY_FIELDS]) + \
+        struct.pack("!H", obj.gen)  # gen at the end.
+
+
+def legacy_unpack(msg):
+    return LegacyAdvertise(*struct.unpack(PATTERN, msg[1:-2]), *struct.unpack("!H", msg[-2:]))
+
+
+def measure(func, rounds=ROUNDS):
+    """Return (microseconds per call, bytes allocated per call)."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for _ in range(1000):  # Warm up caches so only per call allocations are counted.
+        func()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / rounds * 1e6, peak - before
+
+
+def main():
+    node_id = b'\x3c\x71\xbf\xe4\x8b\x89'
+    legacy = LegacyAdvertise(node_id, 1452.0, -74.2, True, 1, 7)
+    adv = Advertise(node_id, 1452.0, -74.2, True, 1, 7)
+    codec = ESP_CODECS[Esp_Type.ADVERTISE]
+    buf = bytearray(ESP_FRAME_SIZE)
+    packed = legacy_pack(legacy)
+    assert bytes(buf[:pack_espmessage_into(buf, 0, adv)]) == packed
+
+    results = [
+        ("pack", measure(lambda: legacy_pack(legacy)), measure(lambda: pack_espmessage_into(buf, 0, adv))),
+        ("unpack", measure(lambda: legacy_unpack(packed)), measure(lambda: codec.unpack_from(buf, 0))),
+    ]
+    print(f"{'op':<8}{'legacy us':>12}{'codec us':>12}{'speedup':>10}{'legacy B':>10}{'codec B':>10}")
+    for name, (old_us, old_b), (new_us, new_b) in results:
+        print(f"{name:<8}{old_us:>12.3f}{new_us:>12.3f}{old_us / new_us:>9.2f}x{old_b:>10}{new_b:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Heap used by database of 50 neighbours and allocation per advertisement,
+#          dict of lists against NeighbourTable. Run: python -m benchmarks.bench_neighbours
+
+import tracemalloc
+
+from benchmarks.bench_messages import measure
+from src.utils.messages import Advertise
+from src.utils.neighbours import NeighbourTable
+
+NEIGHBOURS = 50
+
+
+def legacy_save(neighbours, adv, last_rx, last_tx):
+    """Record as it was saved before, values of sorted fields and two timestamps."""
+    neighbours[adv.id] = [adv.id, adv.mesh_cntr, adv.rssi, adv.tree_root_elected, adv.ttl, last_rx, last_tx]
+
+
+def table_save(neighbours, adv, last_rx, last_tx):
+    neighbours.update(adv, last_rx, last_tx)
+
+
+def advertisements():
+    return [Advertise(bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i]), 1.0 + i / 7, -40.0 - i, False, i % 3)
+            for i in range(NEIGHBOURS)]
+
+
+def heap(factory, save, advs):
+    """Bytes held by database with all neighbours, Advertise objects themselves are not counted."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    neighbours = factory()
+    for t, adv in enumerate(advs):
+        save(neighbours, adv, 1000000 + t * 1000, 1000000 + t * 1000)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return neighbours, after - before
+
+
+def main():
+    advs = advertisements()
+    print(f"{NEIGHBOURS} neighbours")
+    print(f"{'database':<16}{'heap B':>10}{'B/neighbour':>13}{'us/adv':>10}{'B/adv':>8}")
+    for name, factory, save in (("dict of lists", dict, legacy_save), ("NeighbourTable", NeighbourTable, table_save)):
+        neighbours, used = heap(factory, save, advs)
+        adv = advs[7]
+        us, allocated = measure(lambda: save(neighbours, adv, 1234567, 1234000))
+        print(f"{name:<16}{used:>10}{used / NEIGHBOURS:>13.1f}{us:>10.2f}{allocated:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Time from reset of node in formed 4-level tree (root, 2, 4, 8 nodes) until it and its subtree are in tree
+#          again, full join (wait to be claimed) against fast rejoin to saved parent (RejoinStore), on asyncio loop
+#          with simulated clock. It is a model of WifiCore timing, not the code itself, its constants are read from
+#          src/wificore.py. Run: python -m benchmarks.bench_rejoin
+
+import asyncio
+import random
+import statistics
+
+from benchmarks.bench_join import SimLoop, wait_until, LEVELS, CHILDREN_COUNT, ESPNOW_MS, ASSOC_MS, TCP_MS, HOP_MS, \
+    CLAIM_S, WIFICORE
+
+RUNS = 50
+RESET_AT_S = 1
+END_S = 120
+REBOOT_MS = 3000  # machine.reset() until WLAN and ESP-NOW are up again.
+AP_LOST_MS = (3000, 6000)  # Child notices AP of parent is gone (beacon timeout), socket fails and it resets too.
+ADVERT_MS = (500, 1000)  # First Trickle advertisement after boot, then parent hears the node.
+PROPAGATE_S = WIFICORE["DEFAULT_S"]  # topology_propagate, write to socket of child which was reset gets RST then.
+REJOIN_S = WIFICORE["REJOIN_S"]
+
+
+class RejoinNode:
+    """connect, rejoin, claim_children and close_connection of WifiCore reduced to their timing."""
+
+    def __init__(self, sim, level, parent):
+        self.sim = sim
+        self.level = level
+        self.parent = parent  # Saved parent, also the only node in range which claims this one.
+        self.below = []
+        self.stale = set()  # Children reset meanwhile, parent keeps them until their socket gets RST.
+        self.alive = self.in_tree = self.heard = self.listening = True
+        self.linked = True  # Socket to parent is the one parent knows about.
+        self.epoch = 0  # Increased on reset, children linked to older epoch lose AP.
+        self.parent_epoch = 0
+        self.claimed = asyncio.Event()
+        self.tree_changed = asyncio.Event()
+        self.phase = sim.rnd.uniform(0, PROPAGATE_S)  # Of topology_propagate to children.
+        self.tasks = []
+        self.joined_at = None
+
+    def task(self, coro):
+        self.tasks.append(self.sim.loop.create_task(coro))
+
+    def reset(self):
+        loop = self.sim.loop
+        self.alive = self.in_tree = self.heard = self.listening = self.linked = False
+        self.epoch += 1
+        self.claimed.clear()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.stale.clear()
+        if self.parent and self.parent.alive:
+            self.parent.stale.add(self)
+        for child in self.below:
+            if child.linked and child.parent_epoch == self.epoch - 1:
+                loop.call_later(self.sim.rnd.uniform(*AP_LOST_MS) / 1000, child.ap_lost, self.epoch - 1)
+        self.task(self.boot())
+
+    def ap_lost(self, epoch):
+        if self.alive and self.linked and self.parent_epoch == epoch:
+            self.reset()
+
+    async def boot(self):
+        loop = self.sim.loop
+        await asyncio.sleep(REBOOT_MS / 1000)
+        self.alive = True
+        loop.call_later(self.sim.rnd.uniform(*ADVERT_MS) / 1000, self.on_heard)
+        parent = self.parent
+        if self in parent.stale:
+            loop.call_at(parent.next_propagate(), parent.child_reset, self)
+        if self.sim.fast and await self.rejoin():
+            return
+        while not self.claimed.is_set():  # Full join.
+            await self.claimed.wait()
+        await self.associate()
+        await self.link()
+
+    async def rejoin(self):
+        parent = self.parent
+        try:
+            await asyncio.wait_for(wait_until(lambda: parent.listening, True), REJOIN_S)
+            await asyncio.wait_for(self.associate(), REJOIN_S)
+        except asyncio.TimeoutError:
+            return False
+        await self.link()
+        return True
+
+    async def associate(self):
+        loop = self.sim.loop
+        done = loop.time() + self.sim.rnd.uniform(*ASSOC_MS) / 1000
+        await wait_until(lambda: loop.time() >= done, True)
+
+    async def link(self):
+        await asyncio.sleep(TCP_MS / 1000)
+        self.linked = True
+        self.parent.stale.discard(self)  # Connected again before parent noticed.
+        self.parent_epoch = self.parent.epoch
+        self.sim.loop.call_later(HOP_MS * 2 * self.level / 1000, self.topology_with_me)
+
+    def on_heard(self):
+        self.heard = self.alive
+
+    def next_propagate(self):
+        now = self.sim.loop.time()
+        return now + (self.phase - now) % PROPAGATE_S
+
+    def child_reset(self, child):
+        """Socket of the old connection got RST, child is deleted from topology unless it connected again."""
+        if self.alive and child in self.stale:
+            self.stale.discard(child)
+            self.sim.changed()  # TOPOLOGY_DEL
+
+    def topology_with_me(self):
+        if not self.alive or not self.parent.in_tree:
+            return
+        self.in_tree = True
+        self.joined_at = self.sim.loop.time()
+        self.task(self.claim_children())
+        self.listening = True  # AP and server of start_parenting_server.
+        self.sim.changed()
+
+    def on_send_wifi_creds(self):
+        if self.alive:
+            self.claimed.set()
+
+    async def claim_children(self):
+        while True:
+            children = [node for node in self.below if node.in_tree or node.claimed.is_set() or node in self.stale]
+            possible = [node for node in self.below if node.alive and node.heard and node not in children]
+            if possible and len(children) < CHILDREN_COUNT:
+                for _ in range(CHILDREN_COUNT - len(children)):
+                    child = self.sim.rnd.choice(possible)
+                    self.sim.loop.call_later(ESPNOW_MS / 1000, child.on_send_wifi_creds)
+            self.tree_changed.clear()
+            try:
+                await asyncio.wait_for(self.tree_changed.wait(), CLAIM_S)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RejoinSim:
+    def __init__(self, fast, level, seed):
+        self.fast = fast
+        self.rnd = random.Random(seed)
+        self.loop = SimLoop()
+        self.levels = []
+        for depth, count in enumerate(LEVELS):
+            above = self.levels[-1] if self.levels else [None]
+            self.levels.append([RejoinNode(self, depth, above[i * len(above) // count]) for i in range(count)])
+        for node in self.nodes():
+            if node.parent:
+                node.parent.below.append(node)
+        self.target = self.rnd.choice(self.levels[level])
+
+    def nodes(self):
+        return [node for level in self.levels for node in level]
+
+    def changed(self):
+        """New version of topology reaches everyone in tree, claim_children is woken up."""
+        for node in self.nodes():
+            if node.in_tree:
+                node.tree_changed.set()
+
+    def subtree(self, node):
+        return [node] + [n for child in node.below for n in self.subtree(child)]
+
+    def run(self):
+        """Return time from reset until the node and its subtree are in tree, None when they are not until END_S."""
+        for node in self.nodes():
+            node.task(node.claim_children())
+        self.loop.call_later(RESET_AT_S, self.target.reset)
+        self.loop.run_until_complete(asyncio.sleep(END_S))
+        tasks = [task for node in self.nodes() for task in node.tasks]
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        subtree = self.subtree(self.target)
+        if not all(node.in_tree for node in subtree):
+            return None
+        return 1000 * (max(node.joined_at for node in subtree) - RESET_AT_S)
+
+
+def main():
+    print(f"4-level tree {LEVELS}, reboot {REBOOT_MS} ms, association {ASSOC_MS} ms, {RUNS} runs, "
+          f"time from reset until subtree is in tree again, mean (p95) in ms")
+    print(f"{'reset':<14}{'subtree':>8}{'full join':>18}{'fast rejoin':>18}")
+    for level in range(1, len(LEVELS)):
+        row = f"{'level ' + str(level):<14}{2 ** (len(LEVELS) - level) - 1:>8}"
+        for fast in (False, True):
+            samples = sorted(RejoinSim(fast, level, seed).run() for seed in range(RUNS))
+            row += f"{statistics.mean(samples):>11.0f} ({samples[int(0.95 * (RUNS - 1))]:>5.0f})"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
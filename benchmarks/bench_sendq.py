@@ -0,0 +1,113 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Fan-out of broadcasts to children over throttled socket stand-ins, one child link is slow. Former
+#          send_to_nodes (task per message, write and drain to each child in turn) against SendQueue per link,
+#          on asyncio loop with simulated clock. Run: python -m benchmarks.bench_sendq
+
+import asyncio
+import statistics
+import struct
+
+from benchmarks.bench_join import SimLoop
+from src.utils.sendq import SendQueue, QUEUE_LEN, DROP
+
+MESSAGES = 500
+INTERVAL_MS = 20  # 50 broadcasts per second.
+FRAME = 200  # Bytes of frame, starts with its number.
+FAST_BPS = 100000  # Bytes per second of healthy link.
+SLOW_BPS = 4000  # Link of child far from AP, slower than offered load.
+LINKS = (FAST_BPS, SLOW_BPS, FAST_BPS, FAST_BPS)
+WRITE_MS = 1  # Cost of one write call (syscall and lwIP), what coalescing saves.
+
+
+class ThrottledWriter:
+    """StreamWriter stand-in of link with given rate, drain returns when everything written is on air."""
+
+    def __init__(self, loop, bps):
+        self.loop = loop
+        self.bps = bps
+        self.busy_until = 0.0
+        self.delivered = {}  # {frame number: time}
+        self.writes = 0
+
+    def write(self, data):
+        now = self.loop.time()
+        self.writes += 1
+        start = max(now, self.busy_until) + WRITE_MS / 1000
+        for offset in range(0, len(data), FRAME):
+            start += FRAME / self.bps
+            self.delivered[struct.unpack_from("!I", data, offset)[0]] = start
+        self.busy_until = start
+
+    async def drain(self):
+        await asyncio.sleep(max(0.0, self.busy_until - self.loop.time()))
+
+
+def frame(i):
+    data = bytearray(FRAME)
+    struct.pack_into("!I", data, 0, i)
+    return bytes(data)
+
+
+async def source(loop, fan_out, sent):
+    for i in range(MESSAGES):
+        sent[i] = loop.time()
+        fan_out(frame(i))
+        await asyncio.sleep(INTERVAL_MS / 1000)
+
+
+def simulate(queued):
+    """Return writers and time each frame was sent."""
+    loop = SimLoop()
+    writers = [ThrottledWriter(loop, bps) for bps in LINKS]
+    sent = {}
+    tasks = []
+    peak = [0]
+
+    if queued:
+        queues = [SendQueue(writer, QUEUE_LEN, DROP) for writer in writers]
+        tasks.extend(loop.create_task(queue.run()) for queue in queues)
+
+        def fan_out(data):
+            for queue in queues:
+                queue.put_nowait(data)
+    else:
+        async def send_to_nodes(data):
+            for writer in writers:
+                writer.write(data)
+                await writer.drain()
+
+        def fan_out(data):
+            tasks.append(loop.create_task(send_to_nodes(data)))
+            peak[0] = max(peak[0], sum(not task.done() for task in tasks))
+
+    loop.run_until_complete(source(loop, fan_out, sent))
+    loop.run_until_complete(asyncio.sleep(MESSAGES * FRAME / SLOW_BPS))
+    if queued:
+        peak[0] = len(queues)
+        for queue in queues:
+            queue.close()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+    return writers, sent, peak[0]
+
+
+def main():
+    print(f"{MESSAGES} broadcasts of {FRAME} B every {INTERVAL_MS} ms to children over links of {LINKS} B/s, "
+          f"latency until frame is on air in ms")
+    print(f"{'fan-out':<20}{'fast p50':>10}{'fast p99':>10}{'fast max':>10}{'slow p50':>10}{'slow lost':>11}"
+          f"{'writes':>8}{'tasks':>7}")
+    for queued, name in ((False, "write and drain"), (True, "SendQueue per link")):
+        writers, sent, peak = simulate(queued)
+        fast = sorted(1000 * (t - sent[i]) for w in writers if w.bps == FAST_BPS for i, t in w.delivered.items())
+        slow = sorted(1000 * (t - sent[i]) for w in writers if w.bps == SLOW_BPS for i, t in w.delivered.items())
+        lost = sum(MESSAGES - len(w.delivered) for w in writers if w.bps == SLOW_BPS)
+        print(f"{name:<20}{statistics.median(fast):>10.1f}{fast[int(0.99 * (len(fast) - 1))]:>10.1f}"
+              f"{fast[-1]:>10.1f}{statistics.median(slow):>10.0f}{lost:>11}{sum(w.writes for w in writers):>8}"
+              f"{peak:>7}")
+
+
+if __name__ == "__main__":
+    main()
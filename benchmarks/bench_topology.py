@@ -0,0 +1,118 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Simulated 100-node tree, bytes and CPU of topology upkeep per propagate period.
+#          Full tree to every child each period against versioned beacons with deltas.
+#          Run: python -m benchmarks.bench_topology
+
+import random
+import time
+
+from src.utils import binpack
+from src.utils.messages import WIFI_HEADER_SIZE
+from src.utils.tree import Tree, TreeNode, json_to_tree, TOPOLOGY_ADD, TOPOLOGY_DEL
+
+NODES = 100
+CHILDREN_COUNT = 2
+PERIODS = 10
+
+
+def build(rnd):
+    """Random tree as the mesh forms it, every node has at most CHILDREN_COUNT children."""
+    ids = ["3c71bfe4%04x" % i for i in range(NODES)]
+    root = Tree()
+    root.root = TreeNode(ids[0], None)
+    root.version = 1
+    root.rehash()
+    parent_of = {}
+    free = [ids[0]]
+    for node in ids[1:]:
+        parent = rnd.choice(free)
+        root.change(TOPOLOGY_ADD, node, parent)
+        parent_of[node] = parent
+        free.append(node)
+        if sum(1 for p in parent_of.values() if p == parent) == CHILDREN_COUNT:
+            free.remove(parent)
+    return root, ids, parent_of
+
+
+def edges_top_down(ids, parent_of):
+    depth = {ids[0]: 0}
+    for node in ids[1:]:
+        depth[node] = depth[parent_of[node]] + 1
+    return sorted(((parent_of[n], n) for n in ids[1:]), key=lambda e: depth[e[1]])
+
+
+def full_period(trees, edges):
+    """Old way: every parent sends whole tree to every child, child rebuilds it from scratch."""
+    sent = 0
+    for parent, child in edges:
+        packed = trees[parent].pack()
+        sent += WIFI_HEADER_SIZE + len(binpack.dumps(packed))
+        tree = Tree()
+        json_to_tree(packed, tree, None)
+        trees[child] = tree
+    return sent
+
+
+def versioned_period(trees, known, edges):
+    """Versioned way: update_for() of parent, child applies it and asks again when it can't."""
+    sent = 0
+    for parent, child in edges:
+        update = trees[parent].update_for(known.get(child, 0))
+        known[child] = trees[parent].version
+        sent += WIFI_HEADER_SIZE + len(binpack.dumps(update))
+        if not trees[child].apply_update(update):
+            state = {"v": 0, "h": trees[child].hash}  # Child reports, parent answers with snapshot.
+            update = trees[parent].update_for(0)
+            sent += 2 * WIFI_HEADER_SIZE + len(binpack.dumps(state)) + len(binpack.dumps(update))
+            trees[child].apply_update(update)
+    return sent
+
+
+def churn(root, ids, parent_of, rnd, n):
+    """Leaf leaves and new node joins, applied on root."""
+    leaves = [node for node in ids[1:] if node not in parent_of.values()]
+    leaf = rnd.choice(leaves)
+    root.change(TOPOLOGY_DEL, leaf)
+    ids.remove(leaf)
+    del parent_of[leaf]
+    new = "3c71bfe5%04x" % n
+    parent = rnd.choice([node for node in ids if list(parent_of.values()).count(node) < CHILDREN_COUNT])
+    root.change(TOPOLOGY_ADD, new, parent)
+    ids.append(new)
+    parent_of[new] = parent
+
+
+def run(period_func, churn_every):
+    rnd = random.Random(3)
+    root, ids, parent_of = build(rnd)
+    trees = {node: Tree() for node in ids}
+    trees[ids[0]] = root
+    known = {}
+    period_func(trees, known, edges_top_down(ids, parent_of))  # Initial distribution is not measured.
+    sent = 0
+    start = time.perf_counter()
+    for period in range(PERIODS):
+        if churn_every and period % churn_every == 0:
+            churn(root, ids, parent_of, rnd, period)
+            for node in ids:
+                trees.setdefault(node, Tree())
+        sent += period_func(trees, known, edges_top_down(ids, parent_of))
+    elapsed = time.perf_counter() - start
+    assert all(trees[node].encode() == root.encode() for node in ids)
+    return sent / PERIODS, elapsed / PERIODS * 1e3
+
+
+def main():
+    print(f"{NODES} nodes, bytes and CPU per propagate period (whole mesh)")
+    print(f"{'scheme':<12}{'mesh':<16}{'bytes':>10}{'ms':>10}")
+    for mesh, churn_every in (("stable", 0), ("churn 1/period", 1)):
+        for name, func in (("full", lambda t, k, e: full_period(t, e)), ("versioned", versioned_period)):
+            sent, ms = run(func, churn_every)
+            print(f"{name:<12}{mesh:<16}{sent:>10.0f}{ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Uplink of node saturated by application traffic: one greedy source over capacity of the link, two modest
+#          ones and control messages (beacons, topology changes). One FIFO, control first with FIFO of application
+#          messages, control first with weighted fair queueing of application sources (SendQueue), on asyncio loop
+#          with simulated clock. Run: python -m benchmarks.bench_traffic
+
+import asyncio
+import random
+import statistics
+
+from benchmarks.bench_join import SimLoop
+from benchmarks.bench_sendq import ThrottledWriter, frame, FRAME
+from src.utils.messages import TC_CONTROL, TC_APP
+from src.utils.sendq import SendQueue, QUEUE_LEN, DROP
+
+DURATION_S = 10
+LINK_BPS = 50000  # 250 frames per second.
+SOURCES = {"control": 10, "greedy": 750, "modest 1": 40, "modest 2": 40}  # Frames per second, Poisson.
+MODES = ("one FIFO", "control first", "control first + WFQ")
+SEED = 1
+
+
+def simulate(mode):
+    loop = SimLoop()
+    rnd = random.Random(SEED)
+    writer = ThrottledWriter(loop, LINK_BPS)
+    queue = SendQueue(writer, QUEUE_LEN, DROP)
+    sent = {}  # {frame number: (source, time)}
+    numbers = iter(range(1 << 30))
+
+    async def source(name, rate):
+        t = 0.0
+        while True:
+            t += rnd.expovariate(rate)
+            await asyncio.sleep(max(0.0, t - loop.time()))
+            number = next(numbers)
+            sent[number] = (name, loop.time())
+            if mode == "one FIFO":
+                queue.put_nowait(frame(number), TC_APP, None)
+            elif name == "control":
+                queue.put_nowait(frame(number), TC_CONTROL)
+            else:
+                queue.put_nowait(frame(number), TC_APP, name if mode == MODES[2] else None)
+
+    tasks = [loop.create_task(source(name, rate)) for name, rate in SOURCES.items()]
+    tasks.append(loop.create_task(queue.run()))
+    loop.run_until_complete(asyncio.sleep(DURATION_S))
+    queue.close()
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+    latency = {name: [] for name in SOURCES}
+    for number, delivered in writer.delivered.items():
+        name, at = sent[number]
+        if delivered <= DURATION_S:
+            latency[name].append(1000 * (delivered - at))
+    offered = {name: sum(1 for n, _ in sent.values() if n == name) for name in SOURCES}
+    return latency, offered
+
+
+def main():
+    print(f"Uplink of {LINK_BPS} B/s ({LINK_BPS // FRAME} frames/s of {FRAME} B) for {DURATION_S} s, offered "
+          f"frames/s {SOURCES}, control latency in ms, delivered share of offered frames")
+    names = list(SOURCES)
+    print(f"{'queue':<22}{'ctrl p50':>9}{'ctrl p99':>9}{'ctrl max':>9}" + "".join(f"{name:>10}" for name in names)
+          + f"{'modest p99':>12}")
+    for mode in MODES:
+        latency, offered = simulate(mode)
+        control = sorted(latency["control"])
+        modest = sorted(latency["modest 1"] + latency["modest 2"])
+        print(f"{mode:<22}{statistics.median(control):>9.0f}{control[int(0.99 * (len(control) - 1))]:>9.0f}"
+              f"{control[-1]:>9.0f}" + "".join(f"{len(latency[name]) / offered[name]:>10.0%}" for name in names)
+              + f"{modest[int(0.99 * (len(modest) - 1))]:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
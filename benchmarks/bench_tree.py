@@ -0,0 +1,108 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Lookup, insert, delete and level of node in 1k and 10k node trees,
+#          recursive search against the id index. Run: python -m benchmarks.bench_tree
+
+import random
+import time
+
+from src.utils.tree import Tree, TreeNode, get_level
+
+SIZES = (1000, 10000)
+CHILDREN_COUNT = 2
+LEGACY_OPS = 50
+OPS = 5000
+
+
+class LegacyTree:
+    """Tree as it was before, every lookup walks the tree from the root."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def search(self, node_id, actual_node=None):
+        if actual_node is None:
+            actual_node = self.root
+        if actual_node is None or actual_node.data == node_id:
+            return actual_node
+        for c in actual_node.children:
+            if self.search(node_id, c):
+                return self.search(node_id, c)
+
+    def del_node(self, node_id):
+        failed_node = self.search(node_id)
+        failed_node.parent.children.remove(failed_node)
+
+
+def legacy_level(node):
+    i = 0
+    while node.parent:
+        i += 1
+        node = node.parent
+    return i
+
+
+def build(size):
+    """Mesh joined level by level, every node has CHILDREN_COUNT children."""
+    ids = ["3c71bfe4%04x" % i for i in range(size)]
+    tree = Tree()
+    tree.root = TreeNode(ids[0], None)
+    legacy = LegacyTree(TreeNode(ids[0], None))
+    legacy_nodes = [legacy.root]
+    for i in range(1, size):
+        parent_id = ids[(i - 1) // CHILDREN_COUNT]
+        tree.add_node(ids[i], parent_id)
+        parent = legacy_nodes[(i - 1) // CHILDREN_COUNT]
+        node = TreeNode(ids[i], parent)
+        parent.children.append(node)
+        legacy_nodes.append(node)
+    return tree, legacy, ids
+
+
+def per_op(func, args):
+    start = time.perf_counter()
+    for a in args:
+        func(a)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def run(size, rnd):
+    tree, legacy, ids = build(size)
+    leaves = ids[size // 2:]
+    legacy_ids = [rnd.choice(leaves) for _ in range(LEGACY_OPS)]
+    new_ids = [rnd.choice(leaves) for _ in range(OPS)]
+    results = [
+        ("lookup", per_op(legacy.search, legacy_ids), per_op(tree.search, new_ids)),
+        ("level", per_op(lambda n: legacy_level(legacy.search(n)), legacy_ids),
+         per_op(lambda n: get_level(tree.search(n)), new_ids)),
+    ]
+
+    def legacy_insert(parent_id):
+        parent = legacy.search(parent_id)
+        parent.children.append(TreeNode(parent_id + "x", parent))
+
+    def insert(parent_id):
+        tree.add_node(parent_id + "x", parent_id)
+
+    unique = list(dict.fromkeys(new_ids))
+    legacy_unique = list(dict.fromkeys(legacy_ids))
+    results.append(("insert", per_op(legacy_insert, legacy_unique), per_op(insert, unique)))
+    results.append(("delete", per_op(lambda n: legacy.del_node(n + "x"), legacy_unique),
+                    per_op(lambda n: tree.remove_node(n + "x"), unique)))
+    assert len(tree) == size
+    return results
+
+
+def main():
+    rnd = random.Random(8)
+    print("Per operation on tree with CHILDREN_COUNT %d, microseconds" % CHILDREN_COUNT)
+    print("%-7s %-8s %12s %12s %9s" % ("nodes", "op", "recursive", "index", "speedup"))
+    for size in SIZES:
+        for op, legacy_us, new_us in run(size, rnd):
+            print("%-7d %-8s %12.1f %12.2f %8.0fx" % (size, op, legacy_us, new_us, legacy_us / new_us))
+
+
+if __name__ == "__main__":
+    main()
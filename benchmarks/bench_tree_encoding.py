@@ -0,0 +1,82 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Topology snapshot size and encode/decode time, nested {"node", "child"} dicts (JSON and binpack)
+#          against flat parent-index table of MACs. Run: python -m benchmarks.bench_tree_encoding
+
+import json
+import random
+import time
+
+from src.utils import binpack
+from src.utils.tree import Tree, TreeNode, json_to_tree
+
+SIZES = (10, 30, 100, 300, 1000)
+CHILDREN_COUNT = 2
+
+
+def build(size, rnd):
+    ids = ["3c71bfe4%04x" % i for i in range(size)]
+    rnd.shuffle(ids)
+    tree = Tree()
+    tree.root = TreeNode(ids[0], None)
+    tree.rehash()
+    free = [ids[0]]
+    for node in ids[1:]:
+        parent = tree.search(rnd.choice(free))
+        tree.add_node(node, parent.data)
+        free.append(node)
+        if len(parent.children) == CHILDREN_COUNT:
+            free.remove(parent.data)
+    return tree
+
+
+def per_call(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def nested_json_decode(data):
+    tree = Tree()
+    json_to_tree(json.loads(data), tree, None)
+    return tree
+
+
+def nested_binpack_decode(data):
+    tree = Tree()
+    json_to_tree(binpack.loads(data), tree, None)
+    return tree
+
+
+def flat_decode(data):
+    tree = Tree()
+    tree.decode(data)
+    return tree
+
+
+def main():
+    rnd = random.Random(10)
+    print("Topology snapshot, size in bytes and microseconds per encode / decode")
+    print("%-6s %-15s %8s %10s %10s" % ("nodes", "format", "bytes", "encode", "decode"))
+    for size in SIZES:
+        tree = build(size, rnd)
+        rounds = max(20, 20000 // size)
+        formats = (
+            ("nested JSON", lambda: json.dumps(tree.pack()), nested_json_decode),
+            ("nested binpack", lambda: binpack.dumps(tree.pack()), nested_binpack_decode),
+            ("flat", tree.encode, flat_decode),
+        )
+        for name, encode, decode in formats:
+            data = encode()
+            decoded = decode(data)
+            decoded.rehash()
+            assert decoded.hash == tree.hash
+            print("%-6d %-15s %8d %10.1f %10.1f" % (size, name, len(data), per_call(encode, rounds),
+                                                    per_call(lambda: decode(data), rounds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Simulated 50-node ESP-NOW broadcast domain, airtime of advertisements and convergence after start,
+#          join and leave with fixed timers against Trickle. Run: python -m benchmarks.bench_trickle
+
+import heapq
+import random
+
+from src.utils.messages import Advertise, EspAggregator, ESP_FRAME_SIZE, iter_espmessages
+from src.utils.neighbours import NeighbourTable
+from src.utils.trickle import Trickle
+
+NODES = 50
+BOOT_MS = 5000
+JOIN_AT_MS = 150000
+LEAVE_AT_MS = 300000
+END_MS = 400000
+STEADY = (60000, JOIN_AT_MS)
+FLUSH_MS = 20
+AIRTIME_MS = 1
+DIGEST_SIZE = 32
+TIMEOUT_MS = 26000
+CHECK_MS = 1000
+# Fixed timers as they were.
+ADVERTISE_MS = 5000
+ADVERTISE_OTHERS_MS = 13000
+# Trickle, as in EspNowCore.
+IMIN_MS = 1000
+DOUBLINGS = 3
+K = 1
+
+
+class SimNode:
+    """Sending side shared by both schemes, broadcasts are aggregated as in EspNowCore.send_msg."""
+
+    def __init__(self, sim, idx):
+        self.sim = sim
+        self.id = bytes([0x3c, 0x71, 0xbf, 0xe4, 0x8b, idx])
+        self.alive = True
+        self.aggregator = EspAggregator(ESP_FRAME_SIZE - DIGEST_SIZE)
+        self.flush_at = None
+        self.neighbours = NeighbourTable(timeout_ms=TIMEOUT_MS, own=self.id, clock=sim.clock, diff=sim.diff)
+
+    def send(self, adv):
+        if self.aggregator.add(adv) is None:
+            self.flush()
+            self.aggregator.add(adv)
+        if self.flush_at is None:
+            self.flush_at = self.sim.now + FLUSH_MS
+            self.sim.schedule(self.flush_at, self.flush)
+
+    def flush(self):
+        if self.aggregator.end and self.alive:
+            self.sim.transmit(self, bytes(self.aggregator.view[:self.aggregator.end]))
+        self.aggregator.clear()
+        self.flush_at = None
+
+    def check(self):
+        if not self.alive:
+            return
+        if self.neighbours.expire():
+            self.on_expired()
+        self.sim.schedule(self.sim.now + CHECK_MS, self.check)
+
+    def on_expired(self):
+        pass
+
+    def on_message(self, msg):
+        self.on_advertise(msg)
+
+
+class FixedNode(SimNode):
+    """advertise every ADVERTISE_MS, forward on new node and every ADVERTISE_OTHERS_MS while heard."""
+
+    def start(self):
+        self.neighbours.update(Advertise(self.id, 0.0, 0.0, False, 0), 0, 0)
+        self.advertise()
+        self.check()
+
+    def advertise(self):
+        if self.alive:
+            self.send(Advertise(self.id, 0.0, 0.0, False, 0))
+            self.sim.schedule(self.sim.now + ADVERTISE_MS, self.advertise)
+
+    def on_advertise(self, adv):
+        neighbours = self.neighbours
+        slot = neighbours.slot(adv.id)
+        now = self.sim.now
+        if slot is None:
+            adv.ttl += 1
+            self.send(adv)
+            adv.ttl -= 1
+            neighbours.update(adv, now, now)
+            return
+        last_tx = neighbours.last_tx(slot)
+        adv.ttl = min(neighbours.ttl(slot), adv.ttl)
+        neighbours.update(adv, now, last_tx)
+        if now - last_tx > ADVERTISE_OTHERS_MS:
+            adv.ttl += 1
+            self.send(adv)
+            neighbours.set_last_tx(slot, now)
+
+
+class TrickleNode(SimNode):
+    """advertise, trickle_reset, forward_neighbours and on_advertise of EspNowCore."""
+
+    def __init__(self, sim, idx):
+        super().__init__(sim, idx)
+        self.trickle = Trickle(IMIN_MS, DOUBLINGS, diff=sim.diff)
+        self.generation = 0
+
+    def start(self):
+        self.neighbours.update(Advertise(self.id, 0.0, 0.0, False, 0), 0, 0)
+        self.trickle.start(self.sim.now)
+        self.wake(self.generation)
+        self.check()
+
+    def wake(self, generation):
+        if not self.alive or generation != self.generation:
+            return
+        now = self.sim.now
+        if self.trickle.poll(now):
+            self.send(Advertise(self.id, 0.0, 0.0, False, 0))
+            for slot in self.neighbours.to_forward(K):
+                adv = self.neighbours.fill_advertise(slot, Advertise(b'', 0.0, 0.0, False, 0))
+                adv.ttl += 1
+                self.send(adv)
+        self.sim.schedule(now + self.trickle.wait_ms(now), self.wake, generation)
+
+    def reset(self):
+        if self.trickle.inconsistent(self.sim.now):
+            self.generation += 1
+            self.wake(self.generation)
+
+    def on_expired(self):
+        self.reset()
+
+    def on_advertise(self, adv):
+        neighbours = self.neighbours
+        slot = neighbours.slot(adv.id)
+        now = self.sim.now
+        if slot is None:
+            neighbours.update(adv, now, 0)
+            self.reset()
+            return
+        ttl = neighbours.ttl(slot)
+        if adv.ttl <= ttl:
+            changed = adv.ttl < ttl or adv.tree_root_elected != neighbours.root(slot)
+            neighbours.update(adv, now, neighbours.last_tx(slot))
+            if changed:
+                self.reset()
+        elif adv.ttl == ttl + 1:
+            neighbours.heard_forward(slot)
+
+
+class Sim:
+    def __init__(self, node_class, seed=13, nodes=NODES, churn=True):
+        self.now = 0
+        self.events = []
+        self.seq = 0
+        self.frames = []  # (time, bytes on air)
+        self.rnd = random.Random(seed)
+        self.end = END_MS
+        self.count = nodes
+        self.nodes = []
+        for i in range(nodes):
+            self.boot(node_class(self, i), self.rnd.randrange(BOOT_MS))
+        self.left = self.nodes[0]
+        if churn:
+            self.joined = node_class(self, nodes)
+            self.boot(self.joined, JOIN_AT_MS)
+            self.schedule(LEAVE_AT_MS, self.leave)
+
+    def clock(self):
+        return self.now
+
+    @staticmethod
+    def diff(a, b):
+        return a - b
+
+    def boot(self, node, at):
+        self.nodes.append(node)
+        node.alive = False
+        self.schedule(at, self.start, node)
+
+    def start(self, node):
+        node.alive = True
+        node.start()
+
+    def leave(self):
+        self.left.alive = False
+
+    def schedule(self, at, func, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (at, self.seq, func, args))
+
+    def transmit(self, sender, body):
+        self.frames.append((self.now, len(body) + DIGEST_SIZE))
+        for node in self.nodes:
+            if node is not sender and node.alive:
+                self.schedule(self.now + AIRTIME_MS, self.deliver, node, body)
+
+    def deliver(self, node, body):
+        if node.alive:
+            for msg in iter_espmessages(body):
+                if msg.id != node.id:
+                    node.on_message(msg)
+
+    def run(self):
+        """Run simulation, return times when all nodes knew each other, the joined node and forgot left one."""
+        converged = joined = left = None
+        checked = 0
+        while self.events and self.events[0][0] < self.end:
+            self.now, _, func, args = heapq.heappop(self.events)
+            func(*args)
+            if self.now < checked + 10:  # Convergence is checked with 10 ms resolution.
+                continue
+            checked = self.now
+            alive = [node for node in self.nodes if node.alive]
+            if converged is None and self.now < JOIN_AT_MS:
+                if len(alive) == self.count and all(len(node.neighbours) == self.count for node in alive):
+                    converged = self.now
+            elif joined is None and JOIN_AT_MS <= self.now < LEAVE_AT_MS:
+                if all(self.joined.id in node.neighbours for node in alive) and \
+                        len(self.joined.neighbours) == self.count + 1:
+                    joined = self.now - JOIN_AT_MS
+            elif left is None and self.now >= LEAVE_AT_MS:
+                if all(self.left.id not in node.neighbours for node in alive):
+                    left = self.now - LEAVE_AT_MS
+        return converged, joined, left
+
+
+def main():
+    print(f"{NODES} nodes in one broadcast domain, booting within {BOOT_MS // 1000}s, "
+          f"steady state {STEADY[0] // 1000}-{STEADY[1] // 1000}s")
+    print(f"{'scheme':<9}{'frames/s':>10}{'bytes/s':>10}{'start ms':>10}{'join ms':>10}{'leave ms':>10}")
+    for name, node_class in (("fixed", FixedNode), ("trickle", TrickleNode)):
+        sim = Sim(node_class)
+        converged, joined, left = sim.run()
+        steady = [size for t, size in sim.frames if STEADY[0] <= t < STEADY[1]]
+        seconds = (STEADY[1] - STEADY[0]) / 1000
+        print(f"{name:<9}{len(steady) / seconds:>10.1f}{sum(steady) / seconds:>10.0f}"
+              f"{str(converged):>10}{str(joined):>10}{str(left if left is not None else 'never'):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: CPython benchmark of WiFi message throughput through one relay node over localhost sockets and of its
+#          CPU per message with in-memory streams, JSON lines against binary frames.
+#          Run: python -m benchmarks.bench_wifi_framing
+
+import asyncio
+import json
+import statistics
+import time
+
+from src.utils.messages import AppMessage, TopologyPropagate, WIFI_PACKETS, WIFI_BUF_SIZE, pack_wifimessage, \
+    pack_wififrame, decode_wifimessage, read_wifimessage
+
+MESSAGES = 20000
+RUNS = 5  # Median of runs, localhost sockets are noisy.
+SRC = "3c71bfe48b89"
+DST = "3c71bfe48ba1"
+
+
+def make_payload(i):
+    if i % 10 == 0:  # Every tenth message carries small topology, rest is application traffic.
+        topology = {"node": SRC, "child": [{"node": DST, "child": []}, {"node": "3c71bfe48bb9", "child": []}]}
+        return TopologyPropagate(SRC, DST, topology)
+    return AppMessage(SRC, DST, {"blink": [i % 100, 20, 30], "seq": i})
+
+
+async def relay_json(reader, writer):
+    """Relay as it was before: line read, json.loads for routing and json.loads again to unpack."""
+    while True:
+        res = await reader.readline()
+        if not res:
+            break
+        js = json.loads(res)
+        d = json.loads(res)
+        WIFI_PACKETS[d["flag"]](d["src"], d["dst"], d["msg"])
+        if js["dst"] == DST:
+            writer.write(res)
+            await writer.drain()
+
+
+async def relay_binary(reader, writer):
+    """Relay with binary frames read into reusable buffer and decoded once."""
+    buf = bytearray(WIFI_BUF_SIZE)
+    while True:
+        res = await read_wifimessage(reader, buf)
+        if not res:
+            break
+        obj = decode_wifimessage(res)
+        if obj.packet["dst"] == DST:
+            writer.write(res)
+            await writer.drain()
+
+
+async def run(relay, encode, read):
+    done = asyncio.Event()
+    relayed = asyncio.Event()
+    received = [0]
+
+    async def sink(reader, writer):
+        buf = bytearray(WIFI_BUF_SIZE)
+        while received[0] < MESSAGES:
+            if not await read(reader, buf):
+                break
+            received[0] += 1
+        done.set()
+
+    async def relay_node(reader, writer):
+        _, out = await asyncio.open_connection("127.0.0.1", sink_port)
+        await relay(reader, out)
+        out.close()
+        relayed.set()
+
+    sink_server = await asyncio.start_server(sink, "127.0.0.1", 0)
+    sink_port = sink_server.sockets[0].getsockname()[1]
+    relay_server = await asyncio.start_server(relay_node, "127.0.0.1", 0)
+    relay_port = relay_server.sockets[0].getsockname()[1]
+    frames = [encode(make_payload(i)) for i in range(MESSAGES)]
+    size = sum(len(f) for f in frames)
+
+    _, writer = await asyncio.open_connection("127.0.0.1", relay_port)
+    start = time.perf_counter()
+    writer.write(b''.join(frames))  # Source is never the bottleneck, relay is measured.
+    await writer.drain()
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    await relayed.wait()
+    sink_server.close()
+    relay_server.close()
+    return MESSAGES / elapsed, size / MESSAGES
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+async def run_in_memory(relay, encode):
+    """Microseconds of relay per message, stream is in memory so there are no socket syscalls."""
+    reader = asyncio.StreamReader()
+    reader.feed_data(b''.join(encode(make_payload(i)) for i in range(MESSAGES)))
+    reader.feed_eof()
+    start = time.perf_counter()
+    await relay(reader, NullWriter())
+    return (time.perf_counter() - start) / MESSAGES * 1e6
+
+
+def median_run(relay, encode, read):
+    """(median msg/s, B/msg) of RUNS runs."""
+    results = [asyncio.run(run(relay, encode, read)) for _ in range(RUNS)]
+    return statistics.median(rate for rate, _ in results), results[0][1]
+
+
+def main():
+    encode_json = lambda obj: '{}\n'.format(pack_wifimessage(obj)).encode()
+    json_rate, json_size = median_run(relay_json, encode_json, lambda r, b: r.readline())
+    bin_rate, bin_size = median_run(relay_binary, pack_wififrame, read_wifimessage)
+    json_us = statistics.median(asyncio.run(run_in_memory(relay_json, encode_json)) for _ in range(RUNS))
+    bin_us = statistics.median(asyncio.run(run_in_memory(relay_binary, pack_wififrame)) for _ in range(RUNS))
+    print(f"{'format':<10}{'msg/s':>12}{'B/msg':>10}{'CPU us/msg':>12}")
+    print(f"{'JSON':<10}{json_rate:>12.0f}{json_size:>10.1f}{json_us:>12.2f}")
+    print(f"{'binary':<10}{bin_rate:>12.0f}{bin_size:>10.1f}{bin_us:>12.2f}")
+    print(f"speedup {bin_rate / json_rate:.2f}x, size {bin_size / json_size:.2f}x, CPU {bin_us / json_us:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
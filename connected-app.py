@@ -24,7 +24,8 @@ USER_MAC = "ff0000000000"
 class UserApp:
     """App to run on user's PC.
     To be connected to the WIFI with the mesh you must specify the WiFi credentials in config.json.
-    User must specify the IP of the root node (it is printed on the OLED display)."""
+    User must specify the IP of the root node (it is printed on the OLED display).
+    App talks in JSON lines, root node answers on this connection in JSON too (nodes use binary frames)."""
     def __init__(self, ip):
         self._loop = asyncio.get_event_loop()
         self.colour = tuple(random.randint(0, 100) for _ in range(3))
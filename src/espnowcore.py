@@ -8,12 +8,20 @@ import gc
 gc.collect()
 from src.utils.net import Net, ESP
 gc.collect()
-from src.utils.messages import Advertise, ObtainCreds, SendWifiCreds, pack_espmessage, unpack_espmessage, ESP_PACKETS, \
-    Esp_Type
+from src.utils.messages import Advertise, ObtainCreds, SendWifiCreds, AskWifiCreds, RootElected, NeighbourDigest, \
+    EspAggregator, pack_espmessage_into, unpack_espmessage, iter_espmessages, espframe_types, ESP_CODECS, \
+    ESP_FRAME_SIZE, Esp_Type
 gc.collect()
 from src.utils.pins import init_button, id_generator, RIGHT_BUTTON
 gc.collect()
-from src.utils.hmac import HMAC, compare_digest
+from src.utils.hmac import HMACSigner
+gc.collect()
+from src.utils.neighbours import NeighbourTable, gen_newer, GEN_MASK
+from src.utils.trickle import Trickle
+from src.utils.links import LinkTable
+from src.utils.election import Election
+from src.utils.standby import Standby
+from src.utils.rxpool import RxPool
 
 gc.collect()
 import uasyncio as asyncio
@@ -21,20 +29,27 @@ import time
 import struct
 import json
 import ucryptolib as cryptolib
-import math
-from ubinascii import unhexlify
+import urandom
 gc.collect()
 
 # Constants
 DEFAULT_S = const(5)
 MPS_THRESHOLD_MS = const(4250)  # Time how long button must be pressed to allow MPS in ms (cca 4-5s).
 MPS_TIMER_S = const(45)  # Allow excahnge of credentials for this time, in seconds.
-ADVERTISE_S = const(5)  # Advertise every once this timer expires, in seconds.
-ADVERTISE_OTHERS_MS = const(13000)
-NEIGHBOURS_NOT_CHANGED_FOR_MS = const(29000)
+ADVERTISE_IMIN_MS = const(1000)  # Trickle interval of advertisements after change of neighbours.
+ADVERTISE_DOUBLINGS = const(3)  # Interval doubles up to 8s while neighbours don't change.
+ADVERTISE_K = const(1)  # Record of other node is not forwarded when this many others forwarded it in interval.
+NEIGHBOUR_TIMEOUT_MS = const(26000)  # Record of node not heard for this long is deleted.
+GEN_MS = const(30000)  # Node increases generation in its advertisement this often, to show it is alive.
+FAR_NEIGHBOUR_TIMEOUT_MS = const(90000)  # Record of node heard through others without new generation is deleted.
+ELECTION_HOLD_MS = const(8000)  # Node which is the best candidate for root this long declares itself root.
+ELECTION_POLL_MS = const(1000)
+BACKUP_HEALTH_MS = const(75000)  # Backup parent which did not answer two AskWifiCreds in a row is not used.
 DIGEST_SIZE = const(32)  # Size of HMAC(SHA256) signing code. Equals to Size of Creds for HMAC(SHA256).
 CREDS_LENGTH = const(32)
 PMK_LMK_LENGTH = const(16)
+FLUSH_MS = const(20)  # Broadcast messages queued within this window are sent in one frame under one HMAC.
+OPEN_FRAME = (1 << Esp_Type.ADVERTISE) | (1 << Esp_Type.ROOT_ELECTED)  # Frames taken from node not known yet.
 
 """
 ESP-NOW Core class responsible for mesh operations.
@@ -54,11 +69,27 @@ class EspNowCore:
         self.ap_password = id_generator(16)  # Must be multiple of 16
         self.sta_ssid = self.sta_password = None
         self.esp = ESP()
+        self._signer = None  # HMACSigner for current creds, rebuilt on change of creds.
+        self.creds_obtained = asyncio.Event()  # Set once node has credentials for signing.
+        self.claimed = asyncio.Event()  # Set on WiFi creds from parent or on becoming root, WifiCore connects then.
         self.creds = b'\x00'
         self._creds_msg_size = None
+        self._tx_buf = bytearray(ESP_FRAME_SIZE)  # Reusable buffer for outgoing frames.
+        self._tx_view = memoryview(self._tx_buf)
+        self._aggregator = EspAggregator(ESP_FRAME_SIZE - DIGEST_SIZE)  # Queued broadcast messages.
+        self._flush_scheduled = False
         # Node espnow mesh definitions.
         self.id = self.ap.wlan.config('mac')
-        self.neighbours = {}
+        # Database of nodes in mesh from Advertise messages, nodes not heard for NEIGHBOUR_TIMEOUT_MS expire.
+        self.neighbours = NeighbourTable(timeout_ms=NEIGHBOUR_TIMEOUT_MS, own=self.id,
+                                         far_timeout_ms=FAR_NEIGHBOUR_TIMEOUT_MS)
+        self.gen = urandom.getrandbits(16)  # Generation of own record.
+        self._neighbour_added = asyncio.Event()  # Wakes up check_neighbours, new record may expire sooner.
+        self.trickle = Trickle(ADVERTISE_IMIN_MS, ADVERTISE_DOUBLINGS)  # Schedule of advertisements.
+        self._trickle_reset = asyncio.Event()  # Wakes up advertise when interval was reset.
+        self._readvertise = Advertise(self.id, 0.0, 0.0, False, 0)  # Reused to resend records of others.
+        self.links = LinkTable()  # RSSI of peers from received frames, centrality of node.
+        self.rx = RxPool(self.esp.irecv, self.accept_frame, self.process_frame)  # Bounded processing of frames.
         # User defined from config.json.
         self.esp_pmk = self.esp_lmk = None
         self.get_config()
@@ -69,12 +100,13 @@ class EspNowCore:
         self.loop = asyncio.get_event_loop()
         self.in_mps = False  # Flag signalize MPS procedure
         self._mps_lock = asyncio.Lock()  # Asyncio lock tol allow only one MPS proceduer at the time.
-        # self._wlan_scan_lock = _thread.allocate_lock() # Threading lock similar to the one in C.
-        self._wlan_scan_lock = asyncio.ThreadSafeFlag()  # Threading lock similar to the one in C.
 
         # Flags for root election and topology addition.
-        self.neigh_last_changed = time.ticks_ms()  # Watch time from last change to start root election.
+        self.election = Election(self.id, ELECTION_HOLD_MS)  # Root election from database of neighbours.
         self.in_topology = False  # When node was added into the tree.
+        self.free_slots = 0  # Children WifiCore can still take, AskWifiCreds is answered only then.
+        self.standby = Standby(BACKUP_HEALTH_MS)  # Backup parent, kept by WifiCore.
+        self.rx_src = None  # ESP-NOW source MAC of message being processed.
         self.seen_topology = False  # If node sees another node in tree topology don't elect root.
         self.root = b''
 
@@ -88,13 +120,29 @@ class EspNowCore:
             new_creds = creds + (CREDS_LENGTH - len(creds)) * b'\x00'
             creds = new_creds[:CREDS_LENGTH]
         self.creds = creds  # Now is 32Bytes long for HMAC(SHA256) signing.
-        _, pattern = ESP_PACKETS[Esp_Type.OBTAIN_CREDS]
-        self._creds_msg_size = struct.calcsize(pattern) + 1  # Size of ObtainCreds class message.
+        self._creds_msg_size = ESP_CODECS[Esp_Type.OBTAIN_CREDS].size  # Size of ObtainCreds class message.
         self.esp_pmk = self.config.get('esp_pmk').encode()
         self.esp_lmk = self.config.get('esp_lmk').encode()
         if len(self.esp_pmk) != PMK_LMK_LENGTH or len(self.esp_lmk) != PMK_LMK_LENGTH:
             raise ValueError('LMK and PMK key must be 16Bytes long.')
 
+    @property
+    def creds(self):
+        return self._creds
+
+    @creds.setter
+    def creds(self, value):
+        self._creds = value
+        self._signer = None  # Pads are derived on the next sign with new creds.
+        if self.has_creds():
+            self.creds_obtained.set()
+
+    @property
+    def signer(self):
+        if self._signer is None:
+            self._signer = HMACSigner(self._creds)
+        return self._signer
+
     def dprint(self, *args):
         if self.DEBUG:
             print(*args)
@@ -113,7 +161,7 @@ class EspNowCore:
         await asyncio.sleep_ms(10)
         # Add broadcast peer
         self.esp.add_peer(self.BROADCAST)
-        self.loop.create_task(self.on_message())  # Receive messages
+        self.rx.start(self.loop)  # Receive messages
 
         await self.added_to_mesh()
         self.loop.create_task(self.advertise())  # Advertise itself
@@ -124,8 +172,7 @@ class EspNowCore:
         """
         Triger when node has obtained credentials, until then wait for MPS procedure.
         """
-        while not self.has_creds():
-            await asyncio.sleep(DEFAULT_S)
+        await self.creds_obtained.wait()
 
     def has_creds(self):
         return int.from_bytes(self.creds, "big")
@@ -173,7 +220,10 @@ class EspNowCore:
         """Try to retrieve credentials until you have them. Processing of messages happens in message.py file."""
         while not self.has_creds():
             self.send_creds(0, self.creds, peer=self.BROADCAST)
-            await asyncio.sleep(DEFAULT_S)
+            try:  # Ask again after DEFAULT_S, unless credentials come sooner.
+                await asyncio.wait_for(self.creds_obtained.wait(), DEFAULT_S)
+            except asyncio.TimeoutError:
+                pass
         print("\t[MPS credentials obtained] ")
         self._mps_lock.release()
 
@@ -188,124 +238,228 @@ class EspNowCore:
 
     async def advertise(self):
         """
-        Actualize node's own values in database and send to everyone in the mesh.
+        Actualize node's own values in database and send them with digest of the database and changed records
+        of other nodes on Trickle timer. Interval doubles from ADVERTISE_IMIN_MS while neighbours don't change and
+        resets on any change. Every GEN_MS own generation goes up.
         """
-        cntr = rssi = 0.0
-        wifies = []
-        adv = Advertise(self.id, cntr, rssi, self.in_topology, 0)
+        adv = Advertise(self.id, 0.0, 0.0, self.in_topology, 0)
         self.save_neighbour(adv, 0, 0)
-        wifi_ssid = None
-        wifi = self.config.get("WIFI", None)
-        if wifi:
-            wifi_ssid = wifi[0]
-        # self._wlan_scan_lock.set()
+        trickle = self.trickle
+        reset = self._trickle_reset
+        gen_changed = time.ticks_ms()
+        trickle.start(gen_changed)
         while True:
-            # self._wlan_scan_lock.acquire() # Lock is for waiting for results in second thread of scanning.
-            # await self._wlan_scan_lock.wait()
-            cntr, rssi = await self.get_cntr_rssi(wifies, wifi_ssid)
-            adv.mesh_cntr = cntr
-            adv.rssi = rssi
-            adv.tree_root_elected = self.in_topology
-            self.save_neighbour(adv, 0, 0)
-            signed_msg = self.send_msg(self.BROADCAST, adv)
-            self.dprint("[Advertise send]:", signed_msg[: len(signed_msg) - DIGEST_SIZE])
-            # _thread.start_new_thread(self.wlan_scan, [wifies]) # Scan wlans in new thread and release lock.
-            await asyncio.sleep(
-                ADVERTISE_S)  # Use time of this sleep to switch to other thread. (Should be enough, lock is for sure.)
-
-    async def get_cntr_rssi(self, wifies, router_ssid: bytes):
-        """
-        Compute centrality and RSSI to router. 
-        """
-        rssi = cntr = 0.0
-        for record in wifies:
-            if router_ssid and record[0] == router_ssid:
-                rssi = record[3]
-            elif record[1] in self.neighbours:
-                if record[3] == 0:  # Division by zero error.
-                    cntr += 1
-                else:
-                    eqaution = 1 / math.sqrt(abs(record[3]))
-                    cntr = cntr + eqaution
-        return cntr, rssi
+            now = time.ticks_ms()
+            if trickle.poll(now):  # Transmission point of interval.
+                adv.mesh_cntr, adv.rssi = self.get_cntr_rssi()
+                changed = adv.tree_root_elected != self.in_topology
+                adv.tree_root_elected = self.in_topology
+                if time.ticks_diff(now, gen_changed) >= GEN_MS:
+                    gen_changed = now
+                    self.gen = (self.gen + 1) & GEN_MASK
+                adv.gen = self.gen
+                self.save_neighbour(adv, 0, 0)
+                packed_msg = self.send_msg(self.BROADCAST, adv)
+                self.dprint("[Advertise send]:", bytes(packed_msg))
+                self.send_msg(self.BROADCAST, NeighbourDigest(self.id, self.neighbours.digest()))
+                self.forward_neighbours(now)
+                if changed:
+                    self.trickle_reset(now)
+            reset.clear()
+            try:
+                await asyncio.wait_for_ms(reset.wait(), trickle.wait_ms(now))
+            except asyncio.TimeoutError:
+                pass
+
+    def trickle_reset(self, now):
+        """ Inconsistency in neighbours, advertise again soon. """
+        if self.trickle.inconsistent(now):
+            self._trickle_reset.set()
+
+    def forward_neighbours(self, now):
+        """
+        Forward records of other nodes with ttl + 1. Changed records (new node, generation, root flag or shorter
+        path) are not forwarded when ADVERTISE_K others at the same distance did. Records asked for (bucket differs
+        in digest of neighbour, neighbour forwarded older generation) are forwarded always.
+        """
+        neighbours = self.neighbours
+        adv = self._readvertise
+        for slot in neighbours.to_forward(ADVERTISE_K):
+            neighbours.fill_advertise(slot, adv)
+            adv.ttl += 1
+            packed_msg = self.send_msg(self.BROADCAST, adv)
+            neighbours.set_last_tx(slot, now)
+            self.dprint("[Advertise forward]:", bytes(packed_msg))
+
+    def get_cntr_rssi(self):
+        """
+        Centrality and RSSI to router. Centrality is kept by self.links from received frames, wlan.scan() is not
+        used as it blocks ESP-NOW receive for seconds. RSSI to router is known only while STA is connected to it.
+        """
+        if self.sta.isconnected():
+            self.links.sample_router(self.sta.wlan.status('rssi'))
+        return self.links.centrality, self.links.router_rssi
+
+    def sample_link(self, peer):
+        """RSSI of the last frame from peer, as espnow saw it, into filtered RSSI of the link."""
+        record = self.esp.peer_rssi(peer)
+        if record is not None:
+            self.links.sample(peer, record[0], record[1])
 
     def save_neighbour(self, adv: Advertise, last_rx, last_tx):
-        # Dictionary {mac : [node_id, node_cntr, node_rssi, is_root, ttl, last_rx, last_tx]}
-        node_id = adv.id
         if adv.tree_root_elected:
             self.seen_topology = True
-        # Update core.neighbours with new values.
-        self.neighbours[node_id] = [x[1] for x in sorted(adv.__dict__.items())] + [last_rx, last_tx]
+        # Update slot of node in core.neighbours in place.
+        if self.neighbours.update(adv, last_rx, last_tx) is None:
+            self.dprint("[Neighbours] table is full, dropped:", adv.id)
 
     def on_advertise(self, adv: Advertise):
         """
         Called from message.py.
-        Update database of neighbours. On first encounter of new node immediately resend advertisement.
-        Record in database is dict {node: (node, cnt, rssi, rootFlag, ttl, last_rx, last_tx)}
-        """
-        record = self.neighbours.get(adv.id, None)
-        last_tx = 0
-        tmp = adv.ttl
-        last_rx = time.ticks_ms()
-        if record:  # Node already registered.
-            node_id, _cnt, _rss, _root, _ttl, _, last_tx = record
-            if node_id == self.id:
+        Update database of neighbours from advertisement of the node itself, or from forward with its newer
+        generation or the same one over shorter path. Forward of the same generation counts for suppression
+        of own forward, forward of older one is answered with the newer. Copy of record which expired here is not
+        taken back. New node resets Trickle timer.
+        Record in database is slot of NeighbourTable (node, cnt, rssi, rootFlag, ttl, gen, last_rx, last_tx).
+        """
+        if adv.id == self.id:
+            return
+        neighbours = self.neighbours
+        slot = neighbours.slot(adv.id)
+        now = time.ticks_ms()
+        if slot is None:  # New addition.
+            if adv.ttl and neighbours.is_stale(adv.id, adv.gen):
                 return
-            adv.ttl = min(_ttl, adv.ttl)  # Save the lowest TTL
-        else:  # New addition.
-            self.neigh_last_changed = last_rx
-            last_tx = time.ticks_ms()
-            adv.ttl = adv.ttl + 1
-            signed_msg = self.send_msg(self.BROADCAST, adv)
-            adv.ttl = adv.ttl - 1
-            self.dprint("[Advertise imedietly forward on new node]:", signed_msg[: len(signed_msg) - DIGEST_SIZE])
-        self.save_neighbour(adv, last_rx, last_tx)
-        adv.ttl = tmp
+            self._neighbour_added.set()
+            self.save_neighbour(adv, now, 0)
+            self.trickle_reset(now)
+            return
+        ttl = neighbours.ttl(slot)
+        gen = neighbours.gen(slot)
+        if adv.ttl == 0 or gen_newer(adv.gen, gen) or (adv.gen == gen and adv.ttl < ttl):
+            # Shorter path of the same generation is no sign of life, old record must still expire.
+            rx = now if adv.ttl == 0 or adv.gen != gen else neighbours.last_rx(slot)
+            changed = adv.tree_root_elected != neighbours.root(slot)
+            self.save_neighbour(adv, rx, neighbours.last_tx(slot))
+            if adv.ttl == 0 and ttl:  # Far record became direct one, it expires sooner.
+                self._neighbour_added.set()
+            if changed:
+                self.trickle_reset(now)
+        elif adv.gen == gen and adv.ttl == ttl + 1:
+            neighbours.heard_forward(slot)
+        elif gen_newer(gen, adv.gen):  # Neighbour is behind, give it the newer one.
+            neighbours.mark_asked(slot)
+
+    def on_digest(self, digest: NeighbourDigest):
+        """
+        Called from message.py. Records of buckets where digest of neighbour differs are forwarded at the next
+        transmission. Neighbour does the same on digest from this node, so both get what they miss.
+        """
+        neighbours = self.neighbours
+        if digest.id == self.id or digest.id not in neighbours:
+            return
+        for bucket in neighbours.differing_buckets(digest.buckets):
+            neighbours.mark_bucket(bucket)
 
     async def check_neighbours(self):
         """
-        Task will each second check old records and wipe them out.
-        It will also advertise other nodes every 13s if they are active.
+        Task wipes out records of nodes not heard for NEIGHBOUR_TIMEOUT_MS. It sleeps until the nearest expiry
+        check and touches only records which are due, with no neighbours it waits for the first one. New direct
+        neighbour wakes it up, its deadline may be sooner than tombstones and far records it sleeps for.
         """
-        dprint = self.dprint
+        neighbours = self.neighbours
+        added = self._neighbour_added
         while True:
-            for record in self.neighbours.values():
-                t = time.ticks_ms()
-                node_id, node_cntr, node_rssi, root_elected, ttl, last_rx, last_tx = record
-                if node_id == self.id:
-                    continue
-                elif time.ticks_diff(t, last_rx) > 2 * ADVERTISE_OTHERS_MS:  # Timeout -> delete record
-                    del self.neighbours[node_id]
-                    self.neigh_last_changed = t
-                elif time.ticks_diff(last_rx, last_tx) > ADVERTISE_OTHERS_MS:  # Timeout -> advertise.
-                    adv = Advertise(node_id, node_cntr, node_rssi, root_elected, ttl + 1)
-                    last_tx = t
-                    signed_msg = self.send_msg(self.BROADCAST, adv)
-                    adv.ttl = ttl
-                    self.save_neighbour(adv, last_rx, last_tx)
-                    dprint(self.neighbours)
-                    dprint("[Advertise every 13s database]:", signed_msg[: len(signed_msg) - DIGEST_SIZE])
-            await asyncio.sleep(1)
+            expired = neighbours.expire()
+            if expired:
+                for mac in expired:
+                    self.links.remove(mac)
+                    if mac == self.election.root:
+                        self.root_lost(mac)
+                now = time.ticks_ms()
+                self.trickle_reset(now)
+                self.dprint("[Neighbours expired]:", expired)
+            wait = neighbours.next_expiry_ms()
+            added.clear()
+            if wait is None:
+                await added.wait()
+            else:
+                try:
+                    await asyncio.wait_for_ms(added.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
 
     async def check_root_election(self):
         """
-        After neighbours don't change for some time, trigger flag to simulate root election.
+        Elect root from database of neighbours. Node which is the best candidate (Election.score) for
+        ELECTION_HOLD_MS declares itself root. Node which sees tree topology waits to be claimed, unless its root
+        was lost.
         """
-        root = unhexlify(self.config.get("root", ""))
+        election = self.election
         while True:
-            if self.seen_topology and root != self.id:  # If seen node in topology wait to be claimed.
-                break
-            elif time.ticks_diff(time.ticks_ms(),
-                                 self.neigh_last_changed) > NEIGHBOURS_NOT_CHANGED_FOR_MS:
-                self.root = root  # Now assign root to simulate election.
-                print(
-                    f"[ROOT ELECTION] can start, neigh database ot changed for {NEIGHBOURS_NOT_CHANGED_FOR_MS} seconds")
-                if self.id == self.root:
-                    self.in_topology = True
-                    print(f"[ROOT ELECTION] finished, root is {self.root}")
-                break
-            else:
-                await asyncio.sleep(DEFAULT_S)
+            if (not self.seen_topology or election.lost) and election.poll(self.neighbours, time.ticks_ms()):
+                self.declare_root()
+            await asyncio.sleep_ms(ELECTION_POLL_MS)
+
+    def declare_root(self):
+        """ Declare itself root of the next term by RootElected flooded through mesh. """
+        neighbours = self.neighbours
+        slot = neighbours.slot(self.id)
+        cntr, rssi = neighbours.cntr(slot), neighbours.rssi(slot)
+        term = self.election.declare(cntr, rssi)
+        self.set_root(self.id)
+        self.send_msg(self.BROADCAST, RootElected(self.id, cntr, rssi, True, 0, term))
+        print(f"[ROOT ELECTION] finished, root is {self.root} in term {term}")
+
+    def root_lost(self, root):
+        """ Root expired from database, withdraw it in its term so the mesh elects again. """
+        term = self.election.term
+        if self.election.withdraw(root, term):
+            self.set_root(b'')
+            self.send_msg(self.BROADCAST, RootElected(root, 0.0, 0.0, False, 0, term))
+            print(f"[ROOT ELECTION] root {root} of term {term} lost")
+
+    def set_root(self, root):
+        if self.root == self.id and root != self.id:  # Better root won, step down.
+            self.in_topology = False
+        elif root == self.id:
+            self.in_topology = True
+        self.root = root
+        if root == self.id:
+            self.claimed.set()
+
+    def resume(self, creds, root, term):
+        """
+        Triggered from WifiCore with state saved before reset (RejoinStore). Node takes back credentials and root
+        of the term, so it neither waits for MPS nor elects root again.
+        """
+        if not self.has_creds():
+            self.creds = creds
+        if root and self.election.adopt(root, 0.0, 0.0, term):
+            self.set_root(root)
+
+    def on_root_elected(self, msg: RootElected):
+        """
+        Called from message.py. RootElected with root flag declares root of term in gen field, without it withdraws
+        lost root of the term. Message which changed root here is flooded further with ttl + 1. Root which is
+        withdrawn while it is alive declares itself again in the next term.
+        """
+        election = self.election
+        if msg.tree_root_elected:
+            if not election.adopt(msg.id, msg.mesh_cntr, msg.rssi, msg.gen):
+                return
+            self.set_root(msg.id)
+            self.dprint("[ROOT ELECTION] root is", msg.id, "in term", msg.gen)
+        elif msg.id == self.id:
+            if election.root == self.id and msg.gen == election.term:
+                self.declare_root()
+            return
+        elif election.withdraw(msg.id, msg.gen):
+            self.set_root(b'')
+        else:
+            return
+        msg.ttl += 1
+        self.send_msg(self.BROADCAST, msg)
 
     def aes_encrypt(self, value: 'str'):
         aes = cryptolib.aes(self.creds[:16], 2, b"1234" * 4)
@@ -332,102 +486,118 @@ class EspNowCore:
     def on_send_wifi_creds(self, wifi_creds):
         """
         Called from message.py. Save credentials for station to connect, trigger conection process in WifiCore.
+        Node in tree gets them only from its backup parent, answer of other node is dropped by Standby.
         """
-        if wifi_creds.adst_node != self.id or self.in_topology:
+        if wifi_creds.adst_node != self.id:
+            return
+        ssid = self.aes_decrypt(wifi_creds.cessid)[:wifi_creds.bessid_length]
+        password = self.aes_decrypt(wifi_creds.zpasswd)
+        if self.in_topology:
+            self.standby.on_creds(self.rx_src, ssid, password, time.ticks_ms())
             return
-        self.sta_ssid = self.aes_decrypt(wifi_creds.cessid)[:wifi_creds.bessid_length]
-        self.sta_password = self.aes_decrypt(wifi_creds.zpasswd)
+        self.sta_ssid = ssid
+        self.sta_password = password
         print(f"[RECEIVED WIFI CREDS FROM PARENT] {self.sta_ssid} and {self.sta_password}")
         self.in_topology = True
+        self.claimed.set()
+
+    def ask_wifi_creds(self, parent):
+        """ Triggered from WifiCore. Node without parent asks parent (neighbour in tree) to claim it. """
+        self.send_msg(self.BROADCAST, AskWifiCreds(parent, self.id))
+
+    def on_ask_wifi_creds(self, ask: AskWifiCreds):
+        """ Called from message.py. Claim node which asks for it, when this node is in tree and has free slot. """
+        if ask.dst != self.id or not self.in_topology or self.free_slots <= 0:
+            return
+        self.claim_children([ask.id])
 
     def send_msg(self, peer=None, msg: "messages.class" = ""):
         """
         Create message from class object and send it through espnow.
-        """
-        packed_msg = pack_espmessage(msg)  # Creates byte-like string.
-        digest_hash = self.sign_message(packed_msg)
-        signed_msg = packed_msg + digest_hash
-        self.esp.send(peer, signed_msg)
-        return signed_msg
+        Broadcasts are queued for FLUSH_MS and sent together in one frame. ObtainCreds are always sent alone,
+        because receiver in MPS recognizes them by frame length.
+        Message is packed into reusable buffer, returned packed message is valid only until the next send.
+        """
+        if peer == self.BROADCAST and msg.type != Esp_Type.OBTAIN_CREDS:
+            packed_msg = self._aggregator.add(msg)
+            if packed_msg is None:  # Frame is full, send it and start new one.
+                self.flush()
+                packed_msg = self._aggregator.add(msg)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.loop.create_task(self._flush_later())
+            return packed_msg
+        end = pack_espmessage_into(self._tx_buf, 0, msg)
+        self.esp.send(peer, self._tx_view[:self.signer.sign_into(self._tx_view[:end], self._tx_buf, end)])
+        return self._tx_view[:end]
+
+    def flush(self):
+        """Sign queued broadcast messages with one HMAC and send them in one frame."""
+        aggregator = self._aggregator
+        end = aggregator.end
+        if not end:
+            return
+        end = self.signer.sign_into(aggregator.view[:end], aggregator.buf, end)
+        self.esp.send(self.BROADCAST, aggregator.view[:end])
+        aggregator.clear()
+
+    async def _flush_later(self):
+        await asyncio.sleep_ms(FLUSH_MS)
+        self._flush_scheduled = False
+        self.flush()
 
     def sign_message(self, msg):
         """
         Sign message with HMAC hash from sha256(by default) only if credentials are available.
         """
-        mac = HMAC(self.creds, msg)     # This consumes 10KB of memory.
-        digest_hash = mac.digest()
-        return digest_hash
+        return self.signer.digest(msg)
 
     def verify_sign(self, msg, msg_digest):
         """
         Check if the digest match with the same credentials. If not drop packet.
         """
-        if not msg_digest or not msg:
+        if not msg_digest or not msg or len(msg_digest) != DIGEST_SIZE:
             return False
-        my_digest = self.sign_message(msg)
-        if len(my_digest) != len(msg_digest):
-            return False
-        return my_digest == msg_digest
-        # return compare_digest(my_digest, bytes(msg_digest, 'utf-8')) # This consumes 20KB of memory
+        return self.signer.verify(msg, msg_digest)
 
-    async def on_message(self):
+    def accept_frame(self, src, frame):
         """
-        Wait for messages. Light weight function to not block recv process. Further processing in another coroutine.
+        Cheap checks of received frame before HMAC: known messages whose sizes add up to the frame with digest,
+        from node in database of neighbours. Node not known yet is heard only in advertisements, or in MPS.
         """
-        while True:
-            buf = await self.esp.read(250)  # HAS to be 250 otherwise digest is blank, don't know why.
-            next_msg = 0
-            while True: # To go through possible multiple messages in one buffer. Can happen.
-                buf = buf[next_msg:]
-                msg, digest, msg_len = self.get_message_with_digest(buf)
-                self.loop.create_task(self.process_message(msg, digest, msg_len))  # Process in another coro.
-                # Read only first two bytes and then read length of the packet, 
-                # cannot do because StreamReader.read(), read1() don't work, they read as much as can (whole packet).
-                # Workaround here.
-                if len(buf) > (8 + msg_len) and buf[8 + next_msg] == '\x99':
-                    next_msg = 8 + msg_len
-                else:
-                    next_msg = 0
-                    break
-
-    def get_message_with_digest(self, buf):
-        """
-        Extract message and it's digest and length and return all of it.
-        """
-        msg_magic, msg_len, msg_src = struct.unpack("!BB6s", buf[0:8])  # Always in the incoming packet.
-        msg = buf[8:(8 + msg_len - DIGEST_SIZE)]
-        digest = buf[(8 + msg_len - DIGEST_SIZE): (
-                    8 + msg_len)]  # Get the digest from the message for comparison, digest is 32B.
-        return msg, digest, msg_len
-
-    async def process_message(self, msg, digest, msg_len):
-        """
-        Verify sign and unpack messages and process it.
+        types = espframe_types(frame, DIGEST_SIZE)
+        if not types:
+            return False
+        if types & OPEN_FRAME or (self.in_mps and types & (1 << Esp_Type.OBTAIN_CREDS)):
+            return True
+        return bytes(src) in self.neighbours
+
+    async def process_frame(self, src, frame):
+        """ Worker of RxPool, frame is view of its slot. """
+        end = len(frame) - DIGEST_SIZE
+        await self.process_message(frame[:end], frame[end:], len(frame), bytes(src))
+
+    async def process_message(self, msg, digest, msg_len, src):
+        """
+        Verify sign and unpack messages and process it. One signed frame can carry several messages.
         If node doesn't have credentials for digest, it will drop packet becaue digests will not match.
+        RSSI of signed frame is taken for link to its source.
         """
         if self.verify_sign(msg, digest):
-            obj = await unpack_espmessage(msg, self)
-            self.dprint("[On Message Verified received] obj: ", obj)
+            self.sample_link(src)
+            for obj in iter_espmessages(msg):
+                self.rx_src = src  # Handlers take it before their first await, other worker may change it then.
+                await obj.process(self)
+                self.dprint("[On Message Verified received] obj: ", obj)
         # If in exchange mode expect creds and wrong sign because we don't have the correct creds.
         elif self.in_mps and msg_len == self._creds_msg_size + DIGEST_SIZE:
             creds = digest
-            obj = await unpack_espmessage(msg + creds, self)
+            self.rx_src = src
+            obj = await unpack_espmessage(bytes(msg) + bytes(creds), self)
             self.dprint("[On Message not Verified received] obj: ", obj)
         else:
             self.dprint("[On Message dropped]", msg, msg_len)
 
-    def wlan_scan(self, wlans):
-        """
-        Run in separate thread, wlan.scan() blocks rx_buffer of esp due to RTOS implementation.
-        """
-        wlans.clear()  # Clear the list of old records.
-        try:
-            wlans.extend(self.sta.wlan.scan())
-        except RuntimeError as e:  # Sometimes can throw Wifi Unknown Error 0x0102 == no AP found.
-            wlans.clear()
-        # self._wlan_scan_lock.release()
-        # self._wlan_scan_lock.set()
-
 
 def main():
     c = EspNowCore()
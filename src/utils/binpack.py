@@ -0,0 +1,159 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Compact binary encoding of JSON-like values, subset of MessagePack format.
+
+import struct
+
+# None, bool, int, float, str, bytes, list/tuple and dict with str keys are supported.
+NIL = 0xc0
+FALSE = 0xc2
+TRUE = 0xc3
+BIN8 = 0xc4
+BIN16 = 0xc5
+FLOAT64 = 0xcb
+INT32 = 0xd2
+INT64 = 0xd3
+STR8 = 0xd9
+STR16 = 0xda
+ARRAY16 = 0xdc
+MAP16 = 0xde
+
+
+def _pack_length(buf, length, fix, fix_max, one, two):
+    if length <= fix_max and fix is not None:
+        buf.append(fix | length)
+    elif length < 0x100 and one is not None:
+        buf.append(one)
+        buf.append(length)
+    elif length < 0x10000:
+        buf.append(two)
+        buf.extend(struct.pack("!H", length))
+    else:
+        raise ValueError("binpack: value too long")
+
+
+def dump_into(obj, buf):
+    """Append encoded obj at the end of bytearray buf."""
+    if obj is None:
+        buf.append(NIL)
+    elif obj is True:
+        buf.append(TRUE)
+    elif obj is False:
+        buf.append(FALSE)
+    elif isinstance(obj, int):
+        if -32 <= obj < 128:
+            buf.append(obj & 0xff)
+        elif -0x80000000 <= obj < 0x80000000:
+            buf.append(INT32)
+            buf.extend(struct.pack("!i", obj))
+        else:
+            buf.append(INT64)
+            buf.extend(struct.pack("!q", obj))
+    elif isinstance(obj, float):
+        buf.append(FLOAT64)
+        buf.extend(struct.pack("!d", obj))
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _pack_length(buf, len(data), 0xa0, 31, STR8, STR16)
+        buf.extend(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_length(buf, len(obj), None, 0, BIN8, BIN16)
+        buf.extend(obj)
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(buf, len(obj), 0x90, 15, None, ARRAY16)
+        for item in obj:
+            dump_into(item, buf)
+    elif isinstance(obj, dict):
+        _pack_length(buf, len(obj), 0x80, 15, None, MAP16)
+        for key, value in obj.items():
+            dump_into(key, buf)
+            dump_into(value, buf)
+    else:
+        raise TypeError("binpack: unsupported type %s" % type(obj).__name__)
+    return buf
+
+
+def dumps(obj):
+    return bytes(dump_into(obj, bytearray()))
+
+
+def _load(buf, i):
+    """Decode value starting at index i, return (value, index after the value)."""
+    b = buf[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if b >= 0xe0:
+        return b - 0x100, i
+    if b < 0x90:
+        return _load_map(buf, i, b & 0x0f)
+    if b < 0xa0:
+        return _load_array(buf, i, b & 0x0f)
+    if b < 0xc0:
+        end = i + (b & 0x1f)
+        return bytes(buf[i:end]).decode(), end
+    if b == NIL:
+        return None, i
+    if b == FALSE:
+        return False, i
+    if b == TRUE:
+        return True, i
+    if b == INT32:
+        return struct.unpack_from("!i", buf, i)[0], i + 4
+    if b == INT64:
+        return struct.unpack_from("!q", buf, i)[0], i + 8
+    if b == FLOAT64:
+        return struct.unpack_from("!d", buf, i)[0], i + 8
+    if b == STR8:
+        return _load_str(buf, i + 1, buf[i])
+    if b == STR16:
+        return _load_str(buf, i + 2, struct.unpack_from("!H", buf, i)[0])
+    if b == BIN8:
+        return bytes(buf[i + 1:i + 1 + buf[i]]), i + 1 + buf[i]
+    if b == BIN16:
+        length = struct.unpack_from("!H", buf, i)[0]
+        return bytes(buf[i + 2:i + 2 + length]), i + 2 + length
+    if b == ARRAY16:
+        return _load_array(buf, i + 2, struct.unpack_from("!H", buf, i)[0])
+    if b == MAP16:
+        return _load_map(buf, i + 2, struct.unpack_from("!H", buf, i)[0])
+    raise ValueError("binpack: unknown type byte %d" % b)
+
+
+def _load_str(buf, i, length):
+    return bytes(buf[i:i + length]).decode(), i + length
+
+
+def _load_array(buf, i, length):
+    items = []
+    for _ in range(length):
+        b = buf[i]
+        if b < 0x80:  # Positive fixint, the most common item, without call.
+            items.append(b)
+            i += 1
+        else:
+            item, i = _load(buf, i)
+            items.append(item)
+    return items, i
+
+
+def _load_map(buf, i, length):
+    d = {}
+    for _ in range(length):
+        b = buf[i]
+        if 0xa0 <= b < 0xc0:  # Keys are short str.
+            i += 1
+            end = i + (b & 0x1f)
+            key = bytes(buf[i:end]).decode()
+            i = end
+        else:
+            key, i = _load(buf, i)
+        d[key], i = _load(buf, i)
+    return d, i
+
+
+def loads(buf, offset=0):
+    """Decode one value from buf (bytes, bytearray or memoryview) at offset."""
+    return _load(buf, offset)[0]
@@ -0,0 +1,79 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Min-heap of deadlines, so periodic checks sleep until the nearest one instead of polling.
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:  # CPython, used by tests and benchmarks.
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    from heapq import heappush, heappop
+except ImportError:
+    from uheapq import heappush, heappop
+
+
+class Deadlines:
+    """
+    Deadline for each key in min-heap, key has only its latest deadline, older heap entries are skipped.
+    ticks_ms() wraps around, so time is kept as monotonic ms counted by ticks_diff() from creation.
+    """
+
+    def __init__(self, clock=ticks_ms, diff=ticks_diff):
+        self._clock = clock
+        self._diff = diff
+        self._last = clock()
+        self._now = 0
+        self.heap = []  # [(deadline, key)]
+        self.scheduled = {}  # {key: deadline}
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def now(self):
+        t = self._clock()
+        self._now += self._diff(t, self._last)
+        self._last = t
+        return self._now
+
+    def schedule(self, key, in_ms):
+        deadline = self.now() + in_ms
+        self.scheduled[key] = deadline
+        heappush(self.heap, (deadline, key))
+
+    def cancel(self, key):
+        self.scheduled.pop(key, None)
+
+    def _drop_stale(self):
+        heap = self.heap
+        scheduled = self.scheduled
+        while heap and scheduled.get(heap[0][1], None) != heap[0][0]:
+            heappop(heap)
+
+    def wait_ms(self):
+        """Time until the nearest deadline, None when nothing is scheduled."""
+        self._drop_stale()
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - self.now())
+
+    def pop_due(self):
+        """Keys whose deadline has passed, they are no longer scheduled."""
+        due = []
+        now = self.now()
+        heap = self.heap
+        self._drop_stale()
+        while heap and heap[0][0] <= now:
+            key = heappop(heap)[1]
+            del self.scheduled[key]
+            due.append(key)
+            self._drop_stale()
+        return due
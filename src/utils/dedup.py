@@ -0,0 +1,65 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Bounded cache of seen broadcast messages, identified by origin and sequence number.
+
+WINDOW = 30  # Bits of sliding bitmap, kept under 31 bits to stay small int in MicroPython.
+MASK = (1 << WINDOW) - 1
+SEQ_MASK = 0xffff  # Sequence numbers are 16 bit and wrap around.
+HALF = 0x8000
+RESTART = 8 * WINDOW  # Sequence number this far behind the highest one means the origin rebooted.
+
+
+class SeenCache:
+    """
+    Per-origin sliding bitmap of last WINDOW sequence numbers (as anti-replay window in IPsec).
+    Holds at most max_origins origins, the least recently used one is evicted. Origin starts from random sequence
+    number after reboot, so number RESTART or more behind the highest one starts its window again.
+    """
+
+    def __init__(self, max_origins=32):
+        self.max_origins = max_origins
+        self.origins = {}  # {origin: [highest seq, bitmap, last use]}
+        self.clock = 0
+
+    def __len__(self):
+        return len(self.origins)
+
+    def is_duplicate(self, origin, seq):
+        """Return True if message was seen already (or is too old to tell), otherwise remember it."""
+        self.clock += 1
+        entry = self.origins.get(origin, None)
+        if entry is None:
+            if len(self.origins) >= self.max_origins:
+                self._evict()
+            self.origins[origin] = [seq, 1, self.clock]
+            return False
+        entry[2] = self.clock
+        top = entry[0]
+        ahead = (seq - top) & SEQ_MASK
+        if ahead == 0:
+            return True
+        if ahead < HALF:  # Newer message, slide window.
+            entry[1] = 1 if ahead >= WINDOW else ((entry[1] << ahead) | 1) & MASK
+            entry[0] = seq
+            return False
+        behind = (top - seq) & SEQ_MASK
+        if behind >= RESTART:  # Rebooted origin, not a copy delayed that long.
+            entry[0] = seq
+            entry[1] = 1
+            return False
+        if behind >= WINDOW:
+            return True
+        bit = 1 << behind
+        if entry[1] & bit:
+            return True
+        entry[1] |= bit
+        return False
+
+    def _evict(self):
+        oldest = None
+        for origin, entry in self.origins.items():
+            if oldest is None or entry[2] < self.origins[oldest][2]:
+                oldest = origin
+        del self.origins[oldest]
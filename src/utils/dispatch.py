@@ -0,0 +1,116 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Ordered processing of messages of one connection and bounded executor for application messages.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+DISPATCH_LEN = 8  # Messages of one connection waiting to be processed, then reader waits.
+APP_WORKERS = 4
+APP_QUEUE = 32  # Application messages waiting for worker, more are dropped.
+
+
+class Dispatcher:
+    """
+    Messages of one connection are processed one by one in order of arrival by coroutine process, so change of
+    topology can't overtake message sent before it. Reader waits in put() while capacity messages are waiting,
+    which holds the sender back by TCP.
+    """
+
+    def __init__(self, process, capacity=DISPATCH_LEN):
+        self.process = process
+        self.capacity = capacity
+        self.items = []
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self.processed = self.errors = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def start(self, loop):
+        loop.create_task(self.run())
+        return self
+
+    async def put(self, *args):
+        """Queue arguments of process, return False when dispatcher is closed."""
+        while len(self.items) >= self.capacity and not self.closed:
+            self._space.clear()
+            await self._space.wait()
+        if self.closed:
+            return False
+        self.items.append(args)
+        self._ready.set()
+        return True
+
+    async def run(self):
+        items = self.items
+        while not self.closed:
+            if not items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            args = items.pop(0)
+            self._space.set()
+            try:
+                await self.process(*args)
+            except Exception as e:  # Bad message must not stop the connection.
+                self.errors += 1
+                print("[Dispatcher] Error: ", e)
+            self.processed += 1
+
+    def close(self):
+        self.closed = True
+        self.items.clear()
+        self._ready.set()
+        self._space.set()
+
+
+class Executor:
+    """
+    Fixed number of worker tasks for calls of coroutine functions (application messages), so they don't hold back
+    messages of connection behind them. Calls over capacity are dropped and counted.
+    """
+
+    def __init__(self, workers=APP_WORKERS, capacity=APP_QUEUE):
+        self.workers = workers
+        self.capacity = capacity
+        self.calls = []
+        self._ready = asyncio.Event()
+        self.done = self.dropped = self.errors = 0
+
+    def __len__(self):
+        return len(self.calls)
+
+    def start(self, loop):
+        for _ in range(self.workers):
+            loop.create_task(self.worker())
+
+    def submit(self, func, *args):
+        """Call await func(*args) in worker, return False when it is dropped."""
+        if len(self.calls) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.calls.append((func, args))
+        self._ready.set()
+        return True
+
+    async def worker(self):
+        calls = self.calls
+        while True:
+            if not calls:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            func, args = calls.pop(0)
+            try:
+                await func(*args)
+            except Exception as e:
+                self.errors += 1
+                print("[Executor] Error: ", e)
+            self.done += 1
@@ -0,0 +1,89 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Distributed election of root node from records of neighbours (centrality, RSSI to router and MAC).
+
+from src.utils.deadlines import ticks_diff
+from src.utils.neighbours import gen_newer, GEN_MASK
+
+RSSI_STEP = 4  # dB, router RSSI closer than this is equal for election.
+CNTR_STEP = 0.1  # Centrality closer than this is equal for election.
+
+
+def score(cntr, rssi, mac):
+    """Order of candidates for root, the bigger the better: reaches router, RSSI to router, centrality, MAC."""
+    return 1 if rssi else 0, int(rssi // RSSI_STEP), int(cntr / CNTR_STEP), mac
+
+
+class Election:
+    """
+    Each node takes the best candidate of NeighbourTable. Node which is the best one of its table for hold_ms
+    declares itself root of the next term by RootElected, which is flooded through mesh. Root of newer term wins,
+    in the same term the better one. Lost root is withdrawn in its term, then nodes elect again without it.
+    Terms are 16 bit and wrap around as generations of records.
+    """
+
+    def __init__(self, own, hold_ms, diff=ticks_diff):
+        self.own = own
+        self.hold_ms = hold_ms
+        self._diff = diff
+        self.root = None
+        self.root_score = None
+        self.term = 0
+        self.lost = False  # Root of term was lost, elect again even in formed topology.
+        self.dead = None  # Lost root, it is not a candidate until it declares itself again.
+        self.best = None
+        self._since = 0
+
+    def best_of(self, table):
+        best = best_score = None
+        for mac, slot in table.index.items():
+            if mac == self.dead:
+                continue
+            candidate = score(table.cntr(slot), table.rssi(slot), mac)
+            if best_score is None or candidate > best_score:
+                best, best_score = mac, candidate
+        return best
+
+    def poll(self, table, now):
+        """True when node has no root and it has been the best candidate of table for hold_ms."""
+        if self.root is not None:
+            return False
+        best = self.best_of(table)
+        if best != self.best:
+            self.best = best
+            self._since = now
+            return False
+        return best == self.own and self._diff(now, self._since) >= self.hold_ms
+
+    def declare(self, cntr, rssi):
+        """Make this node root of the next term, return the term for RootElected."""
+        term = (self.term + 1) & GEN_MASK
+        self.adopt(self.own, cntr, rssi, term)
+        return term
+
+    def adopt(self, mac, cntr, rssi, term):
+        """Root declared in RootElected, return True when it became root here and is to be flooded further."""
+        candidate = score(cntr, rssi, mac)
+        if term == self.term:
+            if mac == self.root or (self.root is not None and candidate <= self.root_score) or \
+                    (self.lost and mac == self.dead):
+                return False
+        elif not gen_newer(term, self.term):
+            return False
+        self.root = mac
+        self.root_score = candidate
+        self.term = term
+        self.lost = False
+        self.dead = None
+        return True
+
+    def withdraw(self, mac, term):
+        """Root mac of term was lost, return True when it was root here and withdrawal is to be flooded further."""
+        if mac != self.root or term != self.term:
+            return False
+        self.root = self.root_score = self.best = None
+        self.lost = True
+        self.dead = mac
+        return True
@@ -16,7 +16,7 @@ def translate(d, t):
     # Using bytes with a throw away array instead of char below
     # to avoid ending up with the wrong key when a key in the
     # form of b'\xAA' is used.
-    return b''.join([bytes([t[x]]) for x in d])
+    return bytes([t[x] for x in d])
 
 # The size of the digests returned by HMAC depends on the underlying
 # hashing module used.  Use digest_size from the instance of HMAC instead.
@@ -129,6 +129,59 @@ class HMAC:
         h = self._current()
         return h.hexdigest()
 
+class HMACSigner:
+    """Long-lived HMAC for one key. Pads are derived once, per message only the two hashes are computed.
+    Digest is written into preallocated buffer, verify compares in place without slicing the frame.
+    """
+    blocksize = 64
+
+    def __init__(self, key, digestmod=None):
+        if not isinstance(key, (bytes, bytearray)):
+            raise TypeError("key: expected bytes or bytearray, but got %r" % type(key).__name__)
+        self.digest_cons = digestmod or _hashlib.sha256
+        if len(key) > self.blocksize:
+            key = self.digest_cons(key).digest()
+        key = key + bytes(self.blocksize - len(key))
+        self._ipad = translate(key, trans_36)
+        self._opad = translate(key, trans_5C)
+        # Where hash objects can be copied (CPython), keep hashes with pads already absorbed.
+        inner = self.digest_cons(self._ipad)
+        self._inner = inner if hasattr(inner, "copy") else None
+        self._outer = self.digest_cons(self._opad) if self._inner else None
+        self.digest_size = len(inner.digest())
+        self.digest_buf = bytearray(self.digest_size)
+
+    def digest(self, msg):
+        """Return digest of msg."""
+        if self._inner:
+            inner = self._inner.copy()
+            inner.update(msg)
+            outer = self._outer.copy()
+        else:
+            inner = self.digest_cons(self._ipad)
+            inner.update(msg)
+            outer = self.digest_cons(self._opad)
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def sign_into(self, msg, buf, offset=0):
+        """Write digest of msg into buf at offset, return offset after the digest."""
+        end = offset + self.digest_size
+        buf[offset:end] = self.digest(msg)
+        return end
+
+    def verify(self, msg, buf, offset=0):
+        """Compare digest of msg with digest stored in buf at offset, in constant time."""
+        if len(buf) - offset < self.digest_size:
+            return False
+        digest_buf = self.digest_buf
+        digest_buf[:] = self.digest(msg)
+        result = 0
+        for i in range(self.digest_size):
+            result |= digest_buf[i] ^ buf[offset + i]
+        return result == 0
+
+
 def new(key, msg=None, digestmod=None):
     """Create a new hashing object and return it.
     key: The starting key for the hash.
@@ -0,0 +1,110 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: RSSI of links to ESP-NOW peers and to router, filtered as frames arrive, and centrality of node from them.
+
+import math
+from array import array
+
+LINKS_MAX = 64
+ALPHA = 0.125  # Weight of new sample in EWMA.
+OUTLIER_DB = 12  # Sample this far from EWMA is outlier.
+OUTLIER_RUN = 3  # This many outliers in a row are new level of signal, not noise.
+RESYNC = 1024  # Centrality is summed again after this many updates, so float errors don't pile up.
+
+
+def rssi_filter(ewma, run, rssi):
+    """
+    One step of outlier filter and EWMA of link, return (ewma, run) after sample rssi.
+    run is count of outliers in a row, 0 with ewma 0.0 is link without samples.
+    """
+    if ewma == 0.0 and run == 0:
+        return float(rssi), 0
+    if abs(rssi - ewma) > OUTLIER_DB:
+        run += 1
+        if run < OUTLIER_RUN:
+            return ewma, run
+        return float(rssi), 0  # Signal moved, start from the new level.
+    return ewma + ALPHA * (rssi - ewma), 0
+
+
+def centrality_of(rssi):
+    """Contribution of link to centrality, stronger link counts more."""
+    if rssi == 0:
+        return 1.0
+    return 1 / math.sqrt(abs(rssi))
+
+
+class LinkTable:
+    """
+    Filtered RSSI of each peer heard directly, in parallel arrays with dict MAC -> slot as NeighbourTable.
+    Centrality (sum of centrality_of() over links) is kept up to date by adding difference of changed link.
+    Router RSSI goes through the same filter, but is not part of centrality.
+    """
+
+    def __init__(self, capacity=LINKS_MAX):
+        self.capacity = capacity
+        self.index = {}  # {mac: slot}
+        self._ewma = array('f', bytearray(4 * capacity))
+        self._run = bytearray(capacity)
+        self._time = array('I', bytearray(4 * capacity))
+        self._share = array('f', bytearray(4 * capacity))  # centrality_of() of link.
+        self._free = list(range(capacity - 1, -1, -1))
+        self.centrality = 0.0
+        self._updates = 0
+        self.router_rssi = 0.0
+        self._router_run = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, mac):
+        return mac in self.index
+
+    def sample(self, mac, rssi, t=None):
+        """
+        Add RSSI of frame from mac, t is time of frame from espnow, the same frame is counted once.
+        Return filtered RSSI of link, None when table is full or sample was already counted.
+        """
+        slot = self.index.get(mac, None)
+        if slot is None:
+            if not self._free:
+                return None
+            slot = self._free.pop()
+            self.index[mac] = slot
+            self._ewma[slot] = 0.0
+            self._run[slot] = 0
+            self._share[slot] = 0.0
+        elif t is not None and self._time[slot] == t:
+            return None
+        if t is not None:
+            self._time[slot] = t
+        ewma, self._run[slot] = rssi_filter(self._ewma[slot], self._run[slot], rssi)
+        self._ewma[slot] = ewma
+        self._set_share(slot, centrality_of(self._ewma[slot]))
+        return self._ewma[slot]
+
+    def sample_router(self, rssi):
+        self.router_rssi, self._router_run = rssi_filter(self.router_rssi, self._router_run, rssi)
+        return self.router_rssi
+
+    def _set_share(self, slot, share):
+        self.centrality += share - self._share[slot]
+        self._share[slot] = share
+        self._updates += 1
+        if self._updates >= RESYNC:
+            self._updates = 0
+            self.centrality = sum(self._share[s] for s in self.index.values())
+
+    def remove(self, mac):
+        slot = self.index.pop(mac, None)
+        if slot is not None:
+            self._set_share(slot, 0.0)
+            self._free.append(slot)
+        return slot
+
+    def rssi(self, mac):
+        """Filtered RSSI of link, None for unknown peer."""
+        slot = self.index.get(mac, None)
+        return None if slot is None else self._ewma[slot]
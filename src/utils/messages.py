@@ -8,6 +8,8 @@ import gc
 import json
 import struct
 
+from src.utils import binpack
+
 try:
     import uasyncio as asyncio
     from ubinascii import hexlify, unhexlify
@@ -32,25 +34,32 @@ class Esp_Type:
     OBTAIN_CREDS = 2
     SEND_WIFI_CREDS = 3
     ROOT_ELECTED = 4
+    NEIGHBOUR_DIGEST = 5
+    ASK_WIFI_CREDS = 6
 
 
 # Periodic advertisment to the broadcast
 class Advertise:
     type = Esp_Type.ADVERTISE
+    __slots__ = ("id", "mesh_cntr", "rssi", "tree_root_elected", "ttl", "gen")  # Order of fields on the wire.
 
-    def __init__(self, iid, cntr, rssi, tree_root_elected: bool, ttl: int):
+    def __init__(self, iid, cntr, rssi, tree_root_elected: bool, ttl: int, gen: int = 0):
         self.id = iid
         self.mesh_cntr = cntr
         self.rssi = rssi
         self.tree_root_elected = tree_root_elected
         self.ttl = ttl
+        self.gen = gen  # Generation, node increases it periodically so others far away know it is alive.
+
+    def values(self):
+        return self.id, self.mesh_cntr, self.rssi, self.tree_root_elected, self.ttl, self.gen
 
     async def process(self, core: "EspnowCore"):
         core.on_advertise(self)
 
     def __repr__(self):
         return f"Node_ID: {self.id} Centrality: {self.mesh_cntr} " + \
-               f"RSSI: {self.rssi} IsRoot {self.tree_root_elected} TTL: {self.ttl}"
+               f"RSSI: {self.rssi} IsRoot {self.tree_root_elected} TTL: {self.ttl} Gen: {self.gen}"
 
 
 """
@@ -77,12 +86,16 @@ class ObtainCreds:
     OBTAIN = 2
     RESPOND = 3
     UNREG = 4
+    __slots__ = ("aflag", "asrc_addr", "creds")
 
     def __init__(self, aflag, asrc_addr, creds=32 * b'\x00'):
         self.aflag = aflag
         self.asrc_addr = asrc_addr
         self.creds = creds
 
+    def values(self):
+        return self.aflag, self.asrc_addr, self.creds
+
     async def process(self, core: "EspnowCore"):
         instruction = ObtainCreds_methods.get(self.aflag, None)
         if instruction:
@@ -123,6 +136,7 @@ ObtainCreds_methods = {
 # For sending ciphered credentials to child nodes to connect to WiFi
 class SendWifiCreds:
     type = Esp_Type.SEND_WIFI_CREDS
+    __slots__ = ("adst_node", "bessid_length", "cessid", "zpasswd")
 
     def __init__(self, dst_node, length_essid, essid, passwd, key=None):
         self.adst_node = dst_node
@@ -130,67 +144,219 @@ class SendWifiCreds:
         self.cessid = essid  # It has 16 chars because it is already encrypted by AES.
         self.zpasswd = passwd  # It has 16 chars because it is already encrypted by AES.
 
+    def values(self):
+        return self.adst_node, self.bessid_length, self.cessid, self.zpasswd
+
     async def process(self, core: "EspnowCore"):
         core.on_send_wifi_creds(self)
 
 
+# Root declared (tree_root_elected True) or withdrawn (False) in term carried in gen, flooded through mesh.
 class RootElected(Advertise):
     type = Esp_Type.ROOT_ELECTED
+    __slots__ = ()
+
+    async def process(self, core: "EspnowCore"):
+        core.on_root_elected(self)
+
+
+# Digest of neighbour database, records are exchanged only for buckets where digests of neighbours differ.
+class NeighbourDigest:
+    type = Esp_Type.NEIGHBOUR_DIGEST
+    __slots__ = ("id", "buckets")
+
+    def __init__(self, iid, buckets):
+        self.id = iid
+        self.buckets = buckets  # Hash of each bucket of records, NeighbourTable.digest().
+
+    def values(self):
+        return self.id, self.buckets
 
     async def process(self, core: "EspnowCore"):
-        await asyncio.sleep(0.30)
+        core.on_digest(self)
+
+    def __repr__(self):
+        return f"Node_ID: {self.id} Digest: {self.buckets}"
+
+
+# Node looking for parent asks node in tree to claim it, answer is SendWifiCreds with credentials of its AP.
+class AskWifiCreds:
+    type = Esp_Type.ASK_WIFI_CREDS
+    __slots__ = ("dst", "id")
+
+    def __init__(self, dst, iid):
+        self.dst = dst
+        self.id = iid
+
+    def values(self):
+        return self.dst, self.id
+
+    async def process(self, core: "EspnowCore"):
+        core.on_ask_wifi_creds(self)
+
+    def __repr__(self):
+        return f"DST: {self.dst} Node_ID: {self.id}"
 
 
 ESP_PACKETS = {
-    Esp_Type.ADVERTISE: (Advertise, "!6sffBi"),
+    Esp_Type.ADVERTISE: (Advertise, "!6sffBiH"),
     Esp_Type.OBTAIN_CREDS: (ObtainCreds, "!B6s32s"),
     Esp_Type.SEND_WIFI_CREDS: (SendWifiCreds, "!6sh16s16s"),
-    Esp_Type.ROOT_ELECTED: (RootElected, "!6shf"),
+    Esp_Type.ROOT_ELECTED: (RootElected, "!6sffBiH"),  # Same fields as Advertise.
+    Esp_Type.NEIGHBOUR_DIGEST: (NeighbourDigest, "!6s32s"),
+    Esp_Type.ASK_WIFI_CREDS: (AskWifiCreds, "!6s6s"),
 }
 
+ESP_FRAME_SIZE = 250  # Maximal length of ESP-NOW frame.
+
+
+class EspCodec:
+    """
+    One entry of ESP_PACKETS compiled once. Field order on the wire is given by values() of the message class,
+    which must match its pattern and the arguments of its constructor, first byte of the packed message is its type.
+    """
+    __slots__ = ("type", "klass", "pattern", "size")
+
+    def __init__(self, msg_type, klass, pattern):
+        self.type = msg_type
+        self.klass = klass
+        self.pattern = pattern
+        self.size = struct.calcsize(pattern) + 1  # With type byte.
+
+    def pack_into(self, buf, offset, obj):
+        """Write obj into buf at offset, return offset after the message."""
+        buf[offset] = self.type
+        struct.pack_into(self.pattern, buf, offset + 1, *obj.values())
+        return offset + self.size
+
+    def unpack_from(self, buf, offset=0):
+        return self.klass(*struct.unpack_from(self.pattern, buf, offset + 1))
+
+
+ESP_CODECS = {msg_type: EspCodec(msg_type, klass, pattern) for msg_type, (klass, pattern) in ESP_PACKETS.items()}
+
+
+class EspAggregator:
+    """
+    Packs several ESP-NOW messages one after another into one frame, which is then signed by one HMAC.
+    Messages have fixed size given by their type, so receiver splits them without any extra header.
+    """
+
+    def __init__(self, capacity):
+        self.buf = bytearray(ESP_FRAME_SIZE)
+        self.view = memoryview(self.buf)
+        self.capacity = capacity  # Room for messages, rest of the frame is left for digest.
+        self.end = 0
+
+    def add(self, obj):
+        """Pack obj behind queued messages, return its view or None when frame is full."""
+        codec = ESP_CODECS[obj.type]
+        start = self.end
+        if start + codec.size > self.capacity:
+            return None
+        self.end = codec.pack_into(self.buf, start, obj)
+        return self.view[start:self.end]
+
+    def clear(self):
+        self.end = 0
+
+
+# Split body of received frame into message objects.
+def iter_espmessages(msg):
+    i = 0
+    length = len(msg)
+    while i < length:
+        codec = ESP_CODECS.get(msg[i], None)
+        if codec is None or i + codec.size > length:
+            return
+        yield codec.unpack_from(msg, i)
+        i += codec.size
+
+
+def espframe_types(frame, digest_size):
+    """
+    Cheap check of received frame before its HMAC. Return bit mask (1 << type) of messages in frame, 0 when some type
+    is unknown or their sizes with digest don't add up to length of frame.
+    """
+    end = len(frame) - digest_size
+    i = types = 0
+    while i < end:
+        codec = ESP_CODECS.get(frame[i], None)
+        if codec is None:
+            return 0
+        types |= 1 << codec.type
+        i += codec.size
+    return types if i == end else 0
+
+
+# Pack msg into reusable buffer (bytearray of ESP_FRAME_SIZE) without allocating, return end offset.
+def pack_espmessage_into(buf, offset, obj):
+    return ESP_CODECS[obj.type].pack_into(buf, offset, obj)
+
 
 # Pack msg into bytes.
 def pack_espmessage(obj):
-    klass, pattern = ESP_PACKETS[obj.type]
-    msg = struct.pack('B', obj.type) + struct.pack(pattern, *[x[1] for x in sorted(obj.__dict__.items())])
-    dprint("pack_espmessage: ", msg)
-    return msg
+    codec = ESP_CODECS[obj.type]
+    buf = bytearray(codec.size)
+    codec.pack_into(buf, 0, obj)
+    dprint("pack_espmessage: ", buf)
+    return bytes(buf)
 
 
 # Unpack received message from bytes into Object and process message.
-async def unpack_espmessage(msg, core: "EspnowCore"):
-    msg_type = msg[0]
-    klass, pattern = ESP_PACKETS[msg_type]
-    obj = klass(*struct.unpack(pattern, msg[1:]))
-    dprint("unpack_espmessage: ", pattern, obj)
+async def unpack_espmessage(msg, core: "EspnowCore", offset=0):
+    codec = ESP_CODECS[msg[offset]]
+    obj = codec.unpack_from(msg, offset)
+    dprint("unpack_espmessage: ", codec.pattern, obj)
     await obj.process(core)
     return obj
 
 
 ### WIFI messages for mesh
-# In JSON with structure:
+# Binary frame (default between nodes):
+# | magic 0xA5 | flag | src 6B | dst 6B | ttl | seq 2B | body length 2B | body (binpack of 'msg') |
+# src is the origin of the message, seq numbers broadcasts of the origin (0 when not used).
+# JSON line (fallback for user app, connected-app.py), chosen by the peer by the first byte:
 # {'src':'\xxx',
 # 'dst' : '\xxx',
 # 'flag': Num,
 # 'msg' : Payload
 # }
 
+WIFI_MAGIC = 0xA5
+WIFI_HEADER = "!BB6s6sBHH"
+WIFI_HEADER_SIZE = struct.calcsize(WIFI_HEADER)
+WIFI_SRC_OFFSET = 2
+WIFI_DST_OFFSET = 8  # Offset of dst in the header, routing needs only dst and ttl.
+WIFI_TTL_OFFSET = 14  # Offset of ttl byte in the header.
+WIFI_SEQ_OFFSET = 15
+WIFI_TTL = 16  # Hops a frame can make, more than depth of any tree in the mesh.
+WIFI_BUF_SIZE = 1024  # Reusable receive buffer per connection, bigger frames get one-off buffer.
+PARENT = "parent"  # Destination of beacons from child to parent.
+TC_CONTROL = 0  # Traffic class of topology messages, beacons and uplink rates, sent before application ones.
+TC_APP = 1  # Traffic class of AppMessage, sources share the link fairly.
+_NO_MAC = 6 * b'\x00'  # On the wire for PARENT or unknown source.
+
+
 class WIFIMSG:
     TOPOLOGY_PROPAGATE = 1
     TOPOLOGY_CHANGED = 2
     CLAIM_CHILD_REQUEST = 3
     CLAIM_CHILD_RESPONSE = 4
     APP = 5
+    UPLINK_RATE = 6
 
 
 class WifiMSGBase:
     def __init__(self, src, dst):
         self.packet = {"src": src, "dst": dst}
+        self.seq = 0  # Broadcast sequence number of the origin, carried only in binary frame header.
 
 
 class TopologyPropagate(WifiMSGBase):
     """
-    Sends root periodically to all other nodes.
+    Parent sends periodically to each child: version and hash of topology, delta or snapshot when child is behind.
+    Child sends it to parent as beacon with version and hash of topology it has.
     """
     type = WIFIMSG.TOPOLOGY_PROPAGATE
 
@@ -210,6 +376,8 @@ class TopologyPropagate(WifiMSGBase):
 class TopologyChanged(WifiMSGBase):
     """
     Nodes send update when new node have been added or some node failed down. Sends to root and root then propagates.
+    Message is {"op": TOPOLOGY_ADD or TOPOLOGY_DEL, "node": child, "parent": reporting node}. Node which found new
+    parent reports {"op": TOPOLOGY_MOVE, "node": itself, "parent": new parent, "edges": Tree.edges_below()}.
     """
     type = WIFIMSG.TOPOLOGY_CHANGED
 
@@ -231,32 +399,170 @@ class AppMessage(WifiMSGBase):
         self.packet["msg"] = app_msg
 
     async def process(self, wificore: "wificore.WifiCore"):
-        app = wificore.app
-        wificore.loop.create_task(app.process(self))
+        wificore.app_executor.submit(wificore.app.process, self)  # Bounded, connection goes on meanwhile.
+
+
+class UplinkRate(WifiMSGBase):
+    """
+    Parent tells child rate of application frames (per second) it lets through from the child's subtree, whenever
+    it changes by congestion of the parent's uplink (AIMD). Child keeps to it and tells its children their shares.
+    """
+    type = WIFIMSG.UPLINK_RATE
+
+    def __init__(self, src, dst, rate, flag=WIFIMSG.UPLINK_RATE):
+        super().__init__(src, dst)
+        self.packet["flag"] = flag
+        self.packet["msg"] = rate
+
+    async def process(self, wificore: "wificore.WifiCore"):
+        wificore.on_uplink_rate(self)
 
 
 WIFI_PACKETS = {
     WIFIMSG.TOPOLOGY_PROPAGATE: TopologyPropagate,
     WIFIMSG.TOPOLOGY_CHANGED: TopologyChanged,
-    WIFIMSG.APP: AppMessage
+    WIFIMSG.APP: AppMessage,
+    WIFIMSG.UPLINK_RATE: UplinkRate
 }
 
 
-# Prepare WiFi message to be sent
+def _mac_to_wire(mac):
+    if not mac or mac == PARENT:
+        return _NO_MAC
+    return unhexlify(mac)
+
+
+def _mac_from_wire(mac, default):
+    if mac == _NO_MAC:
+        return default
+    return hexlify(mac).decode()
+
+
+# Prepare WiFi message to be sent as JSON line.
 def pack_wifimessage(obj):
     j = json.dumps(obj.packet)
     return j
 
 
+# Prepare WiFi message to be sent as binary frame.
+def pack_wififrame(obj, ttl=WIFI_TTL):
+    p = obj.packet
+    buf = bytearray(WIFI_HEADER_SIZE)
+    binpack.dump_into(p["msg"], buf)
+    struct.pack_into(WIFI_HEADER, buf, 0, WIFI_MAGIC, p["flag"], _mac_to_wire(p["src"]), _mac_to_wire(p["dst"]),
+                     ttl, obj.seq, len(buf) - WIFI_HEADER_SIZE)
+    return buf
+
+
+def is_wififrame(msg):
+    return msg[0] == WIFI_MAGIC
+
+
+def frame_dst(msg):
+    """Destination of binary frame read from the header only, payload is left undecoded."""
+    return _mac_from_wire(bytes(msg[WIFI_DST_OFFSET:WIFI_DST_OFFSET + 6]), PARENT)
+
+
+def frame_origin_seq(msg):
+    """Origin (6B MAC) and sequence number of binary frame read from the header only."""
+    return bytes(msg[WIFI_SRC_OFFSET:WIFI_SRC_OFFSET + 6]), struct.unpack_from("!H", msg, WIFI_SEQ_OFFSET)[0]
+
+
+def message_flag(msg):
+    """Flag (WIFIMSG) of message object, of binary frame from the header, of JSON line by decoding it."""
+    if isinstance(msg, WifiMSGBase):
+        return msg.packet["flag"]
+    if is_wififrame(msg):
+        return msg[1]
+    return decode_wifimessage(msg).packet["flag"]
+
+
+def traffic_class(msg):
+    """TC_APP for AppMessage, TC_CONTROL for the others."""
+    return TC_APP if message_flag(msg) == WIFIMSG.APP else TC_CONTROL
+
+
+def message_origin(msg):
+    """Source node of message object, of binary frame from the header, of JSON line by decoding it."""
+    if isinstance(msg, WifiMSGBase):
+        return msg.packet["src"]
+    if is_wififrame(msg):
+        return _mac_from_wire(bytes(msg[WIFI_SRC_OFFSET:WIFI_SRC_OFFSET + 6]), None)
+    return decode_wifimessage(msg).packet["src"]
+
+
+def decrement_ttl(msg):
+    """Decrement ttl of binary frame in place before forwarding, False when frame must be dropped."""
+    if not is_wififrame(msg):
+        return True
+    if msg[WIFI_TTL_OFFSET] <= 1:
+        return False
+    msg[WIFI_TTL_OFFSET] -= 1
+    return True
+
+
+# Create WiFi message object from binary frame or JSON line without processing it.
+def decode_wifimessage(msg):
+    seq = 0
+    if is_wififrame(msg):
+        _, flag, src, dst, _, seq, _ = struct.unpack_from(WIFI_HEADER, msg, 0)
+        src = _mac_from_wire(src, None)
+        dst = _mac_from_wire(dst, PARENT)
+        body = binpack.loads(msg, WIFI_HEADER_SIZE)
+    else:
+        d = json.loads(msg)
+        flag, src, dst, body = d["flag"], d["src"], d["dst"], d["msg"]
+    klass = WIFI_PACKETS[flag]
+    obj = klass(src, dst, body)
+    obj.seq = seq
+    return obj
+
+
 # Unpack received WiFi message and process it.
 async def unpack_wifimessage(msg, core: "wificore.WifiCore"):
-    d = json.loads(msg)
-    klass = WIFI_PACKETS[d["flag"]]
-    obj = klass(d["src"], d["dst"], d["msg"])
+    obj = decode_wifimessage(msg)
     await obj.process(core)
     return obj
 
 
+async def readexactly_into(readinto, view, n):
+    """Fill memoryview with exactly n bytes by readinto of stream, raise EOFError when stream ends."""
+    got = 0
+    while got < n:
+        k = await readinto(view[got:n])
+        if not k:
+            raise EOFError
+        got += k
+
+
+async def read_wifimessage(reader, buf):
+    """
+    Read one message from stream. Binary frame is read by exact lengths into reusable bytearray buf and returned
+    as memoryview valid until the next read. JSON line is returned as bytes. Return b'' when stream is closed.
+    """
+    readinto = getattr(reader, "readinto", None)  # Stream without it (CPython) reads by readexactly.
+    try:
+        if readinto is None:
+            buf[:WIFI_HEADER_SIZE] = await reader.readexactly(WIFI_HEADER_SIZE)  # Raises EOFError subclass.
+        else:
+            await readexactly_into(readinto, memoryview(buf), WIFI_HEADER_SIZE)
+    except EOFError:
+        return b''
+    if buf[0] != WIFI_MAGIC:  # JSON line fallback, any JSON line is longer than the header.
+        return bytes(buf[:WIFI_HEADER_SIZE]) + await reader.readline()
+    size = WIFI_HEADER_SIZE + (buf[WIFI_HEADER_SIZE - 2] << 8 | buf[WIFI_HEADER_SIZE - 1])  # Body length.
+    if size > len(buf):  # Frame does not fit into reusable buffer.
+        header = buf[:WIFI_HEADER_SIZE]
+        buf = bytearray(size)
+        buf[:WIFI_HEADER_SIZE] = header
+    view = memoryview(buf)
+    if readinto is None:
+        view[WIFI_HEADER_SIZE:size] = await reader.readexactly(size - WIFI_HEADER_SIZE)
+    else:
+        await readexactly_into(readinto, view[WIFI_HEADER_SIZE:], size - WIFI_HEADER_SIZE)
+    return view[:size]
+
+
 async def main():
     idn = b'\xff\xff\xff\xff\xff\xa0'  # machine.unique_id()
     cntr = 1452
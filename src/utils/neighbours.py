@@ -0,0 +1,274 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Fixed capacity table of ESP-NOW neighbours stored in preallocated parallel arrays.
+
+import struct
+from array import array
+
+from src.utils.deadlines import Deadlines, ticks_ms, ticks_diff
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+NEIGHBOURS_MAX = 64
+TTL_MAX = 255
+BUCKETS = 8  # Digest has one hash per bucket, bucket of record is given by last byte of MAC.
+DIGEST_PATTERN = "!8I"
+GEN_MASK = 0xffff  # Generations of records are 16 bit and wrap around.
+GEN_HALF = 0x8000
+CHANGED = 1  # Record is forwarded unless k others forwarded it.
+ASKED = 2  # Record is forwarded anyway, some neighbour may miss it.
+
+
+def gen_newer(a, b):
+    """True when generation a is newer than b."""
+    return 0 < ((a - b) & GEN_MASK) < GEN_HALF
+
+
+def bucket_of(mac):
+    return mac[5] % BUCKETS
+
+
+def record_hash(mac, root):
+    return crc32(b'\x01' if root else b'\x00', crc32(mac))
+
+
+class NeighbourTable:
+    """
+    Neighbours from Advertise messages, each one has a slot in parallel arrays and dict MAC -> slot.
+    Advertisement of known neighbour is written into its slot in place, no new record is allocated.
+    With timeout_ms, neighbour not heard for that long is removed by expire(), own record never expires.
+    Records heard through others (ttl > 0) expire after far_timeout_ms, they are refreshed only by new generation
+    from their node. From half of that time record not refreshed is forwarded again every quarter of it, so
+    neighbour with newer generation answers with it. Expired record leaves tombstone with its generation for far_timeout_ms, so stale
+    copies of it from others are not taken back.
+    Each record counts forwards of it heard from others since last to_forward(), for Trickle suppression.
+    Digest of table is XOR of record hashes (MAC, root flag) in each bucket, kept as records change. Generation is
+    left out, it changes all the time and is spread by forwards of changed records, digest is for membership.
+    """
+
+    def __init__(self, capacity=NEIGHBOURS_MAX, timeout_ms=0, own=None, clock=ticks_ms, diff=ticks_diff,
+                 far_timeout_ms=0):
+        self.capacity = capacity
+        self.timeout_ms = timeout_ms
+        self.far_timeout_ms = far_timeout_ms or timeout_ms
+        self.own = own
+        self._clock = clock
+        self._diff = diff
+        self.deadlines = Deadlines(clock, diff)  # Expiry checks, one per neighbour.
+        self.tombstones = {}  # {mac: generation} of expired records.
+        self._tombstone_deadlines = Deadlines(clock, diff)
+        self.buckets = array('I', bytearray(4 * BUCKETS))
+        self.index = {}  # {mac: slot}
+        self._macs = [None] * capacity
+        self._cntr = array('f', bytearray(4 * capacity))
+        self._rssi = array('f', bytearray(4 * capacity))
+        self._root = bytearray(capacity)
+        self._ttl = bytearray(capacity)
+        self._last_rx = array('I', bytearray(4 * capacity))
+        self._last_tx = array('I', bytearray(4 * capacity))
+        self._gen = array('H', bytearray(2 * capacity))
+        self._hash = array('I', bytearray(4 * capacity))
+        self._fresh = bytearray(capacity)  # CHANGED or ASKED since record was last forwarded.
+        self._heard = bytearray(capacity)  # Forwards of record heard from others.
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, mac):
+        return mac in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def slot(self, mac):
+        return self.index.get(mac, None)
+
+    def update(self, adv, last_rx, last_tx):
+        """
+        Save values of Advertise, return slot or None when table is full.
+        Record is marked to be forwarded when it is new or its generation, root flag or ttl changed.
+        Known neighbour which did not change (the common case) only has its slot written.
+        """
+        root = 1 if adv.tree_root_elected else 0
+        ttl = adv.ttl if adv.ttl < TTL_MAX else TTL_MAX
+        slot = self.index.get(adv.id, None)
+        if slot is None:
+            slot = self._add(adv.id, root, ttl)
+            if slot is None:
+                return None
+            self._gen[slot] = adv.gen
+        elif root != self._root[slot] or adv.gen != self._gen[slot] or ttl < self._ttl[slot]:
+            if root != self._root[slot]:
+                self._rehash(slot, record_hash(adv.id, root))
+                self._root[slot] = root
+            if not self._fresh[slot]:
+                self._fresh[slot] = CHANGED
+            self._gen[slot] = adv.gen
+        self._cntr[slot] = adv.mesh_cntr
+        self._rssi[slot] = adv.rssi
+        self._ttl[slot] = ttl
+        self._last_rx[slot] = last_rx
+        self._last_tx[slot] = last_tx
+        return slot
+
+    def _add(self, mac, root, ttl):
+        """Slot for new neighbour, None when table is full."""
+        if not self._free:
+            return None
+        slot = self._free.pop()
+        self.index[mac] = slot
+        self._macs[slot] = mac
+        self.tombstones.pop(mac, None)
+        self._tombstone_deadlines.cancel(mac)
+        if self.timeout_ms and mac != self.own:
+            self.deadlines.schedule(mac, self._timeout(ttl) // (2 if ttl else 1))
+        self._hash[slot] = 0
+        self._rehash(slot, record_hash(mac, root))
+        self._root[slot] = root
+        if not self._fresh[slot]:
+            self._fresh[slot] = CHANGED
+        return slot
+
+    def _rehash(self, slot, new):
+        bucket = bucket_of(self._macs[slot])
+        self.buckets[bucket] ^= self._hash[slot] ^ new
+        self._hash[slot] = new
+
+    def _timeout(self, ttl):
+        return self.timeout_ms if ttl == 0 else self.far_timeout_ms
+
+    def remove(self, mac):
+        slot = self.index.pop(mac, None)
+        if slot is not None:
+            self._rehash(slot, 0)
+            self._macs[slot] = None
+            self._heard[slot] = 0
+            self._free.append(slot)
+            self.deadlines.cancel(mac)
+        return slot
+
+    def expire(self):
+        """
+        Remove neighbours not heard for timeout_ms, return their MACs. Records heard through others are
+        marked to be forwarded from half of their timeout.
+        Only neighbours whose check is due are touched, the ones heard since get next check.
+        """
+        expired = []
+        deadlines = self.deadlines
+        now = self._clock()
+        for mac in self._tombstone_deadlines.pop_due():
+            del self.tombstones[mac]
+        for mac in deadlines.pop_due():
+            slot = self.index[mac]
+            age = self._diff(now, self._last_rx[slot])
+            timeout = self._timeout(self._ttl[slot])
+            if age > timeout:
+                self.tombstones[mac] = self._gen[slot]
+                self._tombstone_deadlines.schedule(mac, self.far_timeout_ms)
+                self.remove(mac)
+                expired.append(mac)
+            elif self._ttl[slot] and age < timeout // 2:
+                deadlines.schedule(mac, timeout // 2 - age)
+            elif self._ttl[slot]:
+                self._fresh[slot] = ASKED
+                deadlines.schedule(mac, min(timeout // 4, timeout - age + 1))
+            else:
+                deadlines.schedule(mac, timeout - age + 1)
+        return expired
+
+    def next_expiry_ms(self):
+        """Time until next neighbour or tombstone can expire, None when there are none."""
+        wait = self.deadlines.wait_ms()
+        tombstone = self._tombstone_deadlines.wait_ms()
+        if wait is None or (tombstone is not None and tombstone < wait):
+            return tombstone
+        return wait
+
+    def is_stale(self, mac, gen):
+        """Record of expired node which is not newer than the expired one."""
+        tombstone = self.tombstones.get(mac, None)
+        return tombstone is not None and not gen_newer(gen, tombstone)
+
+    def digest(self):
+        return struct.pack(DIGEST_PATTERN, *self.buckets)
+
+    def differing_buckets(self, digest):
+        """Buckets where digest of other node differs from own."""
+        theirs = struct.unpack(DIGEST_PATTERN, digest)
+        return [bucket for bucket in range(BUCKETS) if theirs[bucket] != self.buckets[bucket]]
+
+    def mark_bucket(self, bucket):
+        """Forward all records of bucket at the next transmission."""
+        for mac, slot in self.index.items():
+            if bucket_of(mac) == bucket:
+                self._fresh[slot] = ASKED
+
+    def fill_advertise(self, slot, adv):
+        """Write record into existing Advertise object, to resend it without allocation of new one."""
+        adv.id = self._macs[slot]
+        adv.mesh_cntr = self._cntr[slot]
+        adv.rssi = self._rssi[slot]
+        adv.tree_root_elected = bool(self._root[slot])
+        adv.ttl = self._ttl[slot]
+        adv.gen = self._gen[slot]
+        return adv
+
+    def with_ttl(self, ttl):
+        """MACs of neighbours with given ttl, 0 are the ones heard directly."""
+        return [mac for mac, slot in self.index.items() if self._ttl[slot] == ttl]
+
+    def mark_asked(self, slot):
+        """Forward record at the next transmission, also when others forwarded it."""
+        self._fresh[slot] = ASKED
+
+    def heard_forward(self, slot):
+        if self._heard[slot] < TTL_MAX:
+            self._heard[slot] += 1
+
+    def to_forward(self, k):
+        """
+        Slots of records asked for and records changed since last call and forwarded by less than k others
+        meanwhile. Counters start again for the next interval.
+        """
+        slots = []
+        fresh = self._fresh
+        heard = self._heard
+        for mac, slot in self.index.items():
+            if (fresh[slot] == ASKED or fresh[slot] and heard[slot] < k) and mac != self.own:
+                slots.append(slot)
+            fresh[slot] = 0
+            heard[slot] = 0
+        return slots
+
+    def mac(self, slot):
+        return self._macs[slot]
+
+    def cntr(self, slot):
+        return self._cntr[slot]
+
+    def rssi(self, slot):
+        return self._rssi[slot]
+
+    def root(self, slot):
+        return bool(self._root[slot])
+
+    def ttl(self, slot):
+        return self._ttl[slot]
+
+    def gen(self, slot):
+        return self._gen[slot]
+
+    def last_rx(self, slot):
+        return self._last_rx[slot]
+
+    def last_tx(self, slot):
+        return self._last_tx[slot]
+
+    def set_last_tx(self, slot, t):
+        self._last_tx[slot] = t
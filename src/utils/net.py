@@ -8,15 +8,18 @@ import gc
 
 try:
     import uasyncio as asyncio
-    from uasyncio import StreamReader
-    import network
-    from esp import espnow
 except ImportError:
     import asyncio
-    from asyncio import StreamReader
+try:
+    import network
+    from esp import espnow
+except ImportError:  # CPython, tests put their stand-in of network.WLAN in place.
+    network = espnow = None
 gc.collect()
 
 DEBUG = True
+POLL_FIRST_MS = 10
+POLL_MAX_MS = 160
 
 
 def dprint(*args):
@@ -24,6 +27,17 @@ def dprint(*args):
         print(*args)
 
 
+async def wait_until(condition):
+    """
+    Wait until condition() is true. WLAN driver has no events to wait for, so it is polled, soon at first and
+    less often later.
+    """
+    wait = POLL_FIRST_MS
+    while not condition():
+        await asyncio.sleep(wait / 1000)
+        wait = min(2 * wait, POLL_MAX_MS)
+
+
 class Net:
     def __init__(self, mode, channel=1):
         self.mode = mode
@@ -53,17 +67,15 @@ class Net:
         wlan = self.wlan
         if not wlan.isconnected():
             wlan.connect(ssid, password)
-            while not wlan.isconnected():
-                dprint("Connecting to WIFI on STA_IF")
-                await asyncio.sleep_ms(100)
+            dprint("Connecting to WIFI on STA_IF")
+            await wait_until(wlan.isconnected)
         dprint("Connected on STA_IF")
         return wlan
 
     async def ap_wifi(self, ssid, password=""):
         wlan = self.wlan
         wlan.config(essid=ssid, password=password)  # set the ESSID of the access point
-        while not wlan.active():
-            await asyncio.sleep_ms(100)
+        await wait_until(wlan.active)
         dprint("Created AP")
         return wlan
 
@@ -73,12 +85,13 @@ class ESP:
         self.esp = espnow.ESPNow()
         self.esp.config(rxbuf=2048)
         self.esp.init()
-        self.stream_reader = StreamReader(self.esp)
 
     def set_pmk(self, pmk):
         self.esp.set_pmk(pmk)
 
-    def add_peer(self, peer, lmk=None, channel=0, ifidx=network.AP_IF, encrypt=False):
+    def add_peer(self, peer, lmk=None, channel=0, ifidx=None, encrypt=False):
+        if ifidx is None:
+            ifidx = network.AP_IF
         try:
             return self.esp.add_peer(peer, lmk, channel, ifidx, encrypt)
         except OSError as e:
@@ -105,11 +118,16 @@ class ESP:
         else:
             return self.esp.send(peer, msg)
 
-    async def read(self, size):
-        return await self.stream_reader.read(size)
+    def peer_rssi(self, peer):
+        """[rssi, time_ms] of the last frame from peer in espnow peers_table, None when it is not there."""
+        try:
+            return self.esp.peers_table[peer]
+        except (AttributeError, KeyError):
+            return None
 
-    def irecv(self):
-        return self.esp.irecv()
+    def irecv(self, timeout_ms=0):
+        """(peer, msg) of the next frame in buffers reused by driver, (None, None) when there is none."""
+        return self.esp.irecv(timeout_ms)
 
     def recv(self):
         return self.esp.recv()
@@ -0,0 +1,145 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Rate of application traffic up the tree, token bucket for each child and AIMD of uplink rate.
+
+from src.utils.deadlines import ticks_ms, ticks_diff
+
+BURST_S = 0.2  # Bucket holds tokens for this long of its rate.
+DECREASE = 0.75  # Multiplicative decrease of uplink rate on congestion.
+
+
+class TokenBucket:
+    """Rate in frames per second, up to burst frames are let through at once."""
+
+    def __init__(self, rate, burst, now, diff=ticks_diff):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+        self._diff = diff
+
+    def take(self, now):
+        """Take token for one frame, False when there is none (frame is over the rate)."""
+        self.tokens = min(self.burst, self.tokens + self._diff(now, self.last) * self.rate / 1000)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Aimd:
+    """
+    Rate which grows by increase each period without congestion up to limit (given by parent) and is multiplied
+    by DECREASE on congestion, at most once per hold_ms (congestion signals of one episode come in several periods).
+    """
+
+    def __init__(self, rate, min_rate, max_rate, increase, hold_ms, diff=ticks_diff):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.limit = max_rate
+        self.increase_by = increase
+        self.hold_ms = hold_ms
+        self._diff = diff
+        self._decreased = None
+
+    def increase(self):
+        self.rate = min(self.limit, self.rate + self.increase_by)
+
+    def decrease(self, now):
+        """Return False when rate was decreased within hold_ms already."""
+        if self._decreased is not None and self._diff(now, self._decreased) < self.hold_ms:
+            return False
+        self._decreased = now
+        self.rate = max(self.min_rate, self.rate * DECREASE)
+        return True
+
+    def set_limit(self, limit):
+        self.limit = max(self.min_rate, min(self.max_rate, limit))
+        self.rate = min(self.rate, self.limit)
+
+
+class RateControl:
+    """
+    Application frames a node sends up to its parent are limited by uplink (Aimd) and by rate the parent allows.
+    It is shared by weights, e.g. size of their subtrees, among children and the node itself (key own) which sent
+    something in the last period, so share of idle one is not wasted, and each share is enforced by its TokenBucket.
+    Children are told their share (advertise) when it changes, so congestion on uplink of any node slows down
+    sources below it before queues overflow and children don't send more than their parent lets through.
+    """
+
+    def __init__(self, own, rate, min_rate, max_rate, increase, hold_ms, clock=ticks_ms, diff=ticks_diff):
+        self.own = own
+        self.uplink = Aimd(rate, min_rate, max_rate, increase, hold_ms, diff)
+        self._clock = clock
+        self._diff = diff
+        self.weights = {own: 1}
+        self.buckets = {}  # {child or own: TokenBucket}
+        self.active = set()  # Keys which sent in the last period, they share the rate.
+        self._sent = set()  # Keys which sent in this period.
+        self.told = {}  # {child: rate it was told}
+        self.dropped = 0
+
+    def rate_of(self, key):
+        """Share of uplink rate for child (or own traffic)."""
+        weights = self.weights
+        total = sum(weights.get(k, 1) for k in self.active)
+        if key not in self.active:
+            total += weights.get(key, 1)
+        return self.uplink.rate * weights.get(key, 1) / total
+
+    def set_weights(self, weights):
+        """{child or own: weight}, buckets of keys which are gone are dropped."""
+        self.weights = weights
+        for key in [key for key in self.buckets if key not in weights]:
+            del self.buckets[key]
+        for key in [key for key in self.told if key not in weights]:
+            del self.told[key]
+        self.active = {key for key in self.active if key in weights}
+        self._update()
+
+    def _update(self):
+        for key, bucket in self.buckets.items():
+            bucket.rate = self.rate_of(key)
+            bucket.burst = max(1, bucket.rate * BURST_S)
+
+    def admit(self, key, now=None):
+        """Take token of child (or own) for one frame, False when it is over its share."""
+        if now is None:
+            now = self._clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate = self.rate_of(key)
+            bucket = self.buckets[key] = TokenBucket(rate, max(1, rate * BURST_S), now, self._diff)
+        self._sent.add(key)
+        if bucket.take(now):
+            return True
+        self.dropped += 1
+        return False
+
+    def tick(self, congested, now=None):
+        """Each period, AIMD of uplink rate by congestion in the period. Return True when it was decreased."""
+        self.active, self._sent = self._sent, set()
+        decreased = False
+        if congested:
+            decreased = self.uplink.decrease(self._clock() if now is None else now)
+        else:
+            self.uplink.increase()
+        self._update()
+        return decreased
+
+    def set_limit(self, limit):
+        """Rate parent lets through from this node."""
+        self.uplink.set_limit(limit)
+        self._update()
+
+    def advertise(self, key):
+        """Share of child (whole frames per second) when it changed since child was told, otherwise None."""
+        rate = int(self.rate_of(key))
+        if self.told.get(key) == rate:
+            return None
+        self.told[key] = rate
+        return rate
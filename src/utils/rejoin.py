@@ -0,0 +1,76 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Persistent state of node in tree for fast rejoin to the same parent after reset.
+
+import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+REJOIN_FILE = 'rejoin.json'
+REJOIN_FIELDS = ("creds", "parent", "ssid", "pwd", "ap_pwd", "root", "term", "version")
+
+
+class FlashFs:
+    """Files of the board (or of CPython), RejoinStore takes anything with the same methods."""
+
+    @staticmethod
+    def open(path, mode):
+        return open(path, mode)
+
+    @staticmethod
+    def rename(old, new):
+        os.rename(old, new)
+
+    @staticmethod
+    def remove(path):
+        os.remove(path)
+
+
+class RejoinStore:
+    """
+    State of node in tree saved as JSON: credentials for signing, MAC of parent and credentials of its AP,
+    password of own AP (so children can rejoin too), root, its term and version of topology.
+    File is written whole into temporary one which is then renamed over the old one, so reset in the middle
+    of write leaves the old state. Same state is not written again, to spare flash.
+    """
+
+    def __init__(self, path=REJOIN_FILE, fs=FlashFs):
+        self.path = path
+        self.tmp = path + '.tmp'
+        self.fs = fs
+        self.saved = None
+
+    def load(self):
+        """Saved state as dict of REJOIN_FIELDS, None when there is none or it is broken."""
+        try:
+            with self.fs.open(self.path, 'r') as f:
+                state = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or any(field not in state for field in REJOIN_FIELDS):
+            return None
+        self.saved = state
+        return state
+
+    def save(self, state):
+        if state == self.saved:
+            return False
+        with self.fs.open(self.tmp, 'w') as f:
+            f.write(json.dumps(state))
+        self.fs.rename(self.tmp, self.path)
+        self.saved = dict(state)
+        return True
+
+    def clear(self):
+        """Forget state, next boot does full join."""
+        self.saved = None
+        for path in (self.path, self.tmp):
+            try:
+                self.fs.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,132 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Fixed pool of workers for received ESP-NOW frames, fed by ring of preallocated frame slots.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+RX_SLOTS = 8  # Frames waiting for workers.
+RX_WORKERS = 2
+RX_BURST = 16  # Frames taken from driver at once, then other tasks run.
+RX_POLL_FIRST_MS = 1  # Driver is polled soon after the last frame,
+RX_POLL_MAX_MS = 16  # less often while it is quiet.
+FRAME_SIZE = 250
+MAC_SIZE = 6
+
+
+class RxRing:
+    """
+    Preallocated slots for frames (bytearray of FRAME_SIZE and source MAC) in free list, indexes of filled slots
+    in ring in order of arrival. Slot is filled in place and given back by release() after processing.
+    """
+
+    def __init__(self, slots=RX_SLOTS, size=FRAME_SIZE):
+        self.size = size
+        self.bufs = [bytearray(size) for _ in range(slots)]
+        self.views = [memoryview(buf) for buf in self.bufs]
+        self.srcs = [bytearray(MAC_SIZE) for _ in range(slots)]
+        self.lens = [0] * slots
+        self.free = list(range(slots))
+        self.ring = [0] * slots
+        self.head = self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, src, frame):
+        """Copy frame into free slot, return False when there is none (or frame is too long)."""
+        if not self.free or len(frame) > self.size:
+            return False
+        i = self.free.pop()
+        length = len(frame)
+        self.bufs[i][:length] = frame
+        self.srcs[i][:] = src
+        self.lens[i] = length
+        ring = self.ring
+        ring[(self.head + self.count) % len(ring)] = i
+        self.count += 1
+        return True
+
+    def pop(self):
+        """Index of the oldest filled slot, None when there is none."""
+        if not self.count:
+            return None
+        i = self.ring[self.head]
+        self.head = (self.head + 1) % len(self.ring)
+        self.count -= 1
+        return i
+
+    def release(self, i):
+        self.free.append(i)
+
+
+class RxPool:
+    """
+    receive() takes frames from driver by irecv() (returning source and frame, None when nothing came), drops
+    frames which fail cheap accept(src, frame) and copies the rest into RxRing. Fixed number of worker() tasks
+    processes them by coroutine handle(src, frame), views of slot valid until it returns. Full ring means
+    overload, frame is dropped and counted, driver buffer is still emptied so the newest frames are not stuck.
+    """
+
+    def __init__(self, irecv, accept, handle, slots=RX_SLOTS, workers=RX_WORKERS, size=FRAME_SIZE):
+        self.irecv = irecv
+        self.accept = accept
+        self.handle = handle
+        self.ring = RxRing(slots, size)
+        self.workers = workers
+        self._ready = asyncio.Event()
+        self.received = self.filtered = self.dropped = self.handled = self.errors = 0
+
+    def start(self, loop):
+        loop.create_task(self.receive())
+        for _ in range(self.workers):
+            loop.create_task(self.worker())
+
+    def poll(self):
+        """Take up to RX_BURST frames from driver, return how many."""
+        ring = self.ring
+        taken = 0
+        while taken < RX_BURST:
+            src, frame = self.irecv()
+            if not frame:
+                break
+            taken += 1
+            self.received += 1
+            if not self.accept(src, frame):
+                self.filtered += 1
+            elif not ring.push(src, frame):
+                self.dropped += 1
+        if ring.count:
+            self._ready.set()
+        return taken
+
+    async def receive(self):
+        wait = RX_POLL_FIRST_MS
+        while True:
+            if self.poll():
+                wait = RX_POLL_FIRST_MS
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(wait / 1000)
+                wait = min(2 * wait, RX_POLL_MAX_MS)
+
+    async def worker(self):
+        ring = self.ring
+        while True:
+            i = ring.pop()
+            if i is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                await self.handle(ring.srcs[i], ring.views[i][:ring.lens[i]])
+                self.handled += 1
+            except Exception as e:  # Bad frame must not stop the worker.
+                self.errors += 1
+                print("[RxPool] Error: ", e)
+            finally:
+                ring.release(i)
@@ -0,0 +1,174 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Bounded outbound queue of one link (socket) with its own writer task, control traffic first, application
+#          sources share the link by weighted fair queueing, frames queued meanwhile are coalesced into one write.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from src.utils.messages import TC_CONTROL, TC_APP
+
+DROP = "drop"  # Full queue drops the new frame.
+BLOCK = "block"  # Full queue makes sender wait for space.
+QUEUE_LEN = 16  # Frames waiting for one link.
+MAX_WRITE = 2048  # Bytes coalesced into one write.
+
+
+class SendQueue:
+    """
+    Frames for one link by traffic class, written by run() as writer task of the link. Control frames go first
+    (strict priority), FIFO. Application frames are queued by flow (source node) and served by weighted fair
+    queueing: frame gets virtual finish time max(virtual time, finish of previous frame of its flow) + size / weight
+    and the smallest one goes next, virtual time is finish of the last frame taken (self-clocked fair queueing).
+    Source sending more than its share waits only behind its own frames.
+    Frames queued while the previous drain lasts are joined into one write. When queue is full, control frame or
+    application frame of much shorter flow takes place of the last frame of the longest flow, otherwise policy DROP
+    drops it and BLOCK waits for space.
+    """
+
+    def __init__(self, writer, capacity=QUEUE_LEN, policy=DROP, max_write=MAX_WRITE, weights=None):
+        self.writer = writer
+        self.capacity = capacity
+        self.policy = policy
+        self.max_write = max_write
+        self.weights = weights or {}  # {flow: weight}, 1 when not given.
+        self.control = []
+        self.flows = {}  # {flow: [(finish, frame)]}, only flows with queued frames.
+        self.vtime = 0.0
+        self.size = 0
+        self.closed = False
+        self.error = None  # Exception which ended run().
+        self._ready = asyncio.Event()  # Something to write.
+        self._space = asyncio.Event()  # Frames were taken, blocked senders can go on.
+        self.sent = self.writes = self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def _longest(self):
+        longest = None  # Flow of user app is None too, called only when there are flows.
+        size = 0
+        for flow, frames in self.flows.items():
+            if len(frames) > size:
+                longest, size = flow, len(frames)
+        return longest
+
+    def _full(self, tc, flow):
+        """Full for frame of class tc and flow, no frame to push out for it."""
+        if self.size < self.capacity:
+            return False
+        if not self.flows:
+            return True
+        if tc == TC_CONTROL:
+            return False
+        return len(self.flows[self._longest()]) <= len(self.flows.get(flow, ())) + 1
+
+    def _push_out(self):
+        """Drop the last frame of the longest flow."""
+        flow = self._longest()
+        frames = self.flows[flow]
+        frames.pop()
+        if not frames:
+            del self.flows[flow]
+            if not self.flows:
+                self.vtime = 0.0
+        self.size -= 1
+        self.dropped += 1
+
+    def put_nowait(self, data, tc=TC_APP, flow=None):
+        """Queue encoded frame, which must not be changed afterwards. Return False when it is dropped."""
+        if self.closed:
+            return False
+        if self.size >= self.capacity:
+            if self._full(tc, flow):
+                self.dropped += 1
+                return False
+            self._push_out()
+        if tc == TC_CONTROL:
+            self.control.append(data)
+        else:
+            frames = self.flows.get(flow)
+            if frames is None:
+                frames = self.flows[flow] = []
+                start = self.vtime
+            else:
+                start = max(self.vtime, frames[-1][0])
+            frames.append((start + len(data) / self.weights.get(flow, 1), data))
+        self.size += 1
+        self._ready.set()
+        return True
+
+    async def put(self, data, tc=TC_APP, flow=None):
+        """As put_nowait, with policy BLOCK waits while queue is full."""
+        if self.policy == BLOCK:
+            while self._full(tc, flow) and not self.closed:
+                self._space.clear()
+                await self._space.wait()
+        return self.put_nowait(data, tc, flow)
+
+    def _next_flow(self):
+        """Flow whose first frame has the smallest finish time."""
+        best = best_finish = None
+        for flow, frames in self.flows.items():
+            if best_finish is None or frames[0][0] < best_finish:
+                best, best_finish = flow, frames[0][0]
+        return best
+
+    def _take(self):
+        """Frames for one write, control then application, up to max_write bytes but at least one."""
+        chunks = []
+        size = 0
+        control = self.control
+        while control and (not chunks or size + len(control[0]) <= self.max_write):
+            data = control.pop(0)
+            chunks.append(data)
+            size += len(data)
+        flows = self.flows
+        while flows and not control:
+            flow = self._next_flow()
+            frames = flows[flow]
+            finish, data = frames[0]
+            if chunks and size + len(data) > self.max_write:
+                break
+            frames.pop(0)
+            if not frames:
+                del flows[flow]
+            self.vtime = finish if flows else 0.0  # Nothing backlogged, start again (float of MicroPython is 32 bit).
+            chunks.append(data)
+            size += len(data)
+        self.size -= len(chunks)
+        return chunks
+
+    async def run(self):
+        """Writer task of the link. Return True when queue was closed, False when write failed (link is dead)."""
+        writer = self.writer
+        try:
+            while not self.closed:
+                if not self.size:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                chunks = self._take()
+                self._space.set()
+                writer.write(chunks[0] if len(chunks) == 1 else b''.join(chunks))
+                await writer.drain()
+                self.writes += 1
+                self.sent += len(chunks)
+        except Exception as e:
+            self.error = e
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        """Drop queued frames, stop writer task and release blocked senders."""
+        self.closed = True
+        self.control.clear()
+        self.flows.clear()
+        self.size = 0
+        self._ready.set()
+        self._space.set()
@@ -0,0 +1,133 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Backup parent kept ready (hot standby), so switch after loss of parent is one association and socket.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    from ubinascii import hexlify
+except ImportError:
+    from binascii import hexlify
+
+from src.utils.deadlines import ticks_ms, ticks_diff
+
+NO_RSSI = -128
+
+
+def node_id(mac):
+    """Id of node in Tree from MAC in NeighbourTable."""
+    return hexlify(mac).decode()
+
+
+def best_parent(tree, neighbours, links, below, skip=()):
+    """
+    Direct neighbour which advertises it is in tree and is in topology, not in subtree of any node of below
+    (lost parent, node itself) and not in skip. The closest to root wins, then the one with the strongest link.
+    """
+    if not tree:
+        return None
+    subtrees = [node for node in (tree.search(i) for i in below if i) if node is not None]
+    best = best_key = None
+    for mac in neighbours.with_ttl(0):
+        if mac in skip or not neighbours.root(neighbours.slot(mac)):
+            continue
+        node = tree.search(node_id(mac))
+        if node is None or any(tree.search(node.data, subtree) is not None for subtree in subtrees):
+            continue
+        rssi = links.rssi(mac)
+        key = (-node.depth, NO_RSSI if rssi is None else rssi)
+        if best_key is None or key > best_key:
+            best, best_key = mac, key
+    return best
+
+
+class Standby:
+    """
+    Backup parent is the best_parent() other than the current one. It is asked for credentials of its AP
+    (AskWifiCreds) periodically, the answer (SendWifiCreds) keeps them fresh and shows it is alive and has free slot.
+    Backup which does not answer in health_ms is skipped for the next best one. Time of each switch of parent,
+    from loss of the old one until socket to the new one is open, is kept in switch_ms.
+    """
+
+    def __init__(self, health_ms, diff=ticks_diff, clock=ticks_ms):
+        self.health_ms = health_ms
+        self._diff = diff
+        self._clock = clock
+        self.mac = None  # Backup parent.
+        self.creds = None  # (ssid, password) of its AP.
+        self.answered = None  # When it answered last time.
+        self._since = None  # When it was chosen.
+        self._skip = set()  # Backups which did not answer.
+        self.switch_ms = None
+        self.switches = 0
+        self.backup_switches = 0
+
+    def update(self, tree, neighbours, links, own, parent, now):
+        """Backup parent to send AskWifiCreds to now, None when there is none."""
+        if self.mac is not None and not self.healthy(now) and self._diff(now, self._since) >= self.health_ms:
+            self._skip.add(self.mac)
+        best = best_parent(tree, neighbours, links, (parent, own), self._skip)
+        if best is None and self._skip:  # Everyone was skipped, try all again.
+            self._skip.clear()
+            best = best_parent(tree, neighbours, links, (parent, own))
+        if best != self.mac:
+            self.mac = best
+            self.creds = self.answered = None
+            self._since = now
+        return best
+
+    def on_creds(self, sender, ssid, password, now):
+        """
+        Answer of backup, return False when no backup is asked or it came from other node (late answer
+        of previous backup).
+        """
+        if self.mac is None or sender != self.mac:
+            return False
+        self.creds = (ssid, password)
+        self.answered = now
+        self._skip.discard(self.mac)
+        return True
+
+    def healthy(self, now):
+        return self.creds is not None and self._diff(now, self.answered) < self.health_ms
+
+    def ready(self, tree, dead, own, now):
+        """Credentials of healthy backup which is not below lost parent or this node, None when there is none."""
+        if self.mac is None or not self.healthy(now):
+            return None
+        node = tree.search(node_id(self.mac)) if tree else None
+        if node is None:
+            return None
+        for i in (dead, own):
+            subtree = tree.search(i) if i else None
+            if subtree is not None and tree.search(node.data, subtree) is not None:
+                return None
+        return self.creds
+
+    async def switch(self, sta, open_socket, timeout_s, lost, creds):
+        """
+        Connect sta (Net) to AP of backup and open socket by coroutine function open_socket, in timeout_s.
+        Return True when done, False when backup is gone as well.
+        """
+        self.mac = self.creds = self.answered = None  # Used up, next backup is chosen under the new parent.
+        try:
+            await asyncio.wait_for(sta.do_connect(*creds), timeout_s)
+            await open_socket()
+        except Exception:  # Also TimeoutError of asyncio.
+            sta.wlan.disconnect()
+            return False
+        self.switched(lost, True)
+        return True
+
+    def switched(self, lost, backup=False):
+        """Parent was switched, lost is ticks_ms when the old one was lost."""
+        self.switch_ms = self._diff(self._clock(), lost)
+        self.switches += 1
+        if backup:
+            self.backup_switches += 1
+        self._skip.clear()
@@ -5,16 +5,31 @@
 # Content: File with tree representation of the mesh.
 
 import json
+import struct
+
+try:
+    from ubinascii import crc32, hexlify, unhexlify
+except ImportError:
+    from binascii import crc32, hexlify, unhexlify
+
+# Operations in topology changes [version, op, node, parent], move has also [descendant, its parent, ...].
+TOPOLOGY_ADD = 1
+TOPOLOGY_DEL = 2
+TOPOLOGY_MOVE = 3
+CHANGES_KEPT = 32  # Changes kept to send deltas to children which are behind, older ones get snapshot.
+# Flat snapshot: count (2B), sorted table of count 6B MACs, count parent indexes (2B) into the table.
+NO_PARENT = 0xffff
+MAX_FLAT_NODES = 0xfffe
+
+
+def edge_hash(node, parent):
+    return crc32("{}>{}".format(node, parent or "").encode())
 
 
 def get_level(node):
     if not node:
         return 0
-    i = 0
-    while node.parent:
-        i += 1
-        node = node.parent
-    return i
+    return node.depth
 
 
 class TreeNode(object):
@@ -22,21 +37,21 @@ class TreeNode(object):
         self.data = data
         self.parent = parent
         self.children = []
+        self.depth = parent.depth + 1 if parent else 0  # Cached level in the tree.
+        self.tree = None  # Tree which has this node in its index, set when attached.
 
     def add_child(self, obj):
+        obj.parent = self
         self.children.append(obj)
+        if self.tree:
+            self.tree._register(obj)
+        else:
+            _set_depths(obj)
 
     def del_child(self, obj):
         self.children.remove(obj)
-
-    def get_routes(self):
-        dic = {}
-        for i in self.children:
-            descendants = [i.data]
-            descendants.extend(i.get_all())
-            for d in descendants:
-                dic[d] = i.data
-        return dic
+        if obj.tree:
+            obj.tree._unregister(obj)
 
     def get_all(self):
         al = []
@@ -45,6 +60,16 @@ class TreeNode(object):
             al.extend(i.get_all())
         return al
 
+    def get_nodes(self):
+        """All descendant TreeNodes, without recursion."""
+        nodes = []
+        stack = list(self.children)
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children)
+        return nodes
+
     def __str__(self, level=0):
         ret = "\t" * level + repr(self.data) + "\n"
         for child in self.children:
@@ -56,30 +81,329 @@ class TreeNode(object):
 
 
 class Tree:
-    def __init__(self):
+    """
+    Tree topology of the mesh. Root node is the authority, each change it applies gets next version.
+    Same topology has same hash on every node, it is XOR of hashes of all edges.
+    Routes of local node are kept in place as subtrees are attached and detached.
+    """
+
+    def __init__(self, local=None):
+        self.local = local  # Id of node which owns this copy of topology.
+        self.routes = {}  # {descendant of local: child of local leading to it}, cleared in place.
+        self.index = {}  # {node_id: TreeNode} of all nodes in the tree.
+        self._root = None
         self.root = TreeNode('ROOT', None)
+        self.version = 0  # Version given by root node, 0 when unknown.
+        self.hash = 0
+        self.changes = []  # Last CHANGES_KEPT changes [version, op, node, parent].
 
     def __str__(self):
         return self.root.__str__()
 
+    @property
+    def root(self):
+        return self._root
+
+    @root.setter
+    def root(self, node):
+        for old in self.index.values():
+            old.tree = None
+        self.index = {}
+        self.routes.clear()
+        self._root = node
+        if node is not None:
+            node.parent = None
+            self._register(node)
+
+    def _register(self, node):
+        """Add node with its subtree into index and update their depths."""
+        index = self.index
+        _set_depths(node)
+        node.tree = self
+        index[node.data] = node
+        for descendant in node.get_nodes():
+            descendant.tree = self
+            index[descendant.data] = descendant
+        self._add_routes(node)
+
+    def _add_routes(self, node):
+        """Routes of local node for newly attached subtree, costs its size plus depth of the tree."""
+        local = self.index.get(self.local, None)
+        if local is None:
+            return
+        hop = node
+        while hop.parent is not None and hop.parent is not local:
+            hop = hop.parent
+        if hop.parent is local:  # Subtree is below local node.
+            routes = self.routes
+            routes[node.data] = hop.data
+            for descendant in node.get_nodes():
+                routes[descendant.data] = hop.data
+        elif self.search(self.local, node) is not None:  # Local node came with the subtree.
+            self.set_local(self.local)
+
+    def set_local(self, node_id):
+        """Set node which owns this topology and build its routes."""
+        self.local = node_id
+        routes = self.routes
+        routes.clear()
+        local = self.index.get(node_id, None)
+        if local is None:
+            return
+        for child in local.children:
+            routes[child.data] = child.data
+            for descendant in child.get_nodes():
+                routes[descendant.data] = child.data
+
+    def next_hop(self, node_id):
+        """Child of local node which leads to node_id, None when it is not below local node."""
+        return self.routes.get(node_id, None)
+
+    def _unregister(self, node):
+        if self.local is not None and self.search(self.local, node) is not None:
+            self.routes.clear()  # Local node is detached, nothing is below it in this tree.
+        else:
+            routes = self.routes
+            routes.pop(node.data, None)
+            for descendant in node.get_nodes():
+                routes.pop(descendant.data, None)
+        index = self.index
+        node.tree = None
+        index.pop(node.data, None)
+        for descendant in node.get_nodes():
+            descendant.tree = None
+            index.pop(descendant.data, None)
+
+    def __len__(self):
+        return len(self.index)
+
     def pack(self):
         return self.root.pack()
 
+    def encode(self):
+        """
+        Flat snapshot of the tree, parent index for each MAC in sorted table. Raises ValueError when node ids are
+        not MACs. Same topology gives same bytes on every node, regardless order of children.
+        """
+        nodes = [self.root] + self.root.get_nodes()
+        count = len(nodes)
+        if count > MAX_FLAT_NODES:
+            raise ValueError("tree: too many nodes for flat snapshot")
+        table = []
+        for node in nodes:
+            mac = unhexlify(node.data)
+            if len(mac) != 6:
+                raise ValueError("tree: node id is not MAC")
+            table.append((mac, node))
+        table.sort(key=lambda entry: entry[0])
+        position = {}
+        for i in range(count):
+            position[table[i][1].data] = i
+        blob = bytearray(2 + 8 * count)
+        struct.pack_into("!H", blob, 0, count)
+        offset = 2
+        for mac, _ in table:
+            blob[offset:offset + 6] = mac
+            offset += 6
+        for _, node in table:
+            struct.pack_into("!H", blob, offset, position[node.parent.data] if node.parent else NO_PARENT)
+            offset += 2
+        return blob
+
+    def decode(self, blob):
+        """Replace whole topology with flat snapshot from encode(), without recursion."""
+        count = struct.unpack_from("!H", blob, 0)[0]
+        if len(blob) < 2 + 8 * count:
+            raise ValueError("tree: truncated flat snapshot")
+        nodes = []
+        offset = 2
+        for _ in range(count):
+            nodes.append(TreeNode(hexlify(bytes(blob[offset:offset + 6])).decode(), None))
+            offset += 6
+        root = None
+        for node in nodes:
+            parent = struct.unpack_from("!H", blob, offset)[0]
+            offset += 2
+            if parent == NO_PARENT:
+                root = node
+            elif parent < count:
+                node.parent = nodes[parent]
+                nodes[parent].children.append(node)
+        if root is None or len(root.get_nodes()) + 1 != count:
+            raise ValueError("tree: flat snapshot is not a tree")
+        self.root = root  # Registers all nodes at once, depths go top-down.
+
+    def snapshot(self):
+        """Flat snapshot when node ids are MACs, otherwise nested dicts from pack()."""
+        try:
+            return self.encode()
+        except ValueError:
+            return self.pack()
+
+    def load(self, packed, version):
+        """Replace whole topology with snapshot from snapshot() or pack()."""
+        if isinstance(packed, (bytes, bytearray, memoryview)):
+            self.decode(packed)
+        else:
+            json_to_tree(packed, self, None)
+        self.version = version
+        self.changes = []
+        self.rehash()
+
+    def rehash(self):
+        h = edge_hash(self.root.data, None)
+        for node in self.root.get_nodes():
+            h ^= edge_hash(node.data, node.parent.data)
+        self.hash = h
+
+    def add_node(self, node_id, parent_id):
+        """Add new leaf, return it or None if parent is unknown or node is already in tree."""
+        parent = self.search(parent_id)
+        if parent is None or self.search(node_id):
+            return None
+        node = TreeNode(node_id, parent)
+        parent.add_child(node)
+        self.hash ^= edge_hash(node_id, parent_id)
+        return node
+
+    def remove_node(self, node_id):
+        """Remove node with its whole subtree, return False if it is not in tree or is the root."""
+        node = self.search(node_id)
+        if node is None or node.parent is None:
+            return False
+        node.parent.del_child(node)
+        self.hash ^= edge_hash(node.data, node.parent.data)
+        for descendant in node.get_nodes():
+            self.hash ^= edge_hash(descendant.data, descendant.parent.data)
+        return True
+
+    def edges_below(self, node_id):
+        """Flat [descendant, its parent, ...] of subtree of node, parents go before their children."""
+        node = self.search(node_id)
+        edges = []
+        if node is None:
+            return edges
+        stack = list(node.children)
+        while stack:
+            child = stack.pop()
+            edges.append(child.data)
+            edges.append(child.parent.data)
+            stack.extend(child.children)
+        return edges
+
+    def move_node(self, node_id, parent_id, edges):
+        """
+        Put node with subtree given by edges_below() under parent_id. Node which is no longer in tree (its old
+        parent was deleted) comes back whole. Return False when parent is unknown or would be below the node.
+        """
+        parent = self.search(parent_id)
+        if parent is None or parent_id == node_id or parent_id in edges[::2]:
+            return False
+        node = self.search(node_id)
+        if node is not None and node.parent is parent and len(node.get_nodes()) * 2 == len(edges):
+            return False  # Already there.
+        if node is not None and (node.parent is None or self.search(parent_id, node) is not None):
+            return False
+        for i in range(0, len(edges), 2):
+            descendant = self.search(edges[i])
+            if descendant is not None and self.search(parent_id, descendant) is not None:
+                return False
+        self.remove_node(node_id)
+        for i in range(0, len(edges), 2):  # Descendants not in the reported subtree any more are dropped.
+            self.remove_node(edges[i])
+        self.add_node(node_id, parent_id)
+        for i in range(0, len(edges), 2):
+            self.add_node(edges[i], edges[i + 1])
+        return True
+
+    def _apply(self, op, node_id, parent_id, edges=None):
+        if op == TOPOLOGY_ADD:
+            return self.add_node(node_id, parent_id) is not None
+        if op == TOPOLOGY_MOVE:
+            return self.move_node(node_id, parent_id, edges or [])
+        return self.remove_node(node_id)
+
+    def _log(self, change):
+        self.changes.append(change)
+        if len(self.changes) > CHANGES_KEPT:
+            self.changes.pop(0)
+
+    def change(self, op, node_id, parent_id=None, edges=None):
+        """Used on root node. Apply change and give it next version, return False when nothing changed."""
+        if not self._apply(op, node_id, parent_id, edges):
+            return False
+        self.version += 1
+        change = [self.version, op, node_id, parent_id]
+        if op == TOPOLOGY_MOVE:
+            change.append(edges or [])
+        self._log(change)
+        return True
+
+    def apply_changes(self, changes):
+        """Apply changes received from parent, they must follow current version. Return False on gap."""
+        for change in changes:
+            version, op, node_id, parent_id = change[:4]
+            if version <= self.version:
+                continue  # Already applied.
+            if version != self.version + 1:
+                return False
+            self._apply(op, node_id, parent_id, change[4] if len(change) > 4 else None)
+            self.version = version
+            self._log(change)
+        return True
+
+    def update_for(self, known_version):
+        """
+        Topology update for child which knows known_version. Only version and hash when child is up to date,
+        delta when missing changes are still kept, otherwise whole snapshot.
+        """
+        update = {"v": self.version, "h": self.hash}
+        if known_version == self.version:
+            return update
+        changes = self.changes
+        if known_version and changes and changes[0][0] <= known_version + 1 and known_version < self.version:
+            update["d"] = [c for c in changes if c[0] > known_version]
+        else:
+            update["t"] = self.snapshot()
+        return update
+
+    def apply_update(self, update):
+        """Apply update from update_for() of parent. Return True when topology is now same as parent's."""
+        if "t" in update:
+            try:
+                self.load(update["t"], update["v"])
+            except ValueError:
+                return False
+        elif "d" in update and not self.apply_changes(update["d"]):
+            return False
+        return self.version == update["v"] and self.hash == update["h"]
+
     def search(self, node_id, actual_node=None):
-        if actual_node is None:
-            actual_node = self.root
-        if actual_node is None or actual_node.data == node_id:
-            return actual_node
-        for c in actual_node.children:
-            if self.search(node_id, c):
-                return self.search(node_id, c)
+        """Find node by id in O(1), when actual_node is given only in its subtree."""
+        node = self.index.get(node_id, None)
+        if actual_node is not None and node is not None:
+            ancestor = node
+            while ancestor is not None and ancestor is not actual_node:
+                ancestor = ancestor.parent
+            if ancestor is None:
+                return None
+        return node
 
     def del_node(self, node_id):
         if not self.root:
             return False
         failed_node = self.search(node_id)
-        parent = failed_node.parent
-        parent.del_child(failed_node)
+        if failed_node is None or failed_node.parent is None:
+            return False
+        failed_node.parent.del_child(failed_node)
+        return True
+
+
+def _set_depths(node):
+    """Cache depth of node and its subtree after it was attached under new parent."""
+    node.depth = node.parent.depth + 1 if node.parent else 0
+    for descendant in node.get_nodes():  # Parents always come before their children.
+        descendant.depth = descendant.parent.depth + 1
 
 
 def get_all_nodes(dict_var):
@@ -0,0 +1,64 @@
+# coding=utf-8
+# (C) Copyright 2022 Jindřich Šesták (xsesta05)
+# Licenced under Apache License.
+# Part of diploma thesis.
+# Content: Trickle timer (RFC 6206) for adaptive scheduling of advertisements.
+
+from src.utils.deadlines import ticks_diff
+
+try:
+    from urandom import getrandbits
+except ImportError:
+    from random import getrandbits
+
+
+class Trickle:
+    """
+    Interval starts at imin and doubles up to imin << doublings while the network is consistent,
+    inconsistency resets it back to imin. Transmission point t is random in the second half of interval.
+    Times are ticks_ms, only differences of them are used.
+    """
+
+    def __init__(self, imin, doublings, diff=ticks_diff):
+        self.imin = imin
+        self.imax = imin << doublings
+        self.interval = imin
+        self._diff = diff
+        self._start = 0
+        self._t = 0
+        self._fired = False
+
+    def start(self, now):
+        self.interval = self.imin
+        self._begin(now)
+
+    def _begin(self, now):
+        half = self.interval // 2
+        self._start = now
+        self._t = half + getrandbits(16) % half if half else 0
+        self._fired = False
+
+    def inconsistent(self, now):
+        """Reset to imin, return False when interval was already at imin and nothing changed."""
+        if self.interval == self.imin:
+            return False
+        self.interval = self.imin
+        self._begin(now)
+        return True
+
+    def poll(self, now):
+        """Advance timer, return True when transmission point of current interval was reached."""
+        elapsed = self._diff(now, self._start)
+        if not self._fired:
+            if elapsed >= self._t:
+                self._fired = True
+                return True
+        elif elapsed >= self.interval:
+            self.interval = min(2 * self.interval, self.imax)
+            self._begin(now)
+        return False
+
+    def wait_ms(self, now):
+        """Time until the next poll() has something to do."""
+        target = self.interval if self._fired else self._t
+        return max(0, target - self._diff(now, self._start))
@@ -7,17 +7,31 @@
 import gc
 
 gc.collect()
-from src.utils.net import Net
+from src.utils.net import Net, wait_until
 
 gc.collect()
-from src.utils.messages import WIFI_PACKETS, TopologyPropagate, TopologyChanged, \
-    pack_wifimessage, unpack_wifimessage, WIFIMSG
+from src.utils.messages import WIFI_PACKETS, WifiMSGBase, TopologyPropagate, TopologyChanged, \
+    pack_wifimessage, pack_wififrame, decode_wifimessage, is_wififrame, frame_dst, frame_origin_seq, decrement_ttl, \
+    traffic_class, message_origin, read_wifimessage, message_flag, AppMessage, UplinkRate, WIFIMSG, WIFI_BUF_SIZE, \
+    PARENT, TC_APP
+
+gc.collect()
+from src.utils.sendq import SendQueue, QUEUE_LEN, DROP
+from src.utils.dispatch import Dispatcher, Executor
+from src.utils.ratelimit import RateControl
+
+gc.collect()
+from src.utils.dedup import SeenCache
 
 gc.collect()
 from src.espnowcore import EspNowCore
 
 gc.collect()
-from src.utils.tree import Tree, TreeNode, json_to_tree, get_level
+from src.utils.tree import Tree, TreeNode, get_level, TOPOLOGY_ADD, TOPOLOGY_DEL, TOPOLOGY_MOVE
+
+gc.collect()
+from src.utils.rejoin import RejoinStore
+from src.utils.standby import best_parent
 
 gc.collect()
 
@@ -29,6 +43,7 @@ from ubinascii import hexlify, unhexlify
 from network import AUTH_WPA_WPA2_PSK, STA_IF, AP_IF
 import urandom
 import machine
+import time
 
 gc.collect()
 
@@ -36,9 +51,21 @@ gc.collect()
 DEFAULT_S = const(7)
 BEACON_S = const(15)
 SERVER_PORT = const(1234)
+PARENT_CONNECT_S = const(15)  # Wait for connection to parent claiming this node.
+REJOIN_S = const(8)  # Wait for connection to parent saved before reset, then join as new node.
+PARENT_CHECK_S = const(1)  # STA link to AP of parent is checked this often.
+ASK_S = const(1)  # Wait for claim from neighbour asked by AskWifiCreds, then ask the next one.
+BACKUP_S = const(30)  # Backup parent is asked for credentials of its AP this often (2 frames per 30 s per node).
+REPARENT_S = const(60)  # Node which finds no new parent this long resets itself.
+RATE_MS = const(200)  # Congestion of uplink is checked and shares of children adjusted this often.
+RATE_HOLD_MS = const(1000)  # Rate is decreased once per congestion episode, senders need time to slow down.
+UPLINK_FPS = const(200)  # Application frames per second a node lets up the tree at most.
+MIN_FPS = const(4)
+INCREASE_FPS = const(5)  # Additive increase of rate each RATE_MS without congestion.
 CHILDREN_COUNT = const(2)  # Number of maximum children for each node.
 ROUTER_PORT_FOR_USER = const(4321)
 USER_MAC = "ff0000000000"
+BROADCAST_MAC = "ffffffffffff"
 # User defined file.
 CONFIG_FILE = 'config.json'
 
@@ -82,6 +109,10 @@ class WifiCore:
         self.core = EspNowCore(self.config, self.ap, self.sta)  # EspNowCore with ESP-NOW module
         self.loop = self.core.loop
         self.sta.wlan.disconnect()
+        self.store = RejoinStore()  # Place in tree saved for fast rejoin after reset.
+        self.rejoin_state = self.store.load()
+        if self.rejoin_state:  # Same AP password as before reset, so children can rejoin too.
+            self.core.ap_password = self.rejoin_state["ap_pwd"]
         self.ap_essid = self.core.ap_essid
         self.ap_password = self.core.ap_password
         self.sta_ssid = self.sta_password = None
@@ -91,10 +122,23 @@ class WifiCore:
         self.id = mac_to_str(self.core.id)
         # Sockets and tree topology. 
         self.children_writers = {}  # {mac: (writer, (ip, port))}
+        self.child_versions = {}  # {mac: version of topology the child has}
+        self.json_links = set()  # Peers which talk in JSON lines instead of binary frames (user app).
+        self.send_queues = {}  # {writer: SendQueue} outbound queue with writer task for each link.
+        self.queue_config = self.config.get("SendQueue", (QUEUE_LEN, DROP))  # Capacity and policy when full.
+        self.app_weights = self.config.get("AppWeights", {})  # {node: weight} of its application traffic on links.
+        self.app_executor = Executor()  # Workers for AppMessage, messages of connection are processed in order.
+        # Application frames up to parent (or to app of root) by AIMD, shared among children by token buckets.
+        self.rate = RateControl(self.id, UPLINK_FPS, MIN_FPS, UPLINK_FPS, INCREASE_FPS, RATE_HOLD_MS)
         self.parent = self.parent_reader = self.parent_writer = None
+        self.reparenting = False  # Parent was lost, node looks for new one and keeps its subtree meanwhile.
 
         self.tree_topology = None
-        self.routing_table = {}  # Routing for descendants, everything else is transmitted to parent
+        self.topology_ready = asyncio.Event()  # Set when topology with this node in it arrives.
+        self.tree_changed = asyncio.Event()  # Set on each new version of topology, wakes up claim_children.
+        self.routing_table = {}  # Routing for descendants, everything else is transmitted to parent. Kept by tree.
+        self.seen = SeenCache()  # Broadcasts already processed, by origin and sequence number.
+        self._seq = urandom.getrandbits(16)  # Random start, so others don't drop broadcasts after reboot as old.
 
     def dprint(self, *args):
         if self.DEBUG:
@@ -107,6 +151,7 @@ class WifiCore:
         print(f"\nStart WifiCore: node ID: {self.id}")
         try:
             self.core.start()  # Run ESPNOW core.
+            self.app_executor.start(self.loop)
             self.loop.create_task(mem_info())
             self.loop.create_task(self.oled_info())
             self.loop.create_task(self._run())
@@ -147,9 +192,12 @@ class WifiCore:
         Or when node is the root node -> create Tree topology (connect to the WiFI router)
         Create tasks for communication to parent.
         """
-        while not (self.core.sta_ssid or mac_to_str(
-                self.core.root) == self.id):  # Either on_send_wifi_creds received or is root node.
-            await asyncio.sleep(DEFAULT_S)
+        if self.rejoin_state and await self.rejoin(self.rejoin_state):
+            return
+        claimed = self.core.claimed
+        while not (self.core.sta_ssid or self.am_i_root()):  # Either on_send_wifi_creds received or is root node.
+            claimed.clear()
+            await claimed.wait()
         self.core.DEBUG = False  # Stop Debug messages in EspnowCore
         self.sta.wlan.disconnect()  # Disconnect from any previously connected Wi-Fi.
         if self.core.sta_ssid:  # Has ssid to parent WIFI which was received in EspNowCore.
@@ -157,20 +205,58 @@ class WifiCore:
         elif self.am_i_root():  # Node is root node. Create Topology with itself on top.
             await self.connect_to_router()
 
-    async def connect_to_parent(self):
-        """Connects to parent node and creates socket connection."""
+    async def rejoin(self, state):
+        """
+        Fast path after reset: connect straight to the parent saved in RejoinStore with credentials of its AP,
+        without MPS, root election and waiting to be claimed. Saved root connects to the router as before.
+        When the parent does not accept connection in REJOIN_S, state is forgotten and node joins as new one.
+        """
+        core = self.core
+        core.resume(str_to_mac(state["creds"]), str_to_mac(state["root"]), state["term"])
+        if self.am_i_root() or not state["ssid"]:
+            return False  # connect() continues to connect_to_router().
+        core.in_topology = True  # Ignore claims of other nodes meanwhile.
+        core.sta_ssid, core.sta_password = state["ssid"], state["pwd"]
+        self.sta.wlan.disconnect()
+        if await self.connect_to_parent(REJOIN_S):
+            print(f"[Rejoin] to parent {state['parent']} Done, topology was in version {state['version']}")
+            return True
+        print(f"[Rejoin] parent {state['parent']} not available, join as new node")
+        self.store.clear()
+        self.rejoin_state = None
+        core.in_topology = False
+        core.sta_ssid = core.sta_password = None
+        return False
+
+    async def connect_to_parent(self, timeout=None):
+        """
+        Connects to parent node and creates socket connection. Without timeout it is claim from parent and node
+        resets when the connection fails, with timeout (rejoin) it returns False.
+        """
         self.sta_ssid = self.core.sta_ssid
         self.sta_password = self.core.sta_password
         try:
             await asyncio.wait_for(self.sta.do_connect(self.sta_ssid, self.sta_password),
-                                   15)  # Wait to connect only 15s.
+                                   timeout or PARENT_CONNECT_S)
             print("[Connect to parent WiFi] Done")
-            self.parent_reader, self.parent_writer = await asyncio.open_connection(self.sta.ifconfig()[2], SERVER_PORT)
-            print("[Open connection to parent] Done")
-            self.loop.create_task(self.send_beacon_to_parent())
-            self.loop.create_task(self.listen_to_parent())
-        except:
+            await self.open_parent()
+        except Exception:
+            if timeout:
+                self.sta.wlan.disconnect()
+                self.sta_ssid = self.sta_password = None
+                return False
             machine.reset()
+        return True
+
+    async def open_parent(self):
+        """ Socket to parent, which is gateway of STA, and tasks for it. """
+        self.parent_reader, self.parent_writer = await asyncio.open_connection(self.sta.ifconfig()[2], SERVER_PORT)
+        print("[Open connection to parent] Done")
+        self.loop.create_task(self.send_beacon_to_parent())
+        self.loop.create_task(self.listen_to_parent())
+        self.loop.create_task(self.watch_parent())
+        self.loop.create_task(self.keep_backup())
+        self.rate.set_limit(UPLINK_FPS)  # Until the parent tells its own.
 
     async def connect_to_router(self):
         """Only the root node connects to the WiFi router and open port for user to connect to."""
@@ -182,92 +268,238 @@ class WifiCore:
                 print(f"[Socket to WiFi router {self.wifi_ssid}] Done")
             except TimeoutError:
                 print(f"[Connect to WiFi router {self.wifi_ssid}] TimeoutError - not connected")
-        tree = Tree()
+        tree = Tree(self.id)
         tree.root = TreeNode(self.id, None)
+        tree.version = 1
+        tree.rehash()
         self.tree_topology = tree
+        self.update_routing_table()
+        self.topology_ready.set()
         return
 
     async def listen_to_user(self, reader, writer):
         """Listen for users commands."""
         # Mimic the user socket as normal child socket. This could work without any further changes,
-        res = await reader.read(100)
-        msg = json.loads(res)
+        res = await read_wifimessage(reader, bytearray(WIFI_BUF_SIZE))
+        if not res:
+            return
+        res = bytearray(res)
         addr = writer.get_extra_info('peername')
         print(f"Received {res} from {addr}")
-        self.loop.create_task(self.process_message(res, msg["src"]))
+        if not is_wififrame(res):
+            self.json_links.add(USER_MAC)
+        dispatcher = Dispatcher(self.process_message).start(self.loop)
+        await dispatcher.put(res, USER_MAC)
         self.children_writers[USER_MAC] = (writer, addr)
         # self.loop.create_task(self.topology_propagate(USER_MAC, writer))  # Send topology to user if you want.
-        self.loop.create_task(self.on_message(reader, USER_MAC))
+        self.loop.create_task(self.on_message(reader, USER_MAC, dispatcher))
 
     async def send_beacon_to_parent(self):
-        """ Send blank messages to parent for him to save my MAC addr and beacon to him."""
-        msg = TopologyPropagate(self.id, "parent", None)
-        while True:
+        """ Send beacons to parent for him to save my MAC addr, they carry version of topology I have."""
+        msg = TopologyPropagate(self.id, PARENT, None)
+        writer = self.parent_writer
+        while self.parent_writer is writer:  # Until connection to parent is closed or replaced.
             self.dprint("[SEND] to parent")
+            msg.packet["msg"] = self.topology_state()
             await self.send_msg(self.parent, self.parent_writer, msg)
             await asyncio.sleep(BEACON_S)
 
     async def listen_to_parent(self):
-        self.parent = await self.register_mac(self.parent_reader)  # Register peer with mac address
-        self.loop.create_task(self.on_message(self.parent_reader, self.parent))
+        dispatcher = Dispatcher(self.process_message).start(self.loop)
+        self.parent = await self.register_mac(self.parent_reader, dispatcher)  # Register peer with mac address
+        self.loop.create_task(self.on_message(self.parent_reader, self.parent, dispatcher))
+
+    async def watch_parent(self):
+        """ AP of parent is gone when STA is disconnected, no need to wait for socket or database of neighbours. """
+        writer = self.parent_writer
+        while self.parent_writer is writer:
+            if not self.sta.isconnected():
+                print("[Watch parent] STA disconnected from parent")
+                await self.close_connection(self.parent)
+                return
+            await asyncio.sleep(PARENT_CHECK_S)
+
+    async def keep_backup(self):
+        """
+        Keep backup parent (Standby) while connected to this parent. It is asked for credentials of its AP every
+        BACKUP_S, its answer also shows it is alive and has free slot.
+        """
+        writer = self.parent_writer
+        core = self.core
+        while self.parent_writer is writer:
+            if self.parent is None:  # Not registered yet, it could be taken as backup of itself.
+                await asyncio.sleep(BACKUP_S)
+                continue
+            backup = core.standby.update(self.tree_topology, core.neighbours, core.links, self.id, self.parent,
+                                         time.ticks_ms())
+            if backup is not None:
+                core.ask_wifi_creds(backup)
+            await asyncio.sleep(BACKUP_S)
+
+    async def reparent(self, dead):
+        """
+        Parent is lost. Node keeps its children, own AP and topology, so its subtree still works inside. Healthy
+        backup parent (Standby) is taken right away. Otherwise node asks neighbours from best_parent() one by one
+        to claim it (claim of any other node in tree is taken as well). STA connects to the new parent and move
+        of the whole subtree is reported to root. Node which finds no new parent in REPARENT_S resets itself.
+        """
+        if self.reparenting or self.am_i_root():
+            return
+        self.reparenting = True
+        core = self.core
+        standby = core.standby
+        lost = time.ticks_ms()
+        creds = standby.ready(self.tree_topology, dead, self.id, lost)
+        core.in_topology = False  # Takes claims again.
+        core.sta_ssid = core.sta_password = None
+        self.sta.wlan.disconnect()
+        if creds and await standby.switch(self.sta, self.open_parent, PARENT_CONNECT_S, lost, creds):
+            self.sta_ssid, self.sta_password = creds
+            core.sta_ssid, core.sta_password = creds
+            core.in_topology = True
+            await self.reparented()
+            return
+        tried = set()
+        while time.ticks_diff(time.ticks_ms(), lost) < REPARENT_S * 1000:
+            parent = best_parent(self.tree_topology, core.neighbours, core.links, (dead, self.id), tried)
+            if parent is None:
+                tried.clear()  # Everyone was asked, start again from the best one.
+            else:
+                tried.add(parent)
+                core.ask_wifi_creds(parent)
+            core.claimed.clear()
+            try:
+                await asyncio.wait_for(core.claimed.wait(), ASK_S)
+            except asyncio.TimeoutError:
+                continue
+            if core.sta_ssid and await self.connect_to_parent(PARENT_CONNECT_S):
+                standby.switched(lost)
+                await self.reparented()
+                return
+            core.in_topology = False
+            core.sta_ssid = core.sta_password = None
+        print("[Reparent] no new parent, reset itself.")
+        await self.close_all()
+        machine.reset()
+
+    async def reparented(self):
+        await self.report_move()
+        self.reparenting = False
+        self.save_state()
+        standby = self.core.standby
+        print(f"[Reparent] to {self.parent} in {standby.switch_ms} ms, {standby.backup_switches} of "
+              f"{standby.switches} switches to backup parent")
+
+    async def report_move(self):
+        """ One TOPOLOGY_MOVE to root: this node with its subtree is under the new parent now. """
+        tree = self.tree_topology
+        if not tree:
+            return
+        try:  # Parent is known from its first frame.
+            await asyncio.wait_for(wait_until(lambda: self.parent), DEFAULT_S)
+        except asyncio.TimeoutError:
+            return
+        change = {"op": TOPOLOGY_MOVE, "node": self.id, "parent": self.parent, "edges": tree.edges_below(self.id)}
+        await self.send_msg(self.parent, self.parent_writer, TopologyChanged(self.id, tree.root.data, change))
 
     async def start_parenting_server(self):
         """
         Create own WiFi AP and start server for listening for children to connect.
         """
         self.ap.config(essid=self.ap_essid, password=self.ap_password, authmode=self.ap_authmode, hidden=0)
-        while not self.ap.wlan.active():
-            await asyncio.sleep(DEFAULT_S)
+        await wait_until(self.ap.wlan.active)
         print("[START SERVER]")
         try:
             await self.in_tree_topology()  # Either root node has created topology or must wait for parent to send topology.
+            self.save_state()
             await asyncio.start_server(self.listen_to_children, '0.0.0.0', SERVER_PORT)
             self.loop.create_task(self.claim_children())
+            self.loop.create_task(self.control_rate())
         except Exception as e:
             print("[Start Server] error: ", e)
             raise e
 
     async def in_tree_topology(self):
-        while not self.tree_topology:  # Received Tree topology from parent node.
-            await asyncio.sleep(1)
-        while not self.tree_topology.search(self.id):  # Received updated Tree topology from parent node.
-            await asyncio.sleep(1)
+        """ Wait until topology from parent node (or own as root) has this node in it. """
+        ready = self.topology_ready
+        while not (self.tree_topology and self.tree_topology.search(self.id)):
+            ready.clear()
+            await ready.wait()
         return True
 
+    def save_state(self):
+        """ Save place of this node in tree into RejoinStore, for fast rejoin after reset. """
+        core = self.core
+        creds = core.creds
+        if isinstance(creds, str):
+            creds = creds.encode()
+        state = {"creds": mac_to_str(creds), "parent": self.parent, "ssid": self.sta_ssid, "pwd": self.sta_password,
+                 "ap_pwd": self.ap_password, "root": mac_to_str(core.root), "term": core.election.term,
+                 "version": self.tree_topology.version}
+        try:
+            self.store.save(state)
+        except OSError as e:  # Full or broken flash, node just joins as new one after reset.
+            print(f"[Save state] Error: {e}")
+
     async def listen_to_children(self, reader, writer):
         """
         Must update tree topology first. The topology has to be received earlier from its parent.
         Add new node and inform root about topology change.
         Create task to send periodic update to each new child.
         """
-        mac = await self.register_mac(reader)  # Register peer with mac address.
+        dispatcher = Dispatcher(self.process_message).start(self.loop)
+        mac = await self.register_mac(reader, dispatcher)  # Register peer with mac address.
         self.children_writers[mac] = (writer, writer.get_extra_info('peername'))
-        my_node = self.tree_topology.search(self.id)
-        new_child = TreeNode(mac, my_node)
-        self.tree_topology.search(self.id).add_child(new_child)
+        self.child_versions[mac] = 0  # Knows nothing, gets snapshot first.
+        self.rate.told.pop(mac, None)  # New link, child is told its share again.
         self.dprint("[Receive] child added: ", mac, writer.get_extra_info('peername'))
-        await self.topology_changed(self.tree_topology.root.data, self.parent_writer, mac)
+        await self.topology_changed(TOPOLOGY_ADD, mac)  # Root adds child and new version comes down as delta.
         self.loop.create_task(self.topology_propagate(mac, writer))  # Send topology to each child
-        self.dprint("[Receive new child] tree changed ", self.tree_topology.pack())
-        self.loop.create_task(self.on_message(reader, mac))
+        self.loop.create_task(self.on_message(reader, mac, dispatcher))
 
     async def topology_propagate(self, child_mac, writer):
-        """ Periodically propagate tree topology to child node."""
+        """
+        Periodically propagate tree topology to child node. In stable mesh it is only version and hash,
+        child which is behind gets delta or snapshot.
+        """
         msg = TopologyPropagate(self.id, child_mac, None)
-        tree = self.tree_topology
-        tree_pack = self.tree_topology.pack
         all_children = self.children_writers
         while child_mac in all_children:
-            msg.packet["msg"] = self.tree_topology.pack() if self.tree_topology else None
-            self.loop.create_task(self.send_msg(child_mac, writer, msg))
+            msg.packet["msg"] = self.topology_update(child_mac)
+            self.enqueue(child_mac, writer, msg)
             await asyncio.sleep(DEFAULT_S)
 
+    def topology_update(self, child_mac):
+        """ Update of topology for child based on version it has. Child is then expected to have current one. """
+        if not self.tree_topology:
+            return None
+        update = self.tree_topology.update_for(self.child_versions.get(child_mac, 0))
+        self.child_versions[child_mac] = self.tree_topology.version
+        return update
+
+    def topology_state(self):
+        tree = self.tree_topology
+        if not tree:
+            return None
+        return {"v": tree.version, "h": tree.hash}
+
+    def push_topology(self):
+        """ Send new version of topology to all children right away. """
+        self.tree_changed.set()
+        for mac, writers in self.children_writers.items():  # writers is a tuple(stream_writer, tuple(IP, port))
+            if mac == USER_MAC:
+                continue
+            msg = TopologyPropagate(self.id, mac, self.topology_update(mac))
+            self.enqueue(mac, writers[0], msg)
+
     async def claim_children(self):
         """
         Claim child nodes while there are some nodes present in mesh but not in the tree topology.
+        Claim is repeated when topology changes (node claimed by someone else joined) or after DEFAULT_S + 3.
         """
-        while True:  # neighbour_nodes are nodes with ttl value 0 (elem[1][4] == 0)
-            neighbour_nodes = list(dict(filter(lambda elem: elem[1][4] == 0, self.core.neighbours.items())).keys())
+        changed = self.tree_changed
+        while True:  # neighbour_nodes are nodes with ttl value 0
+            neighbour_nodes = self.core.neighbours.with_ttl(0)
             tree_nodes = []
             tree = self.tree_topology
             cnt_children = 0
@@ -276,81 +508,126 @@ class WifiCore:
                 tree_nodes = [str_to_mac(i) for i in tmp]
                 cnt_children = len(tree.search(self.id).children)
             possible_children = [mac for mac in neighbour_nodes if mac not in tree_nodes]
+            self.core.free_slots = CHILDREN_COUNT - cnt_children  # For nodes which ask to be claimed.
             if possible_children and cnt_children < CHILDREN_COUNT:
                 for i in range(CHILDREN_COUNT - cnt_children):
                     self.core.claim_children([urandom.choice(possible_children)])
-            await asyncio.sleep(DEFAULT_S + 3)  # Leave some time for node to connect to my WiFi.
+            changed.clear()
+            try:  # Leave some time for node to connect to my WiFi.
+                await asyncio.wait_for(changed.wait(), DEFAULT_S + 3)
+            except asyncio.TimeoutError:
+                pass
 
-    async def register_mac(self, reader):
+    async def register_mac(self, reader, dispatcher):
         """
-        Receive first blank packet to be able to register MAC address of node
+        Receive first blank packet to be able to register MAC address of node. It is processed by dispatcher
+        of the connection as the first one.
         """
         new_mac = None
+        buf = bytearray(WIFI_BUF_SIZE)
         while not new_mac:
             try:
-                res = await reader.readline()
-                msg = json.loads(res)
-                if msg["flag"] == WIFIMSG.APP:  # Ignore App meseges until register MAC.
-                    continue
+                res = await read_wifimessage(reader, buf)
                 if res == b'':  # Connection closed by host, should not happen.
                     self.dprint("[Receive] conn is dead")
+                    dispatcher.close()
                     return
-                new_mac = msg["src"]
-                self.loop.create_task(self.process_message(res, msg["src"]))
+                res = bytearray(res)  # Own copy, buf is reused for next message.
+                msg = decode_wifimessage(res)
+                if msg.packet["flag"] == WIFIMSG.APP:  # Ignore App meseges until register MAC.
+                    continue
+                new_mac = msg.packet["src"]
+                if not is_wififrame(res):
+                    self.json_links.add(new_mac)
+                await dispatcher.put(res, new_mac, msg)
 
             except Exception as e:
                 self.dprint("[Receive] x conn is prob dead, stop listening. Error: ", e)
+                dispatcher.close()
                 return
         return new_mac
 
-    async def on_message(self, reader, mac):
+    async def on_message(self, reader, mac, dispatcher):
         """
-        Wait for messages. Lightweight function to not block recv process. Further, processing in another coroutine.
+        Wait for messages. Lightweight function to not block recv process. Messages are processed in order by
+        dispatcher of the connection, application ones by app_executor.
+        Frames only passing through are forwarded straight from the receive buffer by their header (cut-through).
+        They are queued without waiting (forward), so full queue of one downstream link drops them instead of
+        stopping reads of this socket, control frames included.
         """
+        buf = bytearray(WIFI_BUF_SIZE)  # Reusable buffer for frames of this connection.
         try:
             while True:
-                res = await reader.readline()
+                res = await read_wifimessage(reader, buf)
                 if res == b'':  # Connection closed by host, clean up. Maybe hard reset.
                     print("[Receive] conn is dead")
+                    dispatcher.close()
                     await self.close_connection(mac)
                     return
-                self.loop.create_task(
-                    self.process_message(res, mac))  # Create task so this function is as fast as possible.
+                if is_wififrame(res):
+                    dst = frame_dst(res)
+                    if dst == BROADCAST_MAC:
+                        origin, seq = frame_origin_seq(res)
+                        if seq and self.seen.is_duplicate(origin, seq):
+                            continue  # Flood came back through another link, drop it before parsing.
+                    elif dst != self.id and dst != PARENT:
+                        if decrement_ttl(res) and self.police(mac, res, dst):
+                            self.forward(res, dst)  # Queued as own copy, buf is reused by the next read.
+                        continue
+                    elif dst == self.id and self.am_i_root() and not self.police(mac, res, dst):
+                        continue  # Application of root is the end of uplink.
+                await dispatcher.put(bytearray(res), mac)  # Waits only while dispatcher is full.
         except Exception as e:  # Connection closed by Parent node, clean up. Maybe hard reset
             print("[Receive] x conn is prob dead, stop listening. Error: ", e)
+            dispatcher.close()
             await self.close_connection(mac)
             return
 
-    async def process_message(self, msg, src_mac):
+    async def process_message(self, msg, src_mac, obj=None):
         """
         Decide what to do with messages, eventually just resend them further into the mesh.
+        Message is binary frame or JSON line in bytearray, it is decoded only once.
         """
         self.dprint(f"[Processed msg] from: {src_mac} and MSG {msg}")
-        # self.dprint("[Processed msg] ", msg)
-        js = json.loads(msg)
+        if obj is None:
+            obj = decode_wifimessage(msg)
+        js = obj.packet
         self.dprint(f'JS.dst {js["dst"]} == {self.id} ID')
         if js["dst"] == self.id:
-            obj = await unpack_wifimessage(msg, self)
-        elif js["dst"] == "ffffffffffff":  # Message destined to everyone. Process and resend.
-            obj = await unpack_wifimessage(msg, self)
+            await obj.process(self)
+        elif js["dst"] == BROADCAST_MAC:  # Message destined to everyone. Process and resend.
+            await obj.process(self)
+            if not is_wififrame(msg):  # JSON from user app, number it here for duplicate suppression in mesh.
+                self.number_broadcast(obj)
+                msg = obj
+            elif not decrement_ttl(msg):
+                return
             nodes = [self.parent] + list(self.children_writers.keys())
-            if src_mac:
+            if src_mac in nodes:
                 nodes.remove(src_mac)
             await self.send_to_nodes(msg,
                                      nodes)  # Resend broadcast to every other node you see. They will resend it also.
-        elif js["dst"] == "parent":
-            pass  # Message destined fo parent node from child (Beacon message, just for mac register, can drop).
-        else:
-            await self.resend(msg, js)
-
-    async def resend(self, msg, js):
-        routing_table = self.routing_table
-        if js["dst"] in routing_table.keys():
-            dst = routing_table.get(js["dst"])
-            writer = self.get_writer(dst)
-            await self.send_msg(dst, writer, msg)
-        else:
-            await self.send_msg(self.parent, self.parent_writer, msg)
+        elif js["dst"] == PARENT:  # Beacon from child with version of its topology.
+            self.on_child_beacon(obj)
+        elif decrement_ttl(msg):
+            self.forward(msg, js["dst"])
+
+    def next_hop(self, dst):
+        """ MAC and writer of link towards dst, to descendant by routing table, otherwise to parent. """
+        if dst in self.routing_table:
+            mac = self.routing_table[dst]
+            return mac, self.get_writer(mac)
+        return self.parent, self.parent_writer
+
+    async def resend(self, msg, dst):
+        """ Send message to the next hop towards dst. """
+        mac, writer = self.next_hop(dst)
+        await self.send_msg(mac, writer, msg)
+
+    def forward(self, msg, dst):
+        """ resend of frame passing through, dropped when queue of the next link is full. """
+        mac, writer = self.next_hop(dst)
+        return self.enqueue(mac, writer, msg)
 
     def get_writer(self, mac):
         if mac == self.parent:
@@ -362,24 +639,78 @@ class WifiCore:
 
     async def send_msg(self, mac, writer, message):
         """
-        Create message from class object message and send it through WiFi socket writer to mac.
+        Encode message (class object or frame being resent) for link to mac and queue it for writer task of the link.
+        Does not wait for the socket, only for space in queue of this link with policy BLOCK. Return False if dropped.
         """
         if not writer:
-            return
+            return False
         if not self.is_peer_alive(mac):
             await self.close_connection(mac)
+            return False
+        if mac == self.parent and isinstance(message, AppMessage) and not self.rate.admit(self.id):
+            return False  # Own application traffic over its share of uplink.
+        self.dprint("[SEND] to:", mac, " message: ", message)
+        return await self.send_queue(writer).put(self.encode_frame(mac, message), *self.classify(message))
+
+    def enqueue(self, mac, writer, message):
+        """ send_msg for synchronous code, message is dropped when queue of the link is full. """
+        if not writer:
+            return False
+        if not self.is_peer_alive(mac):
+            self.loop.create_task(self.close_connection(mac))
+            return False
+        return self.send_queue(writer).put_nowait(self.encode_frame(mac, message), *self.classify(message))
+
+    @staticmethod
+    def classify(message):
+        """ Traffic class of message and its flow in SendQueue, application messages by their source node. """
+        tc = traffic_class(message)
+        return tc, (message_origin(message) if tc == TC_APP else None)
+
+    def send_queue(self, writer):
+        """ SendQueue of link, created with its writer task on the first message. """
+        queue = self.send_queues.get(writer)
+        if queue is None:
+            queue = SendQueue(writer, *self.queue_config, weights=self.app_weights)
+            self.send_queues[writer] = queue
+            self.loop.create_task(self.write_link(queue))
+        return queue
+
+    async def write_link(self, queue):
+        """ Writer task of one link, link whose write fails is closed. """
+        if await queue.run():
             return
-        try:
-            self.dprint("[SEND] to:", mac, " message: ", message)
-            if type(message) is bytes or type(message) is str:  # Resending just string.
-                writer.write(message)
-            else:  # Message is object, must be packed.
-                writer.write('{}\n'.format(pack_wifimessage(message)))
-            await writer.drain()
-            self.dprint("[SEND] drained and done")
-        except Exception as e:
-            print("[Send] Whew! ", e, " occurred.")
-            await self.close_connection(mac)
+        print("[Send] Whew! ", queue.error, " occurred.")
+        writer = queue.writer
+        if writer is self.parent_writer:
+            await self.close_connection(self.parent)
+            return
+        for mac, (child_writer, _) in self.children_writers.items():
+            if child_writer is writer:
+                await self.close_connection(mac)
+                return
+
+    def encode_frame(self, mac, message):
+        """ encode_for as bytes of its own, frame being resent may be view of receive buffer. """
+        data = self.encode_for(mac, message)
+        if isinstance(data, str):
+            return data.encode()
+        if isinstance(data, memoryview):
+            return bytes(data)
+        return data
+
+    def encode_for(self, mac, message):
+        """
+        Encode message in format of the link. Message is object or already encoded frame or JSON line being resent.
+        """
+        as_json = mac in self.json_links
+        if isinstance(message, (bytes, bytearray, memoryview, str)):
+            if is_wififrame(message) != as_json:  # Resending in the same format as received.
+                return message
+            message = decode_wifimessage(message)
+        if as_json:
+            return '{}\n'.format(pack_wifimessage(message))
+        return pack_wififrame(message)
 
     def is_peer_alive(self, mac):
         """ Check if peer is connected based on ESP-NOW Advertisement neighbours database.
@@ -391,8 +722,16 @@ class WifiCore:
         else:
             return False
 
+    def number_broadcast(self, obj):
+        """ Give broadcast originated here sequence number and remember it, so it is not processed again. """
+        self._seq = self._seq % 0xffff + 1  # 1..65535, 0 means without sequence number.
+        obj.seq = self._seq
+        self.seen.is_duplicate(str_to_mac(obj.packet["src"]), obj.seq)
+
     async def send_to_nodes(self, msg, nodes=None):
         """ Send to directly connected nodes. Used for broadcast messages and for application.  """
+        if isinstance(msg, WifiMSGBase) and msg.packet["dst"] == BROADCAST_MAC and not msg.seq:
+            self.number_broadcast(msg)
         if nodes is None:
             nodes = [self.parent] + list(self.children_writers.keys())
         for node in nodes:
@@ -405,73 +744,139 @@ class WifiCore:
         nodes.remove(self.id)
         for node in nodes:
             msg.packet["dst"] = node
-            await self.resend(msg, msg.packet)
+            await self.resend(msg, node)
+
+    def police(self, mac, frame, dst):
+        """
+        Application frame from child going up the tree (or to app of root) must fit into token bucket of the child,
+        False drops it. Frames to descendants, from user app and of other types pass.
+        """
+        if mac not in self.children_writers or mac == USER_MAC or dst in self.routing_table:
+            return True
+        return message_flag(frame) != WIFIMSG.APP or self.rate.admit(mac)
+
+    def congested(self):
+        """
+        Application frames wait for uplink to parent in its SendQueue, or on root for application in app_executor.
+        """
+        if self.am_i_root():
+            executor = self.app_executor
+            return len(executor) >= executor.capacity // 2
+        queue = self.send_queues.get(self.parent_writer)
+        return queue is not None and len(queue) - len(queue.control) >= queue.capacity // 2
+
+    async def control_rate(self):
+        """
+        AIMD of rate of application frames this node lets up the tree. Rate is shared among children by size
+        of their subtree (node itself counts as one) and each child is told its share when it changes.
+        """
+        rate = self.rate
+        while True:
+            await asyncio.sleep_ms(RATE_MS)
+            tree = self.tree_topology
+            node = tree.search(self.id) if tree else None
+            if node is None:
+                continue
+            weights = {child.data: len(child.get_all()) + 1 for child in node.children}
+            weights[self.id] = 1
+            rate.set_weights(weights)
+            if rate.tick(self.congested()):
+                self.dprint(f"[Rate] uplink congested, rate {rate.uplink.rate} frames/s")
+            self.advertise_rate()
+
+    def advertise_rate(self):
+        """ Send UplinkRate to each child whose share changed, it is control traffic. """
+        rate = self.rate
+        for mac, writers in self.children_writers.items():
+            if mac == USER_MAC:
+                continue
+            share = rate.advertise(mac)
+            if share is not None:
+                self.enqueue(mac, writers[0], UplinkRate(self.id, mac, share))
+
+    def on_uplink_rate(self, uplink_rate: UplinkRate):
+        """ Called from message.py. Keep to rate the parent lets through, shares of children change with it. """
+        if uplink_rate.packet["src"] != self.parent:
+            return
+        self.rate.set_limit(uplink_rate.packet["msg"])
+        self.advertise_rate()
 
     def on_topology_propagate(self, topology: TopologyPropagate):
         """
-        Called from message.py. Save tree topology only from parent node.
+        Called from message.py. Apply topology update (version and hash, delta or snapshot) only from parent node.
+        When topology differs, report own version to parent right away, it answers with delta or snapshot.
         """
-        if not topology.packet["msg"]:  # Topology Exchanges are blank from children as beacons
+        update = topology.packet["msg"]
+        if not update or topology.packet["src"] != self.parent:
+            return
+        tree = self.tree_topology
+        if tree is None:
+            if "t" not in update:
+                self.report_topology()
+                return
+            tree = Tree(self.id)
+        old_version = tree.version
+        if not tree.apply_update(update):
+            tree.version = 0  # Unknown, parent will send snapshot.
+            self.report_topology()
             return
-        tree = Tree()
-        json_to_tree(topology.packet["msg"], tree, None)
-
-        if topology.packet["src"] == self.parent or topology.packet["src"] == self.tree_topology.root.data:
-            tmp = self.tree_topology
-            self.tree_topology = None
-            del tmp
-            self.tree_topology = tree
+        self.tree_topology = tree
+        self.topology_ready.set()
+        if tree.version != old_version:
             self.dprint("[OnTopologyPropagate]\n", self.tree_topology)
-        self.update_routing_table()
+            self.update_routing_table()
+            self.push_topology()
 
-    async def topology_changed(self, node, writer, mac):
-        # When new node connects or child node fails down inform just only root node.
-        msg = TopologyChanged(self.id, node, {"changed_mac": mac, \
-                                              "new_topology": self.tree_topology.pack()})  # Send Topology update.
-        await self.send_msg(node, writer, msg)
-        self.update_routing_table()
+    def report_topology(self):
+        msg = TopologyPropagate(self.id, PARENT, self.topology_state())
+        self.enqueue(self.parent, self.parent_writer, msg)
+
+    def on_child_beacon(self, beacon: TopologyPropagate):
+        """ Save version of topology child has, send update right away if it is behind. """
+        mac = beacon.packet["src"]
+        tree = self.tree_topology
+        if mac not in self.children_writers or not tree:
+            return
+        state = beacon.packet["msg"]
+        known = state["v"] if state else 0
+        if state and known == tree.version and state["h"] != tree.hash:
+            known = 0  # Same version but different topology, needs snapshot.
+        self.child_versions[mac] = known
+        if known != tree.version:
+            msg = TopologyPropagate(self.id, mac, self.topology_update(mac))
+            self.enqueue(mac, self.children_writers[mac][0], msg)
+
+    async def topology_changed(self, op, mac):
+        """
+        When new child connects or child node fails down inform just only root node.
+        Root applies the change and new version comes back down the tree as delta.
+        """
+        change = {"op": op, "node": mac, "parent": self.id}
+        tree = self.tree_topology
+        if tree.root.data == self.id:
+            self.apply_topology_change(change)
+        else:
+            msg = TopologyChanged(self.id, tree.root.data, change)
+            await self.send_msg(self.parent, self.parent_writer, msg)
 
     def on_topology_changed(self, topology: TopologyChanged):
         """
-        Called from message.py. Topology update is saved on root node. Root node immediately sends new topology.
-        On intermediate parent node the message is processed as Topology Propagate. And immediately resends to his children.
-        This way is bubbles through all the tree.
+        Called from message.py. Topology change reported by some parent node is applied only on root node.
         """
-        if not topology.packet["msg"]:  # and not self.id != self.tree_topology.root.data:
+        tree = self.tree_topology
+        if not topology.packet["msg"] or not tree or tree.root.data != self.id:
             return
-        tree = Tree()
-        if not self.tree_topology:  # If it is first packet form parent ever.
-            self.dprint("[OnTopologyChanged] First topo for node \n")
-            json_to_tree(topology.packet["msg"]["new_topology"], tree, None)
-            self.tree_topology = tree
-        elif self.id == self.tree_topology.root.data:  # Node is a root and updates tree. Already has a tree, must update him.
-            self.dprint("[OnTopologyChanged] Root node updates \n")
-            json_to_tree(topology.packet["msg"]["new_topology"], tree, None)
-            origin_node = self.tree_topology.search(topology.packet["src"])
-            if self.tree_topology.search(topology.packet["msg"]["changed_mac"]):  # It is in tree, so node is dead.
-                origin_node.del_child(self.tree_topology.search(topology.packet["msg"]["changed_mac"]))
-            else:  # It is not in tree, so new node was added.
-                new_node = tree.search(topology.packet["msg"]["changed_mac"])
-                origin_node.add_child(new_node)
-        else:  # Intermediate parents updates whole tree as Topology Propagation
-            self.dprint(
-                "[OnTopologyChanged] Intermediate parent just drop tree and create new one in On topology propagate\n")
-            self.on_topology_propagate(TopologyPropagate(topology.packet["src"], topology.packet["dst"], \
-                                                         topology.packet["msg"]["new_topology"]))
-        self.dprint("[OnTopologyChanged]\n", self.tree_topology)
-        self.send_to_children_once({"changed_mac": topology.packet["msg"]["changed_mac"], \
-                                    "new_topology": self.tree_topology.pack()})
-
-    def send_to_children_once(self, topo_changed: dict):
-        self.dprint("[SEND to children once]")
-        for destination, writers in self.children_writers.items():  # writers is a tuple(stream_writer, tuple(IP, port))
-            msg = TopologyChanged(self.id, destination, topo_changed)
-            self.dprint(f"[SEND to children once] {destination} msg> {msg.packet}")
-            self.loop.create_task(self.send_msg(destination, writers[0], msg))
+        self.apply_topology_change(topology.packet["msg"])
+
+    def apply_topology_change(self, change: dict):
+        if self.tree_topology.change(change["op"], change["node"], change.get("parent", None), change.get("edges")):
+            self.dprint("[OnTopologyChanged]\n", self.tree_topology)
+            self.update_routing_table()
+            self.push_topology()
 
     def update_routing_table(self):
-        if self.tree_topology.search(self.id):
-            self.routing_table = self.tree_topology.search(self.id).get_routes()
+        """ Routes are kept by the tree as it changes, so just point to them. """
+        self.routing_table = self.tree_topology.routes
 
     async def close_connection(self, mac):
         writer = None
@@ -480,21 +885,20 @@ class WifiCore:
             self.parent = None
             self.parent_writer = None
             self.parent_reader = None
-            print("[Close connection] Parent node dead, reset itself.")
-            await self.close_all()
-            machine.reset()
-            del self.tree_topology  # Lost connection to parent so drop whole topology.
-            self.tree_topology = None
+            print("[Close connection] Parent node dead, looking for new one.")
+            self.loop.create_task(self.reparent(mac))
         elif mac in self.children_writers:
             writer, ip = self.children_writers[mac]
             del self.children_writers[mac]
+            self.child_versions.pop(mac, None)
             try:
-                to_delete = self.tree_topology.search(mac)
-                to_delete.parent.del_child(to_delete)  # Delete lost child from topology.
-                await self.topology_changed(self.tree_topology.root.data, self.parent_writer, mac)
+                await self.topology_changed(TOPOLOGY_DEL, mac)  # Delete lost child from topology.
             except Exception as e:
                 print(f"[Close connection] to child - Error:{e}")
             print("[Close connection] to child, tree changed \n", self.tree_topology)
+        queue = self.send_queues.pop(writer, None)
+        if queue:
+            queue.close()
         if writer:
             writer.close()
             await writer.wait_closed()
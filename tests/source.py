@@ -0,0 +1,67 @@
+import ast
+import asyncio
+from pathlib import Path
+
+from src.utils import messages
+from src.utils.sendq import SendQueue, QUEUE_LEN, DROP
+
+ROOT = Path(__file__).parent.parent
+
+
+def from_source(path, names, namespace):
+    """
+    Top-level assignments and methods ("Class.method") of module taken from its source and executed in namespace,
+    which gives what they use. For src/espnowcore.py and src/wificore.py, which import MicroPython only modules.
+    """
+    tree = ast.parse(ROOT.joinpath(path).read_text())
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) in names for t in node.targets):
+            nodes.append(node)
+        elif isinstance(node, ast.ClassDef):
+            nodes.extend(item for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+                         and f"{node.name}.{item.name}" in names)
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), path, "exec"), namespace)
+    return [namespace[name.split(".")[-1]] for name in names]
+
+
+class Relay:
+    """
+    WifiCore with parent link only, which is also the dispatcher of its connection. on_message and the send path
+    are as they are in source, frames for other nodes are relayed to parent.
+    """
+    on_message, next_hop, forward, enqueue, classify, send_queue, write_link, encode_frame, encode_for = \
+        from_source("src/wificore.py", ["BROADCAST_MAC"] + [f"WifiCore.{name}" for name in (
+            "on_message", "next_hop", "forward", "enqueue", "classify", "send_queue", "write_link", "encode_frame",
+            "encode_for")], {"SendQueue": SendQueue, "print": lambda *args: None, **vars(messages)})[1:]
+
+    def __init__(self, writer, queue_config=(QUEUE_LEN, DROP)):
+        self.id = "aabbccddeeff"
+        self.parent = "112233445566"
+        self.parent_writer = writer
+        self.routing_table = {}
+        self.json_links = set()
+        self.send_queues = {}
+        self.queue_config = queue_config
+        self.app_weights = {}
+        self.loop = asyncio.get_running_loop()
+        self.received = []
+
+    async def put(self, msg, mac):  # Dispatcher, only frames for this node get there.
+        self.received.append(msg)
+
+    def close(self):
+        pass
+
+    async def close_connection(self, mac):
+        for queue in self.send_queues.values():
+            queue.close()
+
+    def police(self, mac, frame, dst):
+        return True
+
+    def is_peer_alive(self, mac):
+        return True
+
+    def am_i_root(self):
+        return False
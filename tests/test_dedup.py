@@ -0,0 +1,135 @@
+import random
+import tracemalloc
+from binascii import unhexlify
+from collections import deque
+
+from src.utils.dedup import SeenCache, WINDOW, RESTART
+from src.utils.messages import AppMessage, pack_wififrame, frame_origin_seq, decrement_ttl
+from tests.source import from_source
+
+BROADCAST_MAC = "ffffffffffff"
+
+
+class Node:
+    """WifiCore with only what number_broadcast needs, start of sequence is random as in WifiCore.__init__."""
+    number_broadcast, = from_source("src/wificore.py", ["WifiCore.number_broadcast"], {"str_to_mac": unhexlify})
+
+    def __init__(self, seq):
+        self.seen = SeenCache()
+        self._seq = seq
+
+
+def test_window_accepts_reordered_and_drops_repeated():
+    cache = SeenCache()
+    origin = b'\x01' * 6
+    for seq in (10, 12, 11, 15):
+        assert not cache.is_duplicate(origin, seq)
+    for seq in (10, 11, 12, 15):
+        assert cache.is_duplicate(origin, seq)
+    assert not cache.is_duplicate(origin, 14)
+    assert cache.is_duplicate(origin, 15 - WINDOW)  # Older than window.
+
+
+def test_sequence_wraps_around():
+    cache = SeenCache()
+    origin = b'\x02' * 6
+    for seq in (0xfffe, 0xffff, 1, 2):
+        assert not cache.is_duplicate(origin, seq)
+    assert cache.is_duplicate(origin, 0xffff)
+
+
+def test_origins_are_bounded():
+    cache = SeenCache(max_origins=8)
+    for i in range(100):
+        cache.is_duplicate(bytes([i]) * 6, 1)
+    assert len(cache) == 8
+
+
+def test_broadcasts_of_rebooted_node_are_not_dropped():
+    rnd = random.Random(3)
+    receiver = SeenCache()
+    mac = "3c71bfe48b01"
+
+    def broadcast(node):
+        msg = AppMessage(mac, BROADCAST_MAC, {"blink": [1, 1, 2]})
+        node.number_broadcast(msg)
+        return receiver.is_duplicate(*frame_origin_seq(pack_wififrame(msg)))
+
+    node = Node(39990)
+    assert not any(broadcast(node) for _ in range(10))  # Receiver has seen up to 40000.
+    node = Node(20000)  # Rebooted, starts far behind.
+    assert not any(broadcast(node) for _ in range(5))
+    for _ in range(200):  # Reboots with random start, about half of them behind the highest number seen.
+        top = receiver.origins[unhexlify(mac)][0]
+        node = Node(rnd.getrandbits(16))
+        dropped = any(broadcast(node) for _ in range(3))
+        assert dropped == (WINDOW <= (top - node._seq + 2) & 0xffff < RESTART)  # Only start just behind (0.4 %).
+
+
+def cyclic_topology(nodes, rnd):
+    """Ring with random chords, every node has several paths to every other node."""
+    links = {i: set() for i in range(nodes)}
+    for i in range(nodes):
+        links[i].add((i + 1) % nodes)
+        links[(i + 1) % nodes].add(i)
+    for _ in range(nodes):
+        a, b = rnd.sample(range(nodes), 2)
+        links[a].add(b)
+        links[b].add(a)
+    return links
+
+
+def test_flood_through_cycles_has_no_amplification():
+    rnd = random.Random(7)
+    nodes = 20
+    floods = 10000
+    links = cyclic_topology(nodes, rnd)
+    edges = sum(len(v) for v in links.values()) // 2
+    macs = ["3c71bfe48b%02x" % i for i in range(nodes)]
+    caches = [SeenCache() for _ in range(nodes)]
+    seqs = [rnd.getrandbits(16) for _ in range(nodes)]
+    originated = [0] * nodes
+    delivered = [0] * nodes
+    transmissions = 0
+    in_flight = deque()  # (receiver, sender, frame), several floods travel at once.
+
+    def forward(node, sender, frame):
+        nonlocal transmissions
+        for neighbour in links[node]:
+            if neighbour != sender:
+                copy = bytearray(frame)
+                if decrement_ttl(copy):
+                    transmissions += 1
+                    in_flight.append((neighbour, node, copy))
+
+    def deliver(limit):
+        while len(in_flight) > limit:
+            node, sender, frame = in_flight.popleft()
+            if caches[node].is_duplicate(*frame_origin_seq(frame)):
+                continue  # Dropped before parsing and forwarding.
+            delivered[node] += 1
+            forward(node, sender, frame)
+
+    tracemalloc.start()
+    baseline = 0
+    for n in range(floods):
+        origin = rnd.randrange(nodes)
+        originated[origin] += 1
+        seqs[origin] = seqs[origin] % 0xffff + 1
+        msg = AppMessage(macs[origin], BROADCAST_MAC, {"blink": [n % 100, 1, 2]})
+        msg.seq = seqs[origin]
+        frame = pack_wififrame(msg)
+        caches[origin].is_duplicate(*frame_origin_seq(frame))
+        forward(origin, None, frame)
+        deliver(3 * edges)
+        if n == 1000:
+            baseline = tracemalloc.get_traced_memory()[0]
+    deliver(0)
+    grown = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # Every node got every flood exactly once, each link carried a flood at most once in each direction.
+    assert delivered == [floods - originated[i] for i in range(nodes)]
+    assert transmissions <= floods * 2 * edges
+    assert all(len(cache) <= nodes for cache in caches)
+    assert grown < 16 * 1024  # Seen sets don't grow with number of messages.
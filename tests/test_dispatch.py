@@ -0,0 +1,68 @@
+import asyncio
+import random
+
+from src.utils.dispatch import Dispatcher, Executor
+
+
+def test_messages_are_processed_in_order_even_when_processing_waits():
+    rnd = random.Random(1)
+
+    async def scenario(dispatched):
+        applied = []
+
+        async def process(number):
+            await asyncio.sleep(rnd.uniform(0, 0.002))  # Forwarded before the next one is taken.
+            applied.append(number)
+
+        loop = asyncio.get_running_loop()
+        if dispatched:
+            dispatcher = Dispatcher(process, capacity=4).start(loop)
+            for number in range(50):
+                await dispatcher.put(number)
+                assert len(dispatcher) <= 4
+        else:
+            for number in range(50):
+                loop.create_task(process(number))
+        await asyncio.sleep(0.2)
+        return applied
+
+    assert asyncio.run(scenario(True)) == list(range(50))
+    assert asyncio.run(scenario(False)) != list(range(50))  # Task per message lets later one overtake.
+
+
+def test_failed_message_does_not_stop_connection_and_close_releases_reader():
+    async def scenario():
+        done = []
+
+        async def process(number):
+            if number == 1:
+                raise ValueError("bad frame")
+            done.append(number)
+
+        dispatcher = Dispatcher(process, capacity=1).start(asyncio.get_running_loop())
+        for number in range(3):
+            await dispatcher.put(number)
+        await asyncio.sleep(0.01)
+        dispatcher.close()
+        return done, dispatcher.errors, await dispatcher.put(3)
+
+    assert asyncio.run(scenario()) == ([0, 2], 1, False)
+
+
+def test_executor_runs_bounded_number_of_calls():
+    async def scenario():
+        running = [0, 0]  # Now, peak.
+
+        async def app(_):
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        executor = Executor(workers=2, capacity=3)
+        executor.start(asyncio.get_running_loop())
+        accepted = [executor.submit(app, i) for i in range(5)]
+        await asyncio.sleep(0.05)
+        return accepted, running[1], executor.done, executor.dropped
+
+    assert asyncio.run(scenario()) == ([True, True, True, False, False], 2, 3, 2)
@@ -0,0 +1,57 @@
+from src.utils.election import Election, score
+from src.utils.messages import Advertise
+from src.utils.neighbours import NeighbourTable
+
+
+def mac(i):
+    return bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i])
+
+
+def table_of(own, cntrs, rssi=None):
+    table = NeighbourTable(16, own=mac(own))
+    for node, cntr in cntrs.items():
+        table.update(Advertise(mac(node), cntr, (rssi or {}).get(node, 0.0), False, 0), 0, 0)
+    return table
+
+
+def test_score_prefers_router_then_centrality_then_mac():
+    assert score(0.1, -90.0, mac(1)) > score(2.0, 0.0, mac(9))  # Node which reaches router wins.
+    assert score(0.1, -60.0, mac(1)) > score(2.0, -70.0, mac(9))
+    assert score(1.0, -61.0, mac(1)) < score(1.01, -62.0, mac(2))  # Noise of few dB or 0.01 doesn't count.
+
+
+def test_best_candidate_declares_after_hold():
+    cntrs = {1: 0.5, 2: 0.9, 3: 0.7}
+    elections = {node: Election(mac(node), 8000) for node in cntrs}
+    tables = {node: table_of(node, cntrs) for node in cntrs}
+    declared = []
+    for now in range(0, 20000, 1000):
+        for node, election in elections.items():
+            if election.poll(tables[node], now):
+                declared.append((now, node, election.declare(0.9, 0.0)))
+    assert declared == [(8000, 2, 1)]
+    assert all(election.adopt(mac(2), 0.9, 0.0, 1) for node, election in elections.items() if node != 2)
+    assert not elections[1].adopt(mac(2), 0.9, 0.0, 1)  # Already there, not flooded again.
+
+
+def test_better_root_wins_in_term_newer_term_wins_always():
+    election = Election(mac(1), 8000)
+    assert election.adopt(mac(3), 0.5, 0.0, 1)
+    assert not election.adopt(mac(2), 0.4, 0.0, 1) and election.root == mac(3)
+    assert election.adopt(mac(4), 0.8, 0.0, 1) and election.root == mac(4)
+    assert election.adopt(mac(2), 0.1, 0.0, 2) and election.root == mac(2)
+    assert not election.adopt(mac(4), 0.8, 0.0, 1)
+    election.term = 0xffff
+    assert election.adopt(mac(6), 0.1, 0.0, 0) and election.term == 0  # Terms wrap around.
+
+
+def test_lost_root_is_withdrawn_and_excluded():
+    election = Election(mac(1), 8000)
+    table = table_of(1, {1: 0.5, 2: 0.9})
+    election.adopt(mac(2), 0.9, 0.0, 4)
+    assert not election.poll(table, 0)
+    assert not election.withdraw(mac(2), 3) and election.withdraw(mac(2), 4)
+    assert not election.withdraw(mac(2), 4)  # Withdrawal is flooded once.
+    assert not election.adopt(mac(2), 0.9, 0.0, 4)  # Stale declaration of the lost root.
+    assert not election.poll(table, 1000) and election.poll(table, 9000)  # Dead root is still in table.
+    assert election.declare(0.5, 0.0) == 5 and election.root == mac(1) and not election.lost
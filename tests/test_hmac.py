@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+
+from src.utils.hmac import HMACSigner
+
+KEY = b'hellotheregeneralkenobinobodyex\x00\x00'
+
+
+def test_signer_matches_stdlib():
+    signer = HMACSigner(KEY)
+    for msg in (b'', b'\x01' * 19, bytes(range(250))):
+        assert signer.digest(msg) == hmac.new(KEY, msg, hashlib.sha256).digest()
+
+
+def test_signer_without_hash_copy():
+    signer = HMACSigner(KEY)
+    signer._inner = signer._outer = None  # Behave as MicroPython hashlib without copy().
+    assert signer.digest(b'abc') == hmac.new(KEY, b'abc', hashlib.sha256).digest()
+
+
+def test_long_key_is_hashed():
+    key = b'k' * 100
+    assert HMACSigner(key).digest(b'abc') == hmac.new(key, b'abc', hashlib.sha256).digest()
+
+
+def test_sign_into_and_verify_in_place():
+    signer = HMACSigner(KEY)
+    buf = bytearray(250)
+    buf[:4] = b'\x01abc'
+    end = signer.sign_into(memoryview(buf)[:4], buf, 4)
+    assert end == 4 + 32
+    assert signer.verify(b'\x01abc', buf, 4)
+    buf[10] ^= 1
+    assert not signer.verify(b'\x01abc', buf, 4)
+    assert not signer.verify(b'\x01abc', buf, 240)  # Digest would not fit.
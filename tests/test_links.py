@@ -0,0 +1,59 @@
+import random
+
+from src.utils.links import LinkTable, rssi_filter, centrality_of, OUTLIER_RUN, RESYNC
+
+
+def mac(i):
+    return bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i])
+
+
+def test_filter_rejects_spikes_of_noisy_trace():
+    rnd = random.Random(15)
+    ewma = run = 0
+    for i in range(2000):
+        rssi = -70 + rnd.gauss(0, 2)
+        if i % 50 == 25:
+            rssi = rnd.choice((-30, -98))  # Single frame from reflection or collision.
+        ewma, run = rssi_filter(ewma, run, rssi)
+        if i > 50:
+            assert abs(ewma + 70) < 3
+
+
+def test_filter_follows_step_of_signal():
+    ewma, run = rssi_filter(0.0, 0, -60)
+    for _ in range(OUTLIER_RUN - 1):
+        ewma, run = rssi_filter(ewma, run, -85)
+        assert ewma == -60.0
+    ewma, run = rssi_filter(ewma, run, -85)
+    assert (ewma, run) == (-85.0, 0)
+
+
+def test_same_frame_is_counted_once():
+    links = LinkTable(4)
+    assert links.sample(mac(1), -50, 100) == -50.0
+    assert links.sample(mac(1), -50, 100) is None
+    assert links.sample(mac(1), -58, 140) == -51.0
+    assert links.rssi(mac(2)) is None
+
+
+def test_incremental_centrality_matches_recomputation():
+    rnd = random.Random(16)
+    links = LinkTable(8)
+    level = {}
+    for step in range(3 * RESYNC):
+        node = rnd.randrange(12)
+        if rnd.random() < 0.05:
+            links.remove(mac(node))
+        else:
+            if rnd.random() < 0.01:
+                level[node] = rnd.uniform(-95, -35)
+            links.sample(mac(node), level.setdefault(node, -70) + rnd.gauss(0, 3), step)
+        expected = sum(centrality_of(links.rssi(m)) for m in links.index)
+        assert abs(links.centrality - expected) < 1e-4
+    assert len(links) <= 8
+
+
+def test_router_rssi():
+    links = LinkTable()
+    assert links.sample_router(-67) == -67.0 and links.sample_router(-75) == -68.0
+    assert links.centrality == 0.0
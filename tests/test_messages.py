@@ -0,0 +1,84 @@
+import asyncio
+import struct
+
+from src.utils.messages import Advertise, ObtainCreds, SendWifiCreds, RootElected, ESP_CODECS, ESP_FRAME_SIZE, \
+    Esp_Type, EspAggregator, iter_espmessages, pack_espmessage, pack_espmessage_into, unpack_espmessage
+
+NODE_ID = b'\x3c\x71\xbf\xe4\x8b\x89'
+
+
+class FakeCore:
+    def __init__(self):
+        self.advertised = []
+
+    def on_advertise(self, adv):
+        self.advertised.append(adv)
+
+
+def legacy_pack(obj, pattern, fields=None):
+    fields = fields or sorted(obj.__slots__)
+    return struct.pack('B', obj.type) + struct.pack(pattern, *[getattr(obj, f) for f in fields])
+
+
+def test_pack_matches_legacy_layout():
+    ad = Advertise(NODE_ID, 1452.0, -74.25, True, 1, 7)
+    legacy_fields = ["id", "mesh_cntr", "rssi", "tree_root_elected", "ttl"]
+    assert pack_espmessage(ad) == legacy_pack(ad, "!6sffBi", legacy_fields) + struct.pack("!H", 7)  # gen at the end.
+    creds = ObtainCreds(ObtainCreds.RESPOND, NODE_ID, 32 * b'\x01')
+    assert pack_espmessage(creds) == legacy_pack(creds, "!B6s32s")
+    wifi = SendWifiCreds(NODE_ID, 12, 16 * b'a', 16 * b'b')
+    assert pack_espmessage(wifi) == legacy_pack(wifi, "!6sh16s16s")
+
+
+def test_codec_sizes():
+    assert ESP_CODECS[Esp_Type.ADVERTISE].size == 1 + 6 + 4 + 4 + 1 + 4 + 2
+    assert ESP_CODECS[Esp_Type.NEIGHBOUR_DIGEST].size == 1 + 6 + 32
+    assert ESP_CODECS[Esp_Type.OBTAIN_CREDS].size == 40
+    assert ESP_CODECS[Esp_Type.ROOT_ELECTED].size == ESP_CODECS[Esp_Type.ADVERTISE].size
+    assert ESP_CODECS[Esp_Type.ASK_WIFI_CREDS].size == 1 + 6 + 6
+
+
+def test_pack_into_reusable_buffer_and_unpack_from_offset():
+    buf = bytearray(ESP_FRAME_SIZE)
+    first = Advertise(NODE_ID, 2.0, -50.0, False, 0)
+    second = RootElected(b'\x01' * 6, 3.0, -40.0, True, 2)
+    end = pack_espmessage_into(buf, 0, first)
+    end2 = pack_espmessage_into(buf, end, second)
+    assert end2 == 2 * ESP_CODECS[Esp_Type.ADVERTISE].size
+    obj = ESP_CODECS[buf[end]].unpack_from(buf, end)
+    assert type(obj) is RootElected
+    assert obj.values() == second.values()
+
+
+def test_unpack_processes_message():
+    core = FakeCore()
+    ad = Advertise(NODE_ID, 1.5, -60.5, False, 3)
+    obj = asyncio.run(unpack_espmessage(memoryview(pack_espmessage(ad)), core))
+    assert core.advertised == [obj]
+    assert obj.values() == ad.values()
+
+
+def test_slots_message_has_no_dict():
+    ad = Advertise(NODE_ID, 0.0, 0.0, False, 0)
+    assert not hasattr(ad, "__dict__")
+
+
+def test_aggregator_fills_frame_and_splits_back():
+    aggregator = EspAggregator(ESP_FRAME_SIZE - 32)
+    sent = []
+    for i in range(20):
+        adv = Advertise(bytes([i]) * 6, float(i), -50.0, False, i)
+        if aggregator.add(adv) is None:
+            break
+        sent.append(adv)
+    assert len(sent) == (ESP_FRAME_SIZE - 32) // ESP_CODECS[Esp_Type.ADVERTISE].size
+    received = list(iter_espmessages(aggregator.view[:aggregator.end]))
+    assert [obj.values() for obj in received] == [adv.values() for adv in sent]
+    aggregator.clear()
+    assert aggregator.end == 0
+
+
+def test_iter_espmessages_stops_on_garbage():
+    body = pack_espmessage(Advertise(NODE_ID, 0.0, 0.0, False, 0))
+    assert len(list(iter_espmessages(body + b'\x07\x00'))) == 1  # Unknown type.
+    assert len(list(iter_espmessages(body + body[:5]))) == 1  # Cut message.
@@ -0,0 +1,122 @@
+import random
+
+from src.utils.messages import Advertise
+from src.utils.neighbours import NeighbourTable, gen_newer, bucket_of
+
+
+def mac(i):
+    return bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i])
+
+
+def test_update_in_place_and_accessors():
+    table = NeighbourTable(4)
+    slot = table.update(Advertise(mac(1), 1.5, -70.0, False, 0), 100, 0)
+    assert table.update(Advertise(mac(1), 2.5, -60.0, True, 300), 200, 150) == slot
+    assert len(table) == 1 and mac(1) in table and table.mac(slot) == mac(1)
+    assert (table.cntr(slot), table.rssi(slot), table.root(slot), table.ttl(slot)) == (2.5, -60.0, True, 255)
+    assert (table.last_rx(slot), table.last_tx(slot)) == (200, 150)
+    adv = table.fill_advertise(slot, Advertise(b'', 0.0, 0.0, False, 0))
+    assert adv.values() == (mac(1), 2.5, -60.0, True, 255, 0)
+
+
+def test_capacity_and_slot_reuse():
+    table = NeighbourTable(2)
+    table.update(Advertise(mac(1), 0.0, 0.0, False, 0), 0, 0)
+    second = table.update(Advertise(mac(2), 0.0, 0.0, False, 1), 0, 0)
+    assert table.update(Advertise(mac(3), 0.0, 0.0, False, 0), 0, 0) is None
+    assert table.with_ttl(0) == [mac(1)]
+    assert table.remove(mac(2)) == second and mac(2) not in table
+    assert table.update(Advertise(mac(3), 0.0, 0.0, False, 0), 0, 0) == second
+    assert sorted(table) == [mac(1), mac(3)]
+
+
+class FakeTicks:
+    """ticks_ms() and ticks_diff() of MicroPython, period 2**30, starting just before wrap around."""
+    PERIOD = 1 << 30
+
+    def __init__(self):
+        self.t = self.PERIOD - 5000
+
+    def ticks_ms(self):
+        return self.t % self.PERIOD
+
+    def ticks_diff(self, a, b):
+        return ((a - b + self.PERIOD // 2) % self.PERIOD) - self.PERIOD // 2
+
+
+def run_until_quiet(table, clock, until):
+    """Loop of check_neighbours on fake clock: sleep until next check, expire. Return (expired, wakeups)."""
+    expired = {}
+    wakeups = 0
+    while True:
+        wait = table.next_expiry_ms()
+        if wait is None or clock.t + wait > until:
+            clock.t = until
+            return expired, wakeups
+        clock.t += wait
+        wakeups += 1
+        for mac in table.expire():
+            expired[mac] = clock.t
+
+
+def test_expiry_on_fake_clock_under_churn():
+    rnd = random.Random(12)
+    clock = FakeTicks()
+    timeout = 26000
+    table = NeighbourTable(16, timeout, own=mac(0), clock=clock.ticks_ms, diff=clock.ticks_diff)
+    table.update(Advertise(mac(0), 0.0, 0.0, False, 0), 0, 0)
+    heard = {}
+    for step in range(300):
+        expired, _ = run_until_quiet(table, clock, clock.t + rnd.randint(0, 4000))
+        for node, at in expired.items():
+            assert at - heard.pop(node) == timeout + 1  # Expires right when it is due, not later.
+        for node in rnd.sample(range(1, 12), 3):
+            table.update(Advertise(mac(node), 0.0, 0.0, False, 0), clock.ticks_ms(), 0)
+            heard[mac(node)] = clock.t
+        assert sorted(table) == sorted([mac(0)] + list(heard))
+    expired, wakeups = run_until_quiet(table, clock, clock.t + 10 * timeout)
+    assert sorted(expired) == sorted(heard) and list(table) == [mac(0)]
+    assert table.next_expiry_ms() is None and wakeups <= 2 * len(heard)
+
+
+def test_quiet_mesh_wakes_once_per_timeout():
+    clock = FakeTicks()
+    table = NeighbourTable(8, 26000, clock=clock.ticks_ms, diff=clock.ticks_diff)
+    wakeups = 0
+    for _ in range(60):  # Two neighbours advertise every 5 s for 5 minutes.
+        for node in (1, 2):
+            table.update(Advertise(mac(node), 0.0, 0.0, False, 0), clock.ticks_ms(), 0)
+        wakeups += run_until_quiet(table, clock, clock.t + 5000)[1]
+    assert len(table) == 2 and wakeups <= 2 * (60 * 5000 // 26000 + 1)
+
+
+def test_digest_follows_membership_and_root_flag():
+    ours, theirs = NeighbourTable(16), NeighbourTable(16)
+    for node in range(1, 11):
+        ours.update(Advertise(mac(node), 0.0, 0.0, node == 3, 0), 0, 0)
+    for node in range(10, 0, -1):  # Other order, other path and generation.
+        theirs.update(Advertise(mac(node), 1.0, -50.0, node == 3, 2, gen=node), 0, 0)
+    assert ours.digest() == theirs.digest() and not ours.differing_buckets(theirs.digest())
+    theirs.update(Advertise(mac(3), 0.0, 0.0, False, 2), 0, 0)
+    theirs.update(Advertise(mac(12), 0.0, 0.0, False, 1), 0, 0)
+    assert ours.differing_buckets(theirs.digest()) == sorted({bucket_of(mac(3)), bucket_of(mac(12))})
+    theirs.remove(mac(12))
+    theirs.update(Advertise(mac(3), 0.0, 0.0, True, 2), 0, 0)
+    assert theirs.digest() == ours.digest()
+    ours.to_forward(1)
+    ours.mark_bucket(bucket_of(mac(2)))
+    ours.heard_forward(ours.slot(mac(2)))  # Asked for by neighbour, sent also when others did.
+    assert sorted(ours.mac(slot) for slot in ours.to_forward(1)) == [mac(2), mac(2 + 8)]
+
+
+def test_tombstone_rejects_stale_copies():
+    clock = FakeTicks()
+    table = NeighbourTable(8, 26000, clock=clock.ticks_ms, diff=clock.ticks_diff, far_timeout_ms=90000)
+    table.update(Advertise(mac(1), 0.0, 0.0, False, 0, gen=0xfffe), clock.ticks_ms(), 0)
+    table.update(Advertise(mac(2), 0.0, 0.0, False, 2, gen=7), clock.ticks_ms(), 0)
+    expired, _ = run_until_quiet(table, clock, clock.t + 30000)
+    assert list(expired) == [mac(1)] and mac(2) in table  # Far record lives longer.
+    assert table.is_stale(mac(1), 0xfffe) and not table.is_stale(mac(1), 1)  # Generation wraps around.
+    assert gen_newer(1, 0xfffe) and not gen_newer(0xfffe, 1)
+    expired, _ = run_until_quiet(table, clock, clock.t + 90000)
+    assert list(expired) == [mac(2)] and not table.is_stale(mac(1), 0xfffe) and table.is_stale(mac(2), 7)
@@ -0,0 +1,67 @@
+from src.utils.messages import UplinkRate, pack_wififrame, decode_wifimessage, traffic_class, TC_CONTROL
+from src.utils.ratelimit import TokenBucket, Aimd, RateControl
+
+
+def test_token_bucket_allows_burst_then_rate():
+    bucket = TokenBucket(rate=10, burst=3, now=0)
+    assert [bucket.take(0) for _ in range(4)] == [True, True, True, False]
+    assert not bucket.take(50)  # Half a token.
+    assert bucket.take(100)
+    taken = sum(bucket.take(t) + bucket.take(t) for t in range(200, 10200, 100))  # Over rate for 10 s.
+    assert taken == 100
+
+
+def test_aimd_decreases_once_per_hold_and_keeps_to_limit():
+    aimd = Aimd(rate=100, min_rate=4, max_rate=120, increase=5, hold_ms=1000)
+    assert aimd.decrease(0) and aimd.rate == 75
+    assert not aimd.decrease(500) and aimd.rate == 75
+    aimd.set_limit(60)  # Parent allows less.
+    assert aimd.rate == 60
+    aimd.increase()
+    assert aimd.rate == 60
+    aimd.set_limit(1000)
+    for _ in range(30):
+        aimd.increase()
+    assert aimd.rate == 120
+    for t in range(1000, 20000, 1000):
+        aimd.decrease(t)
+    assert aimd.rate == 4
+
+
+def test_children_which_send_share_uplink_by_weight():
+    rate = RateControl("me", rate=100, min_rate=4, max_rate=100, increase=5, hold_ms=1000, clock=lambda: 0)
+    rate.set_weights({"a": 3, "b": 1, "c": 1, "me": 1})
+    admitted = {key: 0 for key in ("a", "b")}
+    for t in range(0, 2000, 2):  # Both children send 500 frames/s, c and own application are idle.
+        if t == 1000:
+            assert not rate.tick(False, t)
+            assert rate.active == {"a", "b"} and rate.uplink.rate == 100
+        for key in admitted:
+            if rate.admit(key, t) and t >= 1000:
+                admitted[key] += 1
+    assert (rate.rate_of("a"), rate.rate_of("b"), rate.rate_of("c")) == (75, 25, 20)
+    assert admitted == {"a": 75, "b": 25}  # Buckets were empty, exactly the share for 1 s.
+    rate.set_weights({"a": 1, "me": 1})
+    assert list(rate.buckets) == ["a"]
+
+
+def test_children_are_told_share_when_it_changes():
+    rate = RateControl("me", rate=100, min_rate=4, max_rate=100, increase=5, hold_ms=1000, clock=lambda: 0)
+    rate.set_weights({"a": 1, "b": 1, "me": 1})
+    for key in ("a", "b"):
+        rate.admit(key, 0)
+    rate.tick(False, 0)
+    assert (rate.advertise("a"), rate.advertise("b"), rate.advertise("a")) == (50, 50, None)
+    for key in ("a", "b"):
+        rate.admit(key, 100)
+    assert rate.tick(True, 200)  # Congestion.
+    assert rate.advertise("a") == 37 and rate.buckets["a"].rate == 37.5
+    rate.set_limit(20)  # Parent congested too.
+    assert rate.advertise("a") == 10
+
+
+def test_uplink_rate_is_control_message():
+    frame = pack_wififrame(UplinkRate("aabbccddeeff", "112233445566", 25))
+    msg = decode_wifimessage(frame)
+    assert isinstance(msg, UplinkRate) and msg.packet["msg"] == 25
+    assert traffic_class(frame) == TC_CONTROL
@@ -0,0 +1,96 @@
+import io
+
+import pytest
+
+from src.utils.rejoin import RejoinStore, REJOIN_FIELDS
+
+
+class PowerCut(Exception):
+    pass
+
+
+class MemoryFs:
+    """Flash stand-in, file gets its content on close. Power can be cut after given number of written bytes."""
+
+    def __init__(self):
+        self.files = {}
+        self.writes = 0
+        self.cut_after = None
+
+    def open(self, path, mode):
+        if mode == 'r':
+            if path not in self.files:
+                raise OSError(2)
+            return io.StringIO(self.files[path])
+        fs = self
+
+        class File(io.StringIO):
+            def write(self, s):
+                if fs.cut_after is not None and len(s) > fs.cut_after:
+                    fs.files[path] = s[:fs.cut_after]  # Part of data is on flash, then board is off.
+                    raise PowerCut()
+                return super().write(s)
+
+            def close(self):
+                fs.files[path] = self.getvalue()
+                fs.writes += 1
+                super().close()
+
+        return File()
+
+    def rename(self, old, new):
+        self.files[new] = self.files.pop(old)
+
+    def remove(self, path):
+        if path not in self.files:
+            raise OSError(2)
+        del self.files[path]
+
+
+def state(**changes):
+    saved = {"creds": "61" * 32, "parent": "3c71bfe40001", "ssid": "ESP_E40001", "pwd": "a" * 16,
+             "ap_pwd": "b" * 16, "root": "3c71bfe40000", "term": 3, "version": 12}
+    saved.update(changes)
+    return saved
+
+
+def test_saved_state_is_loaded_after_reset():
+    fs = MemoryFs()
+    assert RejoinStore(fs=fs).load() is None
+    RejoinStore(fs=fs).save(state())
+    assert RejoinStore(fs=fs).load() == state()
+    assert list(fs.files) == ['rejoin.json']
+
+
+def test_power_cut_during_write_keeps_old_state():
+    fs = MemoryFs()
+    store = RejoinStore(fs=fs)
+    store.save(state())
+    fs.cut_after = 20
+    with pytest.raises(PowerCut):
+        store.save(state(parent="3c71bfe40002"))
+    assert RejoinStore(fs=fs).load() == state()
+
+
+def test_broken_or_incomplete_file_is_ignored():
+    fs = MemoryFs()
+    fs.files['rejoin.json'] = '{"creds": "61'
+    assert RejoinStore(fs=fs).load() is None
+    fs.files['rejoin.json'] = '{"creds": "61"}'
+    assert RejoinStore(fs=fs).load() is None
+    fs.files['rejoin.json'] = '[1, 2]'
+    assert RejoinStore(fs=fs).load() is None
+    assert set(state()) == set(REJOIN_FIELDS)
+
+
+def test_same_state_is_not_written_again_and_clear_forgets_it():
+    fs = MemoryFs()
+    store = RejoinStore(fs=fs)
+    assert store.save(state())
+    assert not store.save(state())
+    assert store.save(state(version=13))
+    assert fs.writes == 2
+    store.clear()
+    store.clear()
+    assert fs.files == {}
+    assert RejoinStore(fs=fs).load() is None
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import types
+from collections import deque
+
+from src.utils import net
+from src.utils.hmac import HMACSigner
+from src.utils.messages import Advertise, AskWifiCreds, NeighbourDigest, ObtainCreds, RootElected, Esp_Type, \
+    pack_espmessage, espframe_types
+from src.utils.neighbours import NeighbourTable
+from src.utils.rxpool import RxRing, RxPool, RX_WORKERS
+from tests.source import from_source
+
+KEY = b'hellotheregeneralkenobinobodyex\x00'
+DIGEST_SIZE = 32
+RATE = 10000  # Frames per second.
+DURATION_S = 1.0
+DRIVER_FRAMES = 64  # Buffer of driver (rxbuf), frames over it are lost in driver.
+
+
+def mac(i):
+    return bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i])
+
+
+class FakeESPNow:
+    """esp.espnow.ESPNow stand-in, frames are injected by test into bounded driver buffer."""
+
+    def __init__(self):
+        self.frames = deque()
+        self.lost = 0
+
+    def config(self, *args, **kwargs):
+        return None
+
+    def init(self):
+        return None
+
+    def inject(self, src, frame):
+        if len(self.frames) >= DRIVER_FRAMES:
+            self.lost += 1
+            return
+        self.frames.append((src, frame))
+
+    def irecv(self, timeout_ms=0):
+        if not self.frames:
+            return None, None
+        return self.frames.popleft()
+
+
+def signed(signer, obj, forged=False):
+    body = pack_espmessage(obj)
+    digest = bytes(DIGEST_SIZE) if forged else signer.digest(body)
+    return body + digest
+
+
+def test_ring_keeps_order_and_bounds():
+    ring = RxRing(slots=2, size=8)
+    assert ring.push(mac(1), b'ab') and ring.push(mac(2), b'cde')
+    assert not ring.push(mac(3), b'f')
+    assert not RxRing(slots=1, size=8).push(mac(1), bytes(9))
+    i = ring.pop()
+    assert (bytes(ring.srcs[i]), bytes(ring.views[i][:ring.lens[i]])) == (mac(1), b'ab')
+    ring.release(i)
+    assert ring.push(mac(3), b'f')
+    assert [bytes(ring.srcs[ring.pop()]) for _ in range(2)] == [mac(2), mac(3)]
+    assert ring.pop() is None
+
+
+def test_frame_types_check_length_and_type():
+    signer = HMACSigner(KEY)
+    adv = signed(signer, Advertise(mac(1), 1.0, -60.0, False, 0))
+    ask = signed(signer, AskWifiCreds(mac(2), mac(1)))
+    assert espframe_types(adv, DIGEST_SIZE) == 1 << Esp_Type.ADVERTISE
+    assert espframe_types(adv[:-DIGEST_SIZE] + ask, DIGEST_SIZE) == \
+        (1 << Esp_Type.ADVERTISE) | (1 << Esp_Type.ASK_WIFI_CREDS)
+    assert espframe_types(adv[:-1], DIGEST_SIZE) == 0
+    assert espframe_types(b'\x42' + adv[1:], DIGEST_SIZE) == 0
+    assert espframe_types(adv[:DIGEST_SIZE], DIGEST_SIZE) == 0
+
+
+def test_flood_of_10k_frames_per_second_is_bounded(monkeypatch):
+    driver = FakeESPNow()
+    monkeypatch.setattr(net, "espnow", types.SimpleNamespace(ESPNow=lambda: driver))
+    esp = net.ESP()
+    signer = HMACSigner(KEY)
+    known = {mac(i) for i in range(1, 5)}
+    kinds = [
+        (mac(1), signed(signer, Advertise(mac(1), 1.0, -60.0, False, 0)), "ok"),
+        (mac(2), signed(signer, AskWifiCreds(mac(3), mac(2))), "ok"),
+        (mac(9), signed(signer, AskWifiCreds(mac(3), mac(9))), "filtered"),  # Unknown source.
+        (mac(1), b'\x42' + bytes(60), "filtered"),  # Unknown type.
+        (mac(2), signed(signer, Advertise(mac(2), 1.0, -60.0, False, 0))[:-5], "filtered"),  # Cut.
+        (mac(8), signed(signer, Advertise(mac(8), 1.0, -60.0, False, 0), forged=True), "forged"),  # Replay storm.
+    ]
+    counts = {"ok": 0, "forged": 0}
+
+    def accept(src, frame):
+        frame_types = espframe_types(frame, DIGEST_SIZE)
+        return bool(frame_types) and (frame_types & (1 << Esp_Type.ADVERTISE) or bytes(src) in known)
+
+    async def handle(src, frame):
+        end = len(frame) - DIGEST_SIZE
+        counts["ok" if signer.verify(frame[:end], frame, end) else "forged"] += 1
+        await asyncio.sleep(0)
+
+    async def scenario():
+        pool = RxPool(esp.irecv, accept, handle)
+        pool.start(asyncio.get_running_loop())
+        injected = {"ok": 0, "filtered": 0, "forged": 0}
+        peak = 0
+        start = time.monotonic()
+        sent = 0
+        while time.monotonic() - start < DURATION_S:
+            due = int((time.monotonic() - start) * RATE)
+            for i in range(sent, due):
+                src, frame, kind = kinds[i % len(kinds)]
+                driver.inject(src, frame)
+                injected[kind] += 1
+            sent = due
+            peak = max(peak, len(asyncio.all_tasks()))
+            await asyncio.sleep(0.001)
+        while driver.frames or len(pool.ring):
+            await asyncio.sleep(0.01)
+        return pool, sent, peak
+
+    pool, sent, peak = asyncio.run(scenario())
+    assert sent >= 0.9 * RATE * DURATION_S
+    assert pool.received + driver.lost == sent
+    assert pool.handled + pool.dropped + pool.filtered == pool.received
+    assert pool.handled == counts["ok"] + counts["forged"] and pool.errors == 0
+    assert pool.filtered >= pool.received // 2 - len(kinds)  # Half of kinds never get to HMAC.
+    assert pool.handled > 0 and counts["ok"] > 0
+    assert peak <= RX_WORKERS + 2  # Workers, receiver and test itself, no task per frame.
+
+
+class Core:
+    """EspNowCore with only what accept_frame needs."""
+    OPEN_FRAME, DIGEST_SIZE, accept_frame = from_source(
+        "src/espnowcore.py", ["OPEN_FRAME", "DIGEST_SIZE", "EspNowCore.accept_frame"],
+        {"const": lambda value: value, "Esp_Type": Esp_Type, "espframe_types": espframe_types})
+
+    def __init__(self, known):
+        self.neighbours = NeighbourTable()
+        for src in known:
+            self.neighbours.update(Advertise(src, 1.0, -60.0, False, 0), 0, 0)
+        self.in_mps = False
+
+
+def test_accept_frame_of_espnowcore():
+    core = Core([mac(1)])
+    unknown = mac(9)
+    advertise = pack_espmessage(Advertise(unknown, 1.0, -60.0, False, 0))
+    digest = pack_espmessage(NeighbourDigest(unknown, bytes(32)))
+    hmac = bytes(DIGEST_SIZE)
+    assert core.accept_frame(unknown, advertise + digest + hmac)  # Aggregated frame of node not known yet.
+    assert core.accept_frame(unknown, pack_espmessage(RootElected(unknown, 1.0, -60.0, True, 0)) + hmac)
+    assert not core.accept_frame(unknown, digest + hmac)
+    assert core.accept_frame(mac(1), pack_espmessage(NeighbourDigest(mac(1), bytes(32))) + hmac)
+    assert not core.accept_frame(unknown, advertise + digest[:-1] + hmac)  # Sizes don't add up.
+    creds = pack_espmessage(ObtainCreds(ObtainCreds.RESPOND, unknown)) + hmac
+    assert not core.accept_frame(unknown, creds)
+    core.in_mps = True
+    assert core.accept_frame(unknown, creds)  # Only during Mesh Protected Setup.
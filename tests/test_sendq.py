@@ -0,0 +1,130 @@
+import asyncio
+
+from src.utils.messages import AppMessage, TopologyPropagate, pack_wififrame, TC_CONTROL, TC_APP, PARENT
+from src.utils.sendq import SendQueue, DROP, BLOCK
+from tests.source import Relay
+
+
+class FakeWriter:
+    """StreamWriter whose drain takes delay seconds, or fails."""
+
+    def __init__(self, delay=0.01, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.writes = []
+
+    def write(self, data):
+        if self.fail:
+            raise OSError(104)
+        self.writes.append(bytes(data))
+
+    async def drain(self):
+        await asyncio.sleep(self.delay)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_frames_queued_during_drain_are_one_write_control_first():
+    async def scenario():
+        writer = FakeWriter()
+        queue = SendQueue(writer)
+        task = asyncio.create_task(queue.run())
+        queue.put_nowait(b'a1')
+        await asyncio.sleep(0)  # First frame is being drained.
+        for data, prio in ((b'a2', TC_APP), (b'a3', TC_APP), (b'c1', TC_CONTROL)):
+            queue.put_nowait(data, prio)
+        await asyncio.sleep(0.05)
+        queue.close()
+        assert await task
+        return writer.writes, queue
+
+    writes, queue = run(scenario())
+    assert writes == [b'a1', b'c1a2a3']
+    assert (queue.sent, queue.writes, queue.dropped) == (4, 2, 0)
+
+
+def test_write_is_limited_by_max_write():
+    queue = SendQueue(FakeWriter(), max_write=5)
+    for data in (b'aa', b'bb', b'cc', b'dddddddd'):
+        queue.put_nowait(data)
+    assert queue._take() == [b'aa', b'bb']
+    assert queue._take() == [b'cc']
+    assert queue._take() == [b'dddddddd']  # Bigger than max_write, alone.
+    assert len(queue) == 0
+
+
+def test_full_queue_drops_new_frame_control_pushes_out_app():
+    queue = SendQueue(FakeWriter(), capacity=2, policy=DROP)
+    assert queue.put_nowait(b'a1') and queue.put_nowait(b'a2')
+    assert not queue.put_nowait(b'a3')
+    assert queue.put_nowait(b'c1', TC_CONTROL) and queue.put_nowait(b'c2', TC_CONTROL)
+    assert not queue.put_nowait(b'c3', TC_CONTROL)
+    assert queue.control == [b'c1', b'c2'] and not queue.flows
+    assert queue.dropped == 4
+
+
+def test_app_sources_share_link_by_weight():
+    queue = SendQueue(FakeWriter(), capacity=64, max_write=1, weights={"b": 2})
+    for i in range(20):
+        queue.put_nowait(b'A%02d' % i, TC_APP, "a")  # Greedy source came first.
+    for i in range(4):
+        queue.put_nowait(b'B%02d' % i, TC_APP, "b")
+        queue.put_nowait(b'C%02d' % i, TC_APP, "c")
+    order = b''.join(queue._take()[0][:1] for _ in range(12))
+    assert order == b'BABCBABCACAC'  # Finish times: b 1.5, 3, 4.5, 6 (double weight), a and c 3, 6, 9, 12.
+
+
+def test_greedy_flow_loses_frames_when_full():
+    queue = SendQueue(FakeWriter(), capacity=4)
+    for i in range(4):
+        assert queue.put_nowait(bytes([i]), TC_APP, "a")
+    assert not queue.put_nowait(b'x', TC_APP, "a")
+    assert queue.put_nowait(b'b', TC_APP, "b")  # Takes place of the last frame of a.
+    assert [len(frames) for frames in queue.flows.values()] == [3, 1]
+
+
+def test_block_policy_waits_for_space():
+    async def scenario():
+        writer = FakeWriter(delay=0.02)
+        queue = SendQueue(writer, capacity=1, policy=BLOCK)
+        task = asyncio.create_task(queue.run())
+        for i in range(4):
+            assert await queue.put(bytes([i]))
+            assert len(queue) <= 1
+        await asyncio.sleep(0.1)
+        queue.close()
+        await task
+        return b''.join(writer.writes), queue.dropped
+
+    assert run(scenario()) == (bytes(range(4)), 0)
+
+
+def test_failed_write_closes_queue_and_releases_blocked_senders():
+    async def scenario():
+        queue = SendQueue(FakeWriter(fail=True), capacity=1, policy=BLOCK)
+        queue.put_nowait(b'a1')
+        blocked = asyncio.create_task(queue.put(b'a2'))
+        assert not await queue.run()
+        return queue, await blocked
+
+    queue, put = run(scenario())
+    assert isinstance(queue.error, OSError) and queue.closed and not put
+
+
+def test_full_downstream_link_does_not_stop_reading_of_relay():
+    async def scenario():
+        relay = Relay(FakeWriter(delay=3600), (2, BLOCK))  # Parent link does not drain.
+        reader = asyncio.StreamReader()
+        for i in range(5):
+            reader.feed_data(pack_wififrame(AppMessage("010203040506", "0a0b0c0d0e0f", {"blink": [i, 1, 2]})))
+        reader.feed_data(pack_wififrame(TopologyPropagate("010203040506", PARENT, None)))
+        reader.feed_eof()
+        await asyncio.wait_for(relay.on_message(reader, "010203040506", relay), 1)
+        queue = relay.send_queues[relay.parent_writer]
+        queue.close()
+        return relay.received, queue.dropped
+
+    received, dropped = run(scenario())
+    assert len(received) == 1 and dropped == 3  # Frames over capacity dropped, TopologyPropagate read after them.
@@ -0,0 +1,145 @@
+import asyncio
+import types
+
+from src.utils import net
+from src.utils.deadlines import ticks_ms
+from src.utils.links import LinkTable
+from src.utils.messages import Advertise
+from src.utils.neighbours import NeighbourTable
+from src.utils.standby import Standby, best_parent, node_id
+from src.utils.tree import Tree, TreeNode, TOPOLOGY_ADD
+
+ASSOC_S = 0.05
+HEALTH_MS = 15000
+
+
+def mac(i):
+    return bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i])
+
+
+class Air:
+    """APs which are up, by SSID with password."""
+
+    def __init__(self):
+        self.aps = {}
+
+
+class FakeWLAN:
+    """network.WLAN stand-in, station associates ASSOC_S after connect() when AP is up."""
+
+    def __init__(self, air, mode):
+        self.air = air
+        self.mode = mode
+        self.ap = None
+        self._pending = None
+
+    def active(self, *args):
+        return True
+
+    def config(self, *args, **kwargs):
+        return None
+
+    def connect(self, ssid, password):
+        if self.air.aps.get(ssid) == password:
+            self._pending = asyncio.get_running_loop().call_later(ASSOC_S, self._associated, ssid)
+
+    def _associated(self, ssid):
+        if ssid in self.air.aps:
+            self.ap = ssid
+
+    def disconnect(self):
+        if self._pending:
+            self._pending.cancel()
+        self.ap = None
+
+    def isconnected(self):
+        return self.ap is not None and self.ap in self.air.aps
+
+    def ifconfig(self):
+        return '192.168.4.2', '255.255.255.0', '192.168.4.1', '192.168.4.1'
+
+
+def fake_network(air):
+    return types.SimpleNamespace(WLAN=lambda mode: FakeWLAN(air, mode), STA_IF=0, AP_IF=1)
+
+
+def mesh():
+    """Root 0 with 1 (parent of own node 3, which has child 4) and 2 (with child 5), 6 is not in tree."""
+    tree = Tree(node_id(mac(3)))
+    tree.root = TreeNode(node_id(mac(0)), None)
+    for node, parent in ((1, 0), (2, 0), (3, 1), (4, 3), (5, 2)):
+        tree.change(TOPOLOGY_ADD, node_id(mac(node)), node_id(mac(parent)))
+    table = NeighbourTable(8, own=mac(3))
+    links = LinkTable(8)
+    for i, rssi in ((1, -60), (2, -80), (4, -40), (5, -50), (6, -30)):
+        table.update(Advertise(mac(i), 0.0, 0.0, True, 0), 0, 0)
+        links.sample(mac(i), rssi)
+    return tree, table, links
+
+
+def test_backup_is_the_closest_to_root_outside_of_lost_subtree():
+    tree, table, links = mesh()
+    own, parent = node_id(mac(3)), node_id(mac(1))
+    assert best_parent(tree, table, links, (parent, own)) == mac(2)
+    assert best_parent(tree, table, links, (parent, own), skip={mac(2)}) == mac(5)
+    table.update(Advertise(mac(2), 0.0, 0.0, False, 0), 0, 0)  # Lost its place in tree meanwhile.
+    assert best_parent(tree, table, links, (parent, own)) == mac(5)
+    assert best_parent(None, table, links, (parent, own)) is None
+
+
+def test_backup_which_does_not_answer_is_replaced():
+    tree, table, links = mesh()
+    own, parent = node_id(mac(3)), node_id(mac(1))
+    standby = Standby(HEALTH_MS)
+    assert standby.update(tree, table, links, own, parent, 0) == mac(2)
+    assert standby.ready(tree, parent, own, 1000) is None
+    assert standby.update(tree, table, links, own, parent, HEALTH_MS) == mac(5)  # 2 has no free slot.
+    assert not standby.on_creds(mac(2), "ESP_E40002", "p2", HEALTH_MS + 5)  # Late answer of previous backup.
+    assert standby.ready(tree, parent, own, HEALTH_MS + 5) is None
+    assert standby.on_creds(mac(5), "ESP_E40005", "p5", HEALTH_MS + 10)
+    assert standby.ready(tree, parent, own, HEALTH_MS + 20) == ("ESP_E40005", "p5")
+    assert standby.ready(tree, node_id(mac(2)), own, HEALTH_MS + 20) is None  # Backup is below lost node.
+    assert standby.ready(tree, parent, own, 2 * HEALTH_MS + 10) is None  # Not answered for too long.
+
+
+def run_failover(monkeypatch, backup_fails):
+    air = Air()
+    air.aps.update({"ESP_E40001": "p1", "ESP_E40002": "p2"})
+    monkeypatch.setattr(net, "network", fake_network(air))
+    tree, table, links = mesh()
+    own, parent = node_id(mac(3)), node_id(mac(1))
+    standby = Standby(HEALTH_MS)
+    opened = []
+
+    async def open_socket():
+        opened.append(sta.wlan.ap)
+
+    async def scenario():
+        await sta.do_connect("ESP_E40001", "p1")
+        standby.update(tree, table, links, own, parent, ticks_ms())
+        standby.on_creds(mac(2), "ESP_E40002", "p2", ticks_ms())
+        del air.aps["ESP_E40001"]  # Parent fails.
+        if backup_fails:
+            del air.aps["ESP_E40002"]
+        assert not sta.isconnected()
+        lost = ticks_ms()
+        creds = standby.ready(tree, parent, own, lost)
+        assert creds == ("ESP_E40002", "p2")
+        return await standby.switch(sta, open_socket, 0.5, lost, creds)
+
+    sta = net.Net(0)
+    return asyncio.run(scenario()), standby, sta, opened
+
+
+def test_switch_to_backup_is_one_association_and_socket(monkeypatch):
+    switched, standby, sta, opened = run_failover(monkeypatch, backup_fails=False)
+    assert switched and opened == ["ESP_E40002"] and sta.isconnected()
+    assert 1000 * ASSOC_S <= standby.switch_ms < 1000 * ASSOC_S + 200
+    assert (standby.switches, standby.backup_switches) == (1, 1)
+    assert standby.mac is None  # Next backup is chosen under the new parent.
+
+
+def test_failed_backup_leaves_switch_to_full_search(monkeypatch):
+    switched, standby, sta, opened = run_failover(monkeypatch, backup_fails=True)
+    assert not switched and opened == [] and not sta.isconnected()
+    assert standby.switches == 0 and standby.switch_ms is None
@@ -0,0 +1,219 @@
+import random
+
+from src.utils.tree import Tree, TreeNode, get_level, json_to_tree, CHANGES_KEPT, TOPOLOGY_ADD, TOPOLOGY_DEL, \
+    TOPOLOGY_MOVE
+
+
+def root_tree():
+    tree = Tree()
+    tree.root = TreeNode("a", None)
+    tree.version = 1
+    tree.rehash()
+    return tree
+
+
+def test_hash_does_not_depend_on_order_of_changes():
+    one, two = root_tree(), root_tree()
+    for node, parent in (("b", "a"), ("c", "a"), ("d", "b")):
+        one.change(TOPOLOGY_ADD, node, parent)
+    for node, parent in (("c", "a"), ("b", "a"), ("d", "b"), ("e", "d")):
+        two.change(TOPOLOGY_ADD, node, parent)
+    two.change(TOPOLOGY_DEL, "e")
+    assert one.hash == two.hash
+    rebuilt = Tree()
+    rebuilt.load(one.pack(), one.version)
+    assert rebuilt.hash == one.hash
+
+
+def test_up_to_date_child_gets_only_version_and_hash():
+    root = root_tree()
+    root.change(TOPOLOGY_ADD, "b", "a")
+    child = Tree()
+    assert child.apply_update(root.update_for(0))
+    assert root.update_for(child.version) == {"v": root.version, "h": root.hash}
+
+
+def test_child_behind_gets_delta_and_removal_takes_subtree():
+    root = root_tree()
+    root.change(TOPOLOGY_ADD, "b", "a")
+    child = Tree()
+    child.apply_update(root.update_for(0))
+    root.change(TOPOLOGY_ADD, "c", "b")
+    root.change(TOPOLOGY_ADD, "d", "c")
+    root.change(TOPOLOGY_DEL, "c")
+    update = root.update_for(child.version)
+    assert "t" not in update and len(update["d"]) == 3
+    assert child.apply_update(update)
+    assert child.search("d") is None and child.pack() == root.pack()
+
+
+def test_snapshot_when_changes_are_no_longer_kept():
+    root = root_tree()
+    child = Tree()
+    child.apply_update(root.update_for(0))
+    for i in range(CHANGES_KEPT + 1):
+        root.change(TOPOLOGY_ADD, "n%d" % i, "a")
+    update = root.update_for(child.version)
+    assert "t" in update
+    assert child.apply_update(update)
+
+
+def test_gap_in_changes_is_detected():
+    root = root_tree()
+    child = Tree()
+    child.apply_update(root.update_for(0))
+    root.change(TOPOLOGY_ADD, "b", "a")
+    root.change(TOPOLOGY_ADD, "c", "a")
+    update = root.update_for(child.version)
+    update["d"] = update["d"][1:]
+    assert not child.apply_update(update)
+
+
+def assert_index_consistent(tree):
+    nodes = [tree.root] + tree.root.get_nodes()
+    assert len(tree) == len(nodes)
+    for node in nodes:
+        assert tree.index[node.data] is node and node.tree is tree
+        assert node.depth == (node.parent.depth + 1 if node.parent else 0)
+
+
+def test_index_and_depth_follow_changes():
+    tree = root_tree()
+    for node, parent in (("b", "a"), ("c", "a"), ("d", "b"), ("e", "d")):
+        tree.change(TOPOLOGY_ADD, node, parent)
+    assert get_level(tree.search("e")) == 3
+    assert tree.search("e", tree.search("b")) is not None
+    assert tree.search("e", tree.search("c")) is None
+    assert_index_consistent(tree)
+    tree.change(TOPOLOGY_DEL, "d")
+    assert tree.search("d") is None and tree.search("e") is None
+    assert_index_consistent(tree)
+    assert not tree.del_node("unknown")
+
+
+def test_moved_subtree_gets_new_depths():
+    tree = root_tree()
+    for node, parent in (("b", "a"), ("c", "b"), ("d", "c")):
+        tree.change(TOPOLOGY_ADD, node, parent)
+    c = tree.search("c")
+    tree.search("b").del_child(c)
+    assert tree.search("d") is None and c.tree is None
+    tree.root.add_child(c)
+    assert get_level(tree.search("d")) == 2
+    assert_index_consistent(tree)
+
+
+def test_subtree_moves_in_one_change_even_after_its_parent_was_deleted():
+    root = root_tree()
+    for node, parent in (("b", "a"), ("c", "a"), ("x", "b"), ("o", "x"), ("p", "o"), ("q", "p")):
+        root.change(TOPOLOGY_ADD, node, parent)
+    child = Tree()
+    child.apply_update(root.update_for(0))
+    edges = root.edges_below("o")
+    assert sorted(zip(edges[::2], edges[1::2])) == [("p", "o"), ("q", "p")]
+    assert not root.change(TOPOLOGY_MOVE, "o", "q", edges)  # Under own descendant.
+    assert not root.change(TOPOLOGY_MOVE, "o", "x", edges)  # Already there.
+    root.change(TOPOLOGY_DEL, "x")  # Old parent reported dead first, whole subtree is gone.
+    assert root.search("q") is None
+    assert root.change(TOPOLOGY_MOVE, "o", "c", edges)
+    assert root.search("o").parent.data == "c" and get_level(root.search("q")) == 4
+    assert_index_consistent(root)
+    update = root.update_for(child.version)
+    assert "d" in update and child.apply_update(update)
+    assert child.pack() == root.pack()
+    moved = root.version
+    assert root.change(TOPOLOGY_MOVE, "o", "b", root.edges_below("o"))  # Move of subtree which is in tree.
+    assert root.version == moved + 1 and root.search("o").parent.data == "b"
+
+
+def test_index_after_json_to_tree():
+    tree = root_tree()
+    for node, parent in (("b", "a"), ("c", "b")):
+        tree.change(TOPOLOGY_ADD, node, parent)
+    rebuilt = Tree()
+    json_to_tree(tree.pack(), rebuilt, None)
+    assert rebuilt.root.data == "a" and get_level(rebuilt.search("c")) == 2
+    assert "ROOT" not in rebuilt.index
+    assert_index_consistent(rebuilt)
+
+
+def oracle_routes(tree, local_id):
+    """Brute force, for every node walk up to local node."""
+    routes = {}
+    for node in [tree.root] + tree.root.get_nodes():
+        hop = node
+        while hop.parent is not None and hop.parent.data != local_id:
+            hop = hop.parent
+        if hop.parent is not None:
+            routes[node.data] = hop.data
+    return routes
+
+
+def test_routes_match_oracle_on_random_mutations():
+    rnd = random.Random(9)
+    for local_id in ("a", "n3", "n40"):
+        tree = root_tree()
+        tree.set_local(local_id)
+        ids = ["a"]
+        for step in range(600):
+            op = rnd.random()
+            if op < 0.6 or len(ids) < 3:
+                node_id = "n%d" % step
+                if tree.change(TOPOLOGY_ADD, node_id, rnd.choice(ids)):
+                    ids.append(node_id)
+            elif op < 0.85:
+                tree.change(TOPOLOGY_DEL, rnd.choice(ids[1:]))
+                ids = list(tree.index)
+            else:  # Subtree moves under another parent.
+                node = tree.search(rnd.choice(ids[1:]))
+                parent = tree.search(rnd.choice(ids))
+                if tree.search(parent.data, node) is None:
+                    node.parent.del_child(node)
+                    parent.add_child(node)
+            assert tree.routes == oracle_routes(tree, local_id)
+        snapshot = Tree(local_id)
+        snapshot.load(tree.pack(), tree.version)
+        assert snapshot.routes == tree.routes
+        assert all(snapshot.next_hop(n) == h for n, h in tree.routes.items())
+
+
+def mac_tree(count, chain=False):
+    ids = ["3c71bfe4%04x" % i for i in range(count)]
+    tree = Tree(ids[0])
+    tree.root = TreeNode(ids[0], None)
+    tree.version = 1
+    tree.rehash()
+    for i in range(1, count):
+        tree.change(TOPOLOGY_ADD, ids[i], ids[i - 1] if chain else ids[(i - 1) // 2])
+    return tree
+
+
+def test_flat_snapshot_round_trip():
+    tree = mac_tree(50)
+    blob = tree.encode()
+    assert len(blob) == 2 + 8 * 50
+    copy = Tree(tree.root.data)
+    copy.load(bytes(blob), tree.version)
+    assert copy.hash == tree.hash and copy.encode() == blob
+    assert copy.routes == tree.routes
+    assert_index_consistent(copy)
+
+
+def test_flat_snapshot_of_deep_chain():
+    tree = mac_tree(3000, chain=True)
+    copy = Tree()
+    copy.load(tree.encode(), tree.version)
+    assert get_level(copy.search("3c71bfe40bb7")) == 2999 and copy.hash == tree.hash
+
+
+def test_update_sends_flat_snapshot_and_rejects_broken_one():
+    root = mac_tree(10)
+    child = Tree()
+    update = root.update_for(0)
+    assert isinstance(update["t"], bytearray)
+    assert child.apply_update(update)
+    broken = bytearray(update["t"])
+    broken[-2:] = b'\x00\x09'  # Last node is its own parent, so it can't be reached from the root.
+    other = mac_tree(3)
+    assert not other.apply_update({"v": 2, "h": 0, "t": broken})
+    assert len(other) == 3
@@ -0,0 +1,44 @@
+from src.utils.messages import Advertise
+from src.utils.neighbours import NeighbourTable
+from src.utils.trickle import Trickle
+
+
+def diff(a, b):
+    return a - b
+
+
+def fire_times(trickle, start, end):
+    """Times when poll() reports transmission point, driven by wait_ms() as in EspNowCore.advertise."""
+    now, fired = start, []
+    while now < end:
+        if trickle.poll(now):
+            fired.append(now)
+        now += trickle.wait_ms(now)
+    return fired
+
+
+def test_interval_doubles_up_to_imax_and_resets():
+    trickle = Trickle(1000, 3, diff=diff)
+    trickle.start(0)
+    fired = fire_times(trickle, 0, 60000)
+    assert 500 <= fired[0] < 1000 and 1000 + 1000 <= fired[1] < 1000 + 2000
+    assert trickle.interval == 8000
+    gaps = [b - a for a, b in zip(fired[4:], fired[5:])]
+    assert all(4000 < gap < 12000 for gap in gaps)
+    assert trickle.inconsistent(60000) and not trickle.inconsistent(60100)
+    assert 60500 <= fire_times(trickle, 60000, 61000)[0] < 61000
+
+
+def test_forward_is_suppressed_when_others_forwarded_record():
+    own, other, third = (bytes([0x3c, 0x71, 0xbf, 0xe4, 0, i]) for i in range(3))
+    table = NeighbourTable(4, own=own)
+    table.update(Advertise(own, 0.0, 0.0, False, 0), 0, 0)
+    for mac in (other, third):
+        table.update(Advertise(mac, 0.0, 0.0, False, 0), 10, 0)
+    table.heard_forward(table.slot(third))
+    assert [table.mac(slot) for slot in table.to_forward(1)] == [other]
+    assert table.to_forward(1) == []  # Nothing changed since.
+    table.update(Advertise(third, 0.0, 0.0, False, 0), 20, 0)
+    assert table.to_forward(1) == []  # Heard again, but nothing changed.
+    table.update(Advertise(third, 0.0, 0.0, False, 0, 1), 30, 0)
+    assert [table.mac(slot) for slot in table.to_forward(1)] == [third]
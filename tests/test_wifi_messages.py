@@ -0,0 +1,91 @@
+import asyncio
+
+from src.utils import binpack
+from src.utils.messages import AppMessage, TopologyPropagate, TopologyChanged, PARENT, WIFI_HEADER_SIZE, \
+    WIFI_TTL_OFFSET, pack_wifimessage, pack_wififrame, decode_wifimessage, decrement_ttl, read_wifimessage, frame_dst
+
+SRC = "3c71bfe48b89"
+DST = "3c71bfe48ba1"
+
+
+def test_binpack_roundtrip():
+    values = [None, True, False, 0, 127, -32, -33, 128, 70000, -70000, 2 ** 40, 1.5, "", "a" * 31, "b" * 40,
+              "c" * 300, b"\x00\x01", [], [1, [2, [3]]], list(range(20)), {"blink": [10, 20, 30]},
+              {str(i): i for i in range(20)}]
+    for value in values:
+        assert binpack.loads(binpack.dumps(value)) == value
+    assert binpack.loads(memoryview(b"\x00" + binpack.dumps({"a": 1})), 1) == {"a": 1}
+
+
+def test_frame_roundtrip_and_json_fallback():
+    topology = {"node": SRC, "child": [{"node": DST, "child": []}]}
+    for obj in (AppMessage(SRC, "ffffffffffff", {"blink": [1, 2, 3]}), TopologyPropagate(SRC, PARENT, None),
+                TopologyChanged(SRC, DST, {"changed_mac": DST, "new_topology": topology})):
+        frame = pack_wififrame(obj)
+        assert len(frame) < len(pack_wifimessage(obj))
+        assert decode_wifimessage(frame).packet == obj.packet
+        assert decode_wifimessage(pack_wifimessage(obj)).packet == obj.packet
+
+
+def test_decrement_ttl():
+    frame = pack_wififrame(AppMessage(SRC, DST, None), ttl=2)
+    assert decrement_ttl(frame)
+    assert frame[WIFI_TTL_OFFSET] == 1
+    assert not decrement_ttl(frame)
+    assert decrement_ttl(pack_wifimessage(AppMessage(SRC, DST, None)).encode())  # JSON has no ttl.
+
+
+def test_read_mixed_stream_with_small_buffer():
+    big = AppMessage(SRC, DST, {"data": "x" * 200})
+    small = AppMessage(SRC, DST, {"blink": [1, 2, 3]})
+    line = '{}\n'.format(pack_wifimessage(small)).encode()
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(bytes(pack_wififrame(small)) + line + bytes(pack_wififrame(big)))
+        reader.feed_eof()
+        buf = bytearray(WIFI_HEADER_SIZE + 32)
+        out = []
+        while True:
+            msg = await read_wifimessage(reader, buf)
+            if not msg:
+                return out
+            out.append(decode_wifimessage(bytes(msg)).packet)
+
+    assert asyncio.run(read_all()) == [small.packet, small.packet, big.packet]
+
+
+class ChunkReader:
+    """Stream of MicroPython with readinto, which returns at most 5 bytes at once."""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def readinto(self, view):
+        n = min(5, len(view), len(self.data))
+        view[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def test_read_by_readinto_in_short_chunks():
+    big = AppMessage(SRC, DST, {"data": "x" * 200})
+    small = AppMessage(SRC, DST, {"blink": [1, 2, 3]})
+
+    async def read_all():
+        reader = ChunkReader(bytes(pack_wififrame(small)) + bytes(pack_wififrame(big)))
+        buf = bytearray(WIFI_HEADER_SIZE + 32)
+        out = []
+        while True:
+            msg = await read_wifimessage(reader, buf)
+            if not msg:
+                return out
+            out.append(decode_wifimessage(bytes(msg)).packet)
+
+    assert asyncio.run(read_all()) == [small.packet, big.packet]
+
+
+def test_frame_dst_from_header():
+    frame = pack_wififrame(AppMessage(SRC, DST, {"blink": [1, 2, 3]}))
+    assert frame_dst(memoryview(frame)) == DST
+    assert frame_dst(pack_wififrame(TopologyPropagate(SRC, PARENT, None))) == PARENT